@@ -0,0 +1,69 @@
+from amaranth import *
+from amaranth.build import Platform
+
+
+class Gearbox(Elaboratable):
+    """10:4 gearbox from the pixel domain to the shift domain.
+
+    Feeds 4-bit ODDRX2F serializers, so the shift domain runs at 2.5 times
+    the pixel clock instead of 5 times (DDR) or 10 times (SDR). Bits are sent
+    lsb first, o_data[n][0] first.
+
+    Two pixel words are written alternately into two slots, and every 5
+    shift clocks both slots are read at once, while neither of them can
+    change. The read phase is found once after reset from the slot select
+    signal, as the phase of the shift clock (from CLKDIVF) against the
+    pixel clock is not known in advance.
+    """
+    def __init__(self, channels=4):
+        self.i_data = [Signal(10, name="i_data{}".format(n)) for n in range(channels)]
+        self.o_data = [Signal(4, name="o_data{}".format(n)) for n in range(channels)]
+        self.o_locked = Signal()
+        # Configuration
+        self.channels = channels
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        # Pixel domain: slot select and the two slots per channel
+        R_select = Signal()
+        slots = [[Signal(10, name="slot{}_{}".format(n, i)) for i in range(2)] for n in range(self.channels)]
+
+        m.d.pixel += R_select.eq(~R_select)
+        for n in range(self.channels):
+            with m.If(R_select):
+                m.d.pixel += slots[n][1].eq(self.i_data[n])
+            with m.Else():
+                m.d.pixel += slots[n][0].eq(self.i_data[n])
+
+        # Shift domain: phase 0..4, both slots are loaded in phase 0
+        R_phase     = Signal(range(5))
+        R_select_s  = Signal(2)
+        R_locked    = Signal()
+        buffers     = [Signal(20, name="buffer{}".format(n)) for n in range(self.channels)]
+
+        m.d.shift += R_select_s.eq(Cat(R_select, R_select_s[0]))
+
+        # Slot 1 is written half a pixel after slot 0, a falling edge of the
+        # select signal is sampled just after the write to slot 1. The
+        # sample was taken one shift clock ago, so that was the read phase.
+        with m.If(~R_locked & (R_select_s == 0b10)):
+            m.d.shift += [
+                R_phase.eq(2),
+                R_locked.eq(1),
+            ]
+        with m.Elif(R_phase == 4):
+            m.d.shift += R_phase.eq(0)
+        with m.Else():
+            m.d.shift += R_phase.eq(R_phase + 1)
+
+        for n in range(self.channels):
+            with m.If(R_phase == 0):
+                m.d.shift += buffers[n].eq(Cat(slots[n][0], slots[n][1]))
+            with m.Else():
+                m.d.shift += buffers[n].eq(buffers[n][4:])
+            m.d.comb += self.o_data[n].eq(buffers[n][:4])
+
+        m.d.comb += self.o_locked.eq(R_locked)
+
+        return m
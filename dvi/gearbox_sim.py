@@ -0,0 +1,188 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.lib.cdc import ResetSynchronizer
+from amaranth.sim import Simulator
+
+from gearbox import Gearbox
+from vga2dvid import VGA2DVID
+from tmds import decode
+
+# Simulation of the 10:4 gearbox with the shift clock at 2.5 times the
+# pixel clock, for a number of phases between the two clocks.
+#
+# Random 10-bit words are written in the pixel domain and the 4-bit
+# outputs are collected in the shift domain once the gearbox has locked.
+# The serial bit stream must contain all the words, in order.
+#
+# Then VGA2DVID(ddr="gearbox") is simulated the same way, with its shift
+# domain held in reset by a ResetSynchronizer for a while, as top_vgatest
+# does until the PLL locks. Random pixels, with blanking and syncs, go in.
+# The 4-bit outputs are cut into 10-bit symbols where the clock channel
+# has its 0b0000011111 pattern, and the TMDS symbols decoded must give the
+# pixels and syncs sent, in order.
+#
+#   python gearbox_sim.py
+#   python gearbox_sim.py --phases 0 0.3 0.7
+
+PIXEL_PERIOD = 10e-9
+SHIFT_PERIOD = PIXEL_PERIOD / 2.5
+
+
+def simulate(words, phase):
+    dut = Gearbox(channels=1)
+    bits = []
+
+    sim = Simulator(dut)
+    sim.add_clock(PIXEL_PERIOD, domain="pixel")
+    sim.add_clock(SHIFT_PERIOD, phase=phase * SHIFT_PERIOD, domain="shift")
+
+    def pixel():
+        for word in words:
+            yield dut.i_data[0].eq(int(word))
+            yield
+
+    def shift():
+        for _ in range(int(len(words) * 2.5)):
+            yield
+            if (yield dut.o_locked):
+                data = yield dut.o_data[0]
+                bits.extend((data >> i) & 1 for i in range(4))
+
+    sim.add_sync_process(pixel, domain="pixel")
+    sim.add_sync_process(shift, domain="shift")
+    sim.run()
+
+    return np.array(bits, dtype=np.uint8)
+
+
+class DvidGearbox(Elaboratable):
+    """VGA2DVID with the gearbox, and the reset of its shift domain"""
+    def __init__(self):
+        self.i_rst = Signal(reset=1)
+        self.dvid = VGA2DVID(ddr="gearbox")
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.dvid = self.dvid
+        m.submodules.shift_rst = ResetSynchronizer(self.i_rst, domain="shift")
+
+        return m
+
+
+def pixels(rng, n):
+    """Random pixels (red, green, blue, blank, hsync, vsync), with 4 blanking
+    pixels every 16"""
+    result = []
+    for i in range(n):
+        if i % 16 < 4:
+            result.append((0, 0, 0, 1, int(rng.integers(2)), int(rng.integers(2))))
+        else:
+            result.append(tuple(int(v) for v in rng.integers(0, 256, 3)) + (0, 0, 0))
+    return result
+
+
+def simulate_dvid(video, phase):
+    """Bits of the clock, red, green and blue outputs of VGA2DVID"""
+    dut = DvidGearbox()
+    dvid = dut.dvid
+    outputs = [dvid.o_clk, dvid.o_red, dvid.o_green, dvid.o_blue]
+    bits = [[] for _ in outputs]
+
+    sim = Simulator(dut)
+    sim.add_clock(PIXEL_PERIOD, domain="pixel")
+    sim.add_clock(SHIFT_PERIOD, phase=phase * SHIFT_PERIOD, domain="shift")
+
+    def pixel():
+        for i, (red, green, blue, blank, hsync, vsync) in enumerate(video):
+            if i == 10:
+                yield dut.i_rst.eq(0)
+            yield dvid.i_red.eq(red)
+            yield dvid.i_green.eq(green)
+            yield dvid.i_blue.eq(blue)
+            yield dvid.i_blank.eq(blank)
+            yield dvid.i_hsync.eq(hsync)
+            yield dvid.i_vsync.eq(vsync)
+            yield
+
+    def shift():
+        for _ in range(int(len(video) * 2.5)):
+            yield
+            for channel, output in zip(bits, outputs):
+                data = yield output
+                channel.extend((data >> i) & 1 for i in range(4))
+
+    sim.add_sync_process(pixel, domain="pixel")
+    sim.add_sync_process(shift, domain="shift")
+    sim.run()
+
+    return [np.array(channel, dtype=np.uint8) for channel in bits]
+
+
+def check_dvid(streams, video):
+    """Whether the decoded symbols contain the pixels, and the syncs on the
+    blue channel, in order"""
+    clock = streams[0]
+    pattern = np.array([(0b0000011111 >> i) & 1 for i in range(10)], dtype=np.uint8)
+    # The clock pattern is sent from the lock of the gearbox to the end
+    starts = [i for i in range(len(clock) - 9) if (clock[i:i + 10] == pattern).all()]
+    if not starts:
+        return False
+    start = starts[0]
+    if not all((clock[i:i + 10] == pattern).all() for i in range(start, len(clock) - 9, 10)):
+        return False
+
+    weights = 1 << np.arange(10)
+    expected = np.array(video[20:-20])
+    for n, stream in enumerate(streams[1:]):
+        symbols = stream[start:start + (len(stream) - start) // 10 * 10].reshape(-1, 10) @ weights
+        data, c, de = decode(symbols)
+        got = np.where(de, data, c).astype(np.int32)
+        # Video data, or the control bits in blanking, hsync and vsync on blue
+        if n == 2:
+            control = expected[:, 4] | expected[:, 5] << 1
+        else:
+            control = np.zeros(len(expected), dtype=np.int64)
+        want = np.where(expected[:, 3] == 0, expected[:, n], control)
+        if not any((got[i:i + len(want)] == want).all() for i in range(len(got) - len(want) + 1)):
+            return False
+    return True
+
+
+def find(stream, words):
+    # Offset of the word sequence in the bit stream, or None
+    sent = np.array([(int(w) >> i) & 1 for w in words for i in range(10)], dtype=np.uint8)
+    for offset in range(len(stream) - len(sent) + 1):
+        if (stream[offset:offset + len(sent)] == sent).all():
+            return offset
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phases", type=float, nargs="+", default=[0.1, 0.25, 0.5, 0.75, 0.9],
+                        help="shift clock phase, in shift clock periods")
+    parser.add_argument("--words", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    words = rng.integers(0, 1024, args.words)
+
+    ok = True
+    for phase in args.phases:
+        stream = simulate(words, phase)
+        # The first words are sent before the gearbox has locked
+        offset = find(stream, words[20:-20])
+        print("Phase {:.2f}: {}".format(phase, "passed" if offset is not None else "FAILED"))
+        ok &= offset is not None
+
+    video = pixels(rng, args.words)
+    for phase in args.phases:
+        passed = check_dvid(simulate_dvid(video, phase), video)
+        print("VGA2DVID, phase {:.2f}: {}".format(phase, "passed" if passed else "FAILED"))
+        ok &= passed
+
+    print("PASSED" if ok else "FAILED")
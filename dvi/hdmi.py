@@ -0,0 +1,269 @@
+from amaranth import *
+from amaranth.build import Platform
+from amaranth.lib.fifo import SyncFIFOBuffered
+
+# HDMI data island periods: packets sent in the horizontal blanking,
+# TERC4 encoded, between guard bands. See the HDMI 1.3 specification,
+# section 5.2.3.
+
+# TERC4 symbols for the 4-bit data island values
+TERC4 = [
+    0b1010011100, 0b1001100011, 0b1011100100, 0b1011100010,
+    0b0101110001, 0b0100011110, 0b0110001110, 0b0100111100,
+    0b1011001100, 0b0100111001, 0b0110011100, 0b1011000110,
+    0b1010001110, 0b1001110001, 0b0101100011, 0b1011000011,
+]
+
+# Guard band symbols for channels 0, 1 and 2
+VIDEO_GUARD  = [0b1011001100, 0b0100110011, 0b1011001100]
+ISLAND_GUARD = 0b0100110011 # Channels 1 and 2, channel 0 is TERC4 coded
+
+PREAMBLE_LENGTH = 8
+GUARD_LENGTH    = 2
+PACKET_LENGTH   = 32
+
+# Packet types
+PACKET_ACR          = 0x01
+PACKET_AUDIO_SAMPLE = 0x02
+PACKET_AVI          = 0x82
+PACKET_AUDIO_INFO   = 0x84
+
+# Recommended audio clock regeneration N for each sample rate
+AUDIO_N = {32000: 4096, 44100: 6272, 48000: 6144}
+
+# IEC 60958 channel status bits set for each sample rate, with 16-bit samples
+CHANNEL_STATUS = {32000: [24, 25, 33], 44100: [33], 48000: [25, 33]}
+
+
+def island_length(packets):
+    return PREAMBLE_LENGTH + 2 * GUARD_LENGTH + packets * PACKET_LENGTH
+
+
+def ecc(value, width):
+    """BCH ECC of the width low bits of value, sent after them lsb first."""
+    code = 0
+    for i in range(width):
+        if (code ^ (value >> i)) & 1:
+            code = (code >> 1) ^ 0b10000011
+        else:
+            code >>= 1
+    return code
+
+
+def ecc_network(value, width):
+    # The code is linear, so each ECC bit is the xor of a fixed set of bits
+    columns = [ecc(1 << i, width) for i in range(width)]
+    return Cat(*[Cat(*[value[i] for i in range(width) if (columns[i] >> b) & 1]).xor()
+                 for b in range(8)])
+
+
+def packet(header, payload):
+    """Header (32 bits) and 4 subpackets (64 bits each) of a packet, ECC included.
+
+    header is 3 bytes and payload up to 28 bytes.
+    """
+    payload = list(payload) + [0] * (28 - len(payload))
+    hb = int.from_bytes(bytes(header), "little")
+    subpackets = []
+    for k in range(4):
+        sb = int.from_bytes(bytes(payload[7 * k:7 * k + 7]), "little")
+        subpackets.append(sb | (ecc(sb, 56) << 56))
+    return hb | (ecc(hb, 24) << 24), subpackets
+
+
+def infoframe(kind, version, data):
+    # The checksum in PB0 makes all header and payload bytes sum to 0
+    header = [kind, version, len(data)]
+    checksum = (-sum(header) - sum(data)) & 0xff
+    return packet(header, [checksum] + list(data))
+
+
+def avi_infoframe(vic=0):
+    # RGB, no bar or scan info, picture aspect same as coded frame
+    return infoframe(PACKET_AVI, 2, [0x00, 0x08, 0x00, vic, 0x00] + [0] * 8)
+
+
+def audio_infoframe(channels=2):
+    # Coding type, sample size and rate from the stream header
+    return infoframe(PACKET_AUDIO_INFO, 1, [channels - 1, 0, 0, 0, 0] + [0] * 5)
+
+
+def acr_packet(pixel_freq, audio_rate):
+    # The sink recreates the audio clock as pixel_freq * N / CTS = 128 * audio_rate
+    n = AUDIO_N[audio_rate]
+    cts = round(pixel_freq * n / (128 * audio_rate))
+    sb = [0, (cts >> 16) & 0x0f, (cts >> 8) & 0xff, cts & 0xff, (n >> 16) & 0x0f, (n >> 8) & 0xff, n & 0xff]
+    return packet([PACKET_ACR, 0, 0], sb * 4)
+
+
+class DataIslands(Elaboratable):
+    def __init__(self,
+                 pixel_freq,         # Hz, for the audio clock regeneration
+                 audio_rate  = 48000,
+                 vic         = 0,    # CEA-861 video identification code, 0 if none
+                 packets     = 2,    # Packets per island, 1 audio sample packet and others
+                 audio_depth = 16):  # Audio FIFO depth in samples
+        # Delayed video timing from VGA2DVID
+        self.i_hsync = Signal()
+        self.i_vsync = Signal()
+        # Audio samples, one stereo pair per transfer
+        self.i_audio_left  = Signal(16)
+        self.i_audio_right = Signal(16)
+        self.i_audio_valid = Signal()
+        self.o_audio_ready = Signal()
+        # Control bits of channels 1 and 2 (island preamble)
+        self.o_c1 = Signal(2)
+        self.o_c2 = Signal(2)
+        # Replace the encoded symbols (guard bands and packets)
+        self.o_island = Signal()
+        self.o_ch0 = Signal(10)
+        self.o_ch1 = Signal(10)
+        self.o_ch2 = Signal(10)
+        # Configuration
+        self.pixel_freq = pixel_freq
+        self.audio_rate = audio_rate
+        self.vic = vic
+        self.packets = packets
+        self.audio_depth = audio_depth
+        self.length = island_length(packets)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        # Constant packets, sent in turn after the audio sample packet
+        others = [acr_packet(self.pixel_freq, self.audio_rate), avi_infoframe(self.vic), audio_infoframe()]
+        other_headers = Array(C(h, 32) for h, _ in others)
+        other_subpackets = [Array(C(s[k], 64) for _, s in others) for k in range(4)]
+        channel_status = C(sum(1 << b for b in CHANNEL_STATUS[self.audio_rate]), 192)
+
+        terc4 = Array(C(s, 10) for s in TERC4)
+
+        m.submodules.fifo = fifo = DomainRenamer({"sync": "pixel"})(
+            SyncFIFOBuffered(width=32, depth=self.audio_depth))
+        m.d.comb += [
+            fifo.w_data.eq(Cat(self.i_audio_left, self.i_audio_right)),
+            fifo.w_en.eq(self.i_audio_valid),
+            self.o_audio_ready.eq(fifo.w_rdy),
+        ]
+
+        R_hsync    = Signal()
+        R_active   = Signal()
+        R_count    = Signal(range(self.length))
+        R_pixel    = Signal(5) # Pixel within the packet
+        R_other    = Signal(range(len(others)))
+        R_frame    = Signal(range(192)) # IEC 60958 frame of the next sample
+        R_header   = Signal(32)
+        R_sub      = [Signal(64, name="R_sub{}".format(k)) for k in range(4)]
+
+        # Audio samples of the next audio sample packet
+        R_present  = Signal(4)
+        R_start    = Signal(4) # First frame of a channel status block
+        R_status   = Signal(4) # Channel status bit
+        R_samples  = [Signal(32, name="R_sample{}".format(k)) for k in range(4)]
+
+        first_packet = PREAMBLE_LENGTH + GUARD_LENGTH
+        last_guard   = first_packet + self.packets * PACKET_LENGTH
+
+        m.d.pixel += R_hsync.eq(self.i_hsync)
+
+        # Islands start at the leading edge of hsync
+        with m.If(self.i_hsync & ~R_hsync):
+            m.d.pixel += [
+                R_active.eq(1),
+                R_count.eq(0),
+                R_present.eq(0),
+            ]
+        with m.Elif(R_active):
+            m.d.pixel += R_count.eq(R_count + 1)
+            with m.If(R_count == self.length - 1):
+                m.d.pixel += R_active.eq(0)
+
+        # Up to 4 samples are taken from the FIFO during the preamble
+        with m.If(R_active & (R_count < 4) & fifo.r_rdy):
+            m.d.comb += fifo.r_en.eq(1)
+            m.d.pixel += [
+                R_present.eq(Cat(1, R_present)),
+                R_start.eq(Cat(R_frame == 0, R_start)),
+                R_status.eq(Cat(channel_status.bit_select(R_frame, 1), R_status)),
+                Cat(*R_samples).eq(Cat(fifo.r_data, *R_samples[:3])),
+                R_frame.eq(Mux(R_frame == 191, 0, R_frame + 1)),
+            ]
+
+        # Audio sample packet, samples are in the reverse order of arrival
+        present = Signal(4)
+        start   = Signal(4)
+        status  = Signal(4)
+        n = Signal(range(5))
+        m.d.comb += n.eq(R_present[0] + R_present[1] + R_present[2] + R_present[3])
+        with m.Switch(n):
+            for count in range(5):
+                with m.Case(count):
+                    order = list(reversed(range(count)))
+                    if count:
+                        m.d.comb += [
+                            present.eq(Cat(*[R_present[i] for i in order])),
+                            start.eq(Cat(*[R_start[i] for i in order])),
+                            status.eq(Cat(*[R_status[i] for i in order])),
+                        ]
+
+        audio_header = Signal(24)
+        audio_sub    = [Signal(56, name="audio_sub{}".format(k)) for k in range(4)]
+        m.d.comb += audio_header.eq(Cat(C(PACKET_AUDIO_SAMPLE, 8), present, C(0, 4), C(0, 4), start & present))
+        for k in range(4):
+            sample = Signal(32, name="sample{}".format(k))
+            m.d.comb += sample.eq(Mux(n > k, Array(R_samples)[(n - 1 - k)[:2]], 0))
+            left  = sample[:16]
+            right = sample[16:]
+            c = status[k]
+            # 24-bit samples with the 16 bits msb aligned, even parity over
+            # sample, V, U and C bits
+            m.d.comb += audio_sub[k].eq(Cat(C(0, 8), left, C(0, 8), right,
+                                            C(0, 2), c, left.xor() ^ c,
+                                            C(0, 2), c, right.xor() ^ c))
+
+        # Packets are loaded on the pixel before they start, and shifted out
+        # 1 header bit and 2 bits of each subpacket per pixel
+        with m.If(R_active & (R_count >= first_packet - 1) & (R_count < last_guard - 1) & (R_pixel == 31)):
+            with m.If(R_count == first_packet - 1):
+                m.d.pixel += R_header.eq(Cat(audio_header, ecc_network(audio_header, 24)))
+                for k in range(4):
+                    m.d.pixel += R_sub[k].eq(Cat(audio_sub[k], ecc_network(audio_sub[k], 56)))
+            with m.Else():
+                m.d.pixel += R_header.eq(other_headers[R_other])
+                for k in range(4):
+                    m.d.pixel += R_sub[k].eq(other_subpackets[k][R_other])
+                m.d.pixel += R_other.eq(Mux(R_other == len(others) - 1, 0, R_other + 1))
+        with m.Else():
+            m.d.pixel += R_header.eq(R_header[1:])
+            for k in range(4):
+                m.d.pixel += R_sub[k].eq(R_sub[k][2:])
+
+        with m.If(R_active & (R_count >= first_packet - 1)):
+            m.d.pixel += R_pixel.eq(R_pixel + 1)
+        with m.Else():
+            m.d.pixel += R_pixel.eq(31)
+
+        # Symbols
+        sync = Cat(self.i_hsync, self.i_vsync)
+        with m.If(R_active):
+            with m.If(R_count < PREAMBLE_LENGTH):
+                m.d.comb += [
+                    self.o_c1.eq(0b01),
+                    self.o_c2.eq(0b01),
+                ]
+            with m.Elif((R_count < first_packet) | (R_count >= last_guard)):
+                m.d.comb += [
+                    self.o_island.eq(1),
+                    self.o_ch0.eq(terc4[Cat(sync, C(0b11, 2))]),
+                    self.o_ch1.eq(ISLAND_GUARD),
+                    self.o_ch2.eq(ISLAND_GUARD),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    self.o_island.eq(1),
+                    self.o_ch0.eq(terc4[Cat(sync, R_header[0], R_pixel != 0)]),
+                    self.o_ch1.eq(terc4[Cat(*[R_sub[k][0] for k in range(4)])]),
+                    self.o_ch2.eq(terc4[Cat(*[R_sub[k][1] for k in range(4)])]),
+                ]
+
+        return m
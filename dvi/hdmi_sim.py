@@ -0,0 +1,300 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from vga import VGA
+from vga2dvid import VGA2DVID
+from vga_timings import VGATiming
+from tmds import CONTROL, VIDEO_GUARD, ISLAND_GUARD, decode, terc4_decode, bch_remainder
+from hdmi import ecc
+
+# Simulation of VGA2DVID with HDMI data islands.
+#
+# A small video mode is generated with a constant colour, while stereo
+# audio samples are written into the audio FIFO. The TMDS symbols of the
+# three channels are captured, every data island is found and its packets
+# are decoded: ECC, checked by division by the generator polynomial and
+# against known headers, InfoFrame checksums, audio clock regeneration, and the
+# audio samples, which must come out in order. The video preamble and guard
+# band before each line, and the video data, are checked as well.
+#
+#   python hdmi_sim.py
+#   python hdmi_sim.py --samples 400 --sample-period 64
+
+# A small mode, with just enough room for two packets a line
+TIMING = VGATiming(
+    x             = 32,
+    y             = 6,
+    refresh_rate  = 60.0,
+    pixel_freq    = 25_200_000,
+    h_front_porch = 8,
+    h_sync_pulse  = 40,
+    h_back_porch  = 60,
+    v_front_porch = 1,
+    v_sync_pulse  = 2,
+    v_back_porch  = 1)
+
+COLOR = (0x12, 0x34, 0x56)
+
+# Header ECCs worked out by long division by the generator polynomial of the
+# spec, 1 + x^6 + x^7 + x^8: the null packet, the last header bit alone
+# (x^8 mod G(x) = 1 + x^6 + x^7), and the AVI InfoFrame header
+ECC_VECTORS = [
+    ([0x00, 0x00, 0x00], 0x00),
+    ([0x00, 0x00, 0x80], 0x83),
+    ([0x82, 0x02, 0x0d], 0xe4),
+]
+
+
+class HdmiPipeline(Elaboratable):
+    def __init__(self, timing):
+        self.i_audio_left  = Signal(16)
+        self.i_audio_right = Signal(16)
+        self.i_audio_valid = Signal()
+        self.o_audio_ready = Signal()
+        self.o_red   = Signal(10)
+        self.o_green = Signal(10)
+        self.o_blue  = Signal(10)
+        # Configuration
+        self.timing = timing
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.vga = vga = VGA(
+            resolution_x      = self.timing.x,
+            hsync_front_porch = self.timing.h_front_porch,
+            hsync_pulse       = self.timing.h_sync_pulse,
+            hsync_back_porch  = self.timing.h_back_porch,
+            resolution_y      = self.timing.y,
+            vsync_front_porch = self.timing.v_front_porch,
+            vsync_pulse       = self.timing.v_sync_pulse,
+            vsync_back_porch  = self.timing.v_back_porch,
+            bits_x            = 10,
+            bits_y            = 10
+        )
+
+        m.d.comb += [
+            vga.i_clk_en.eq(1),
+            vga.i_test_picture.eq(0),
+            vga.i_r.eq(COLOR[0]),
+            vga.i_g.eq(COLOR[1]),
+            vga.i_b.eq(COLOR[2]),
+        ]
+
+        m.submodules.vga2dvid = vga2dvid = VGA2DVID(serial=False, shift_clock_synchronizer=False,
+                                                    hdmi=True, timing=self.timing)
+
+        m.d.comb += [
+            vga2dvid.i_red.eq(vga.o_vga_r),
+            vga2dvid.i_green.eq(vga.o_vga_g),
+            vga2dvid.i_blue.eq(vga.o_vga_b),
+            vga2dvid.i_hsync.eq(vga.o_vga_hsync),
+            vga2dvid.i_vsync.eq(vga.o_vga_vsync),
+            vga2dvid.i_blank.eq(vga.o_vga_blank),
+            vga2dvid.i_audio_left.eq(self.i_audio_left),
+            vga2dvid.i_audio_right.eq(self.i_audio_right),
+            vga2dvid.i_audio_valid.eq(self.i_audio_valid),
+            self.o_audio_ready.eq(vga2dvid.o_audio_ready),
+            self.o_red.eq(vga2dvid.o_red_par),
+            self.o_green.eq(vga2dvid.o_green_par),
+            self.o_blue.eq(vga2dvid.o_blue_par),
+        ]
+
+        return m
+
+
+def audio_samples(count):
+    left  = (np.arange(count) * 257) & 0xffff
+    right = (0x8000 + np.arange(count) * 4099) & 0xffff
+    return np.stack([left, right], axis=-1)
+
+
+def simulate(dut, samples, sample_period):
+    symbols = []
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-8, domain="pixel")
+
+    def process():
+        sent = 0
+        cycle = 0
+        # Run on until the last samples have been sent in a data island
+        while sent < len(samples) or cycle < last + 4000:
+            if sent < len(samples) and cycle >= sent * sample_period:
+                yield dut.i_audio_left.eq(int(samples[sent][0]))
+                yield dut.i_audio_right.eq(int(samples[sent][1]))
+                yield dut.i_audio_valid.eq(1)
+            else:
+                yield dut.i_audio_valid.eq(0)
+            yield
+            if (yield dut.i_audio_valid) and (yield dut.o_audio_ready):
+                sent += 1
+                last = cycle
+            symbols.append([(yield dut.o_blue), (yield dut.o_green), (yield dut.o_red)])
+            cycle += 1
+
+    last = 0
+    sim.add_sync_process(process, domain="pixel")
+    sim.run()
+
+    return np.array(symbols, dtype=np.uint16)
+
+
+def to_int(bit_list):
+    return sum(int(b) << i for i, b in enumerate(bit_list))
+
+
+class Checker:
+    def __init__(self):
+        self.errors = []
+
+    def check(self, ok, message):
+        if not ok:
+            self.errors.append(message)
+        return ok
+
+
+def find_islands(symbols, checker):
+    """Start and channel 0, 1, 2 TERC4 values of the packets of each data island."""
+    guard = (symbols[:, 1] == ISLAND_GUARD) & (symbols[:, 2] == ISLAND_GUARD)
+    # Leading guard bands follow the island preamble
+    preamble = (symbols[:, 1] == CONTROL[1]) & (symbols[:, 2] == CONTROL[1])
+    starts = [i for i in np.flatnonzero(guard[2:] & guard[1:-1] & ~guard[:-2]) + 1
+              if i >= 8 and preamble[i - 8:i].all()]
+
+    islands = []
+    for start in starts:
+        start += 2
+        end = start
+        while end < len(guard) and not guard[end]:
+            end += 1
+        if not checker.check(end + 2 <= len(guard) and guard[end:end + 2].all(),
+                             "Island at {} has no trailing guard band".format(start)):
+            continue
+        # Channel 0 is TERC4 coded in the guard bands too, with 0b11 and
+        # vsync and hsync
+        values = []
+        for channel in range(3):
+            value, valid = terc4_decode(symbols[start - 2 * (channel == 0):end + 2 * (channel == 0), channel])
+            checker.check(valid.all(), "Island at {} channel {} is not TERC4".format(start, channel))
+            values.append(value)
+        checker.check(((values[0][[0, 1, -2, -1]] & 0b1100) == 0b1100).all(),
+                      "Island at {} bad channel 0 guard band".format(start))
+        values[0] = values[0][2:-2]
+        checker.check((end - start) % 32 == 0, "Island at {} is not a whole number of packets".format(start))
+        islands.append((start, values))
+    return islands
+
+
+def packets(island, checker):
+    """Header and subpacket bytes of each packet of an island."""
+    start, (ch0, ch1, ch2) = island
+    for p in range(len(ch0) // 32):
+        pixels = slice(32 * p, 32 * p + 32)
+        header = (ch0[pixels] >> 2) & 1
+        checker.check((((ch0[pixels] >> 3) & 1) == (np.arange(32) != 0)).all(),
+                      "Island at {} packet {}: bad channel 0 bit 3".format(start, p))
+        checker.check(bch_remainder(header) == 0,
+                      "Island at {} packet {}: header ECC".format(start, p))
+
+        subpackets = []
+        for k in range(4):
+            sub = np.stack([(ch1[pixels] >> k) & 1, (ch2[pixels] >> k) & 1], axis=-1).reshape(-1)
+            checker.check(bch_remainder(sub) == 0,
+                          "Island at {} packet {}: subpacket {} ECC".format(start, p, k))
+            subpackets.append([to_int(sub[8 * i:8 * i + 8]) for i in range(7)])
+
+        yield [to_int(header[8 * i:8 * i + 8]) for i in range(3)], subpackets
+
+
+def check_video(symbols, islands, timing, checker):
+    # Everything that is not a control symbol or in a data island is a video
+    # guard band or video data
+    _, c, de = decode(symbols[:, 1])
+    for start, values in islands:
+        de[start - 2:start + len(values[0]) + 2] = False
+    # Video starts after the preamble and guard band
+    video_start = np.flatnonzero(de[1:] & ~de[:-1]) + 3
+    lines = 0
+    for start in video_start:
+        if start < 10 or start + timing.x > len(de):
+            continue
+        lines += 1
+        guard = symbols[start - 2:start]
+        checker.check((guard == VIDEO_GUARD).all(), "Line at {}: bad video guard band".format(start))
+        checker.check((symbols[start - 10:start - 2, 1] == CONTROL[1]).all() and
+                      (symbols[start - 10:start - 2, 2] == CONTROL[0]).all(),
+                      "Line at {}: bad video preamble".format(start))
+        video = np.stack([decode(symbols[start:start + timing.x, ch])[0] for ch in (2, 1, 0)], axis=-1)
+        # The VGA core sends black for the first pixel of each line
+        checker.check((video[1:] == COLOR).all() and de[start:start + timing.x].all(),
+                      "Line at {}: bad video data".format(start))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--sample-period", type=int, default=80, help="pixel clocks between audio samples")
+    args = parser.parse_args()
+
+    samples = audio_samples(args.samples)
+    symbols = simulate(HdmiPipeline(TIMING), samples, args.sample_period)
+    print("Simulated", len(symbols), "pixel clocks")
+
+    checker = Checker()
+    for header, code in ECC_VECTORS:
+        value = int.from_bytes(bytes(header), "little")
+        checker.check(ecc(value, 24) == code, "ECC of header {} is {:02x}, not {:02x}".format(
+            bytes(header).hex(), ecc(value, 24), code))
+    islands = find_islands(symbols, checker)
+    lines = check_video(symbols, islands, TIMING, checker)
+
+    kinds = {}
+    received = []
+    frames = []
+    for island in islands:
+        for header, subpackets in packets(island, checker):
+            kind = header[0]
+            kinds[kind] = kinds.get(kind, 0) + 1
+            if kind in (0x82, 0x84):
+                payload = sum(subpackets, [])[:header[2] + 1]
+                checker.check((sum(header) + sum(payload)) & 0xff == 0, "InfoFrame {:02x} checksum".format(kind))
+            elif kind == 0x01:
+                sb = subpackets[0]
+                cts = (sb[1] << 16) | (sb[2] << 8) | sb[3]
+                n = (sb[4] << 16) | (sb[5] << 8) | sb[6]
+                checker.check(n == 6144 and cts == round(TIMING.pixel_freq * n / (128 * 48000)),
+                              "ACR N {} CTS {}".format(n, cts))
+            elif kind == 0x02:
+                present = header[1] & 0xf
+                for k in range(4):
+                    if not (present >> k) & 1:
+                        continue
+                    sb = subpackets[k]
+                    left  = sb[1] | (sb[2] << 8)
+                    right = sb[4] | (sb[5] << 8)
+                    for sample, flags in ((left, sb[6] & 0xf), (right, sb[6] >> 4)):
+                        parity = (bin(sample).count("1") + ((flags >> 2) & 1) + ((flags >> 3) & 1)) & 1
+                        checker.check(parity == 0, "Audio sample parity")
+                    received.append((left, right))
+                    frames.append((header[2] >> (4 + k)) & 1)
+
+    received = np.array(received).reshape(-1, 2)
+    checker.check(len(received) == len(samples) and (received == samples).all(),
+                  "Audio samples: sent {}, received {} in order: {}".format(
+                      len(samples), len(received), (received == samples[:len(received)]).all()))
+    block_starts = list(np.flatnonzero(frames))
+    checker.check(block_starts == list(range(0, len(frames), 192)),
+                  "Channel status block starts at {}".format(block_starts))
+
+    print("Video lines checked:", lines)
+    print("Packets:", ", ".join("{:02x}: {}".format(k, v) for k, v in sorted(kinds.items())))
+    print("Audio samples received:", len(received))
+    for error in checker.errors[:20]:
+        print(error)
+    print("PASSED" if not checker.errors else "FAILED ({} errors)".format(len(checker.errors)))
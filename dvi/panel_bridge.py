@@ -0,0 +1,239 @@
+from math import ceil
+
+from amaranth import *
+
+from init_seq import InitSequence
+from rgb import rgb332_to_rgb565
+
+# Bridge from a VGA style stream, such as that of VGA, to a small SPI panel,
+# with a backend of panels.py for its command set.
+#
+# The src_x by src_y pixels of the stream, in capture_domain with
+# i_clk_pixel_ena, are scaled down to the panel by dropping pixels and
+# lines, and written to a framebuffer in BRAM, RGB332 or with color_bits 16
+# RGB565. The other port of the framebuffer is read in the sync domain,
+# which sends the panel its init sequence once, then frames again and again:
+# the commands of the window of the whole panel, then its pixels in RGB565.
+# The frames are not in step with the stream, and can tear.
+#
+# The SPI clock is the sync clock, clk_freq, divided by clk_div, by default
+# the least of 2 or more for the MAX_SPI_FREQ of the panel, and the bytes
+# are sent back to back, so the panel gets its maximum frame rate. o_frame
+# pulses at the start of each frame.
+class PanelBridge(Elaboratable):
+    CLK_PHASE    = 0
+    CLK_POLARITY = 1
+
+    def __init__(self, panel, src_x, src_y, clk_freq=None, clk_div=None,
+                 capture_domain="sync", color_bits=8):
+        assert src_x >= panel.WIDTH and src_y >= panel.HEIGHT
+        assert color_bits in (8, 16)
+        self.panel          = panel
+        self.src_x          = src_x
+        self.src_y          = src_y
+        self.clk_freq       = clk_freq
+        self.clk_div        = clk_div
+        self.capture_domain = capture_domain
+        self.color_bits     = color_bits
+
+        # VGA
+        self.i_clk_pixel_ena = Signal()
+        self.i_hsync        = Signal()
+        self.i_vsync        = Signal()
+        self.i_blank        = Signal()
+        self.i_r            = Signal(8)
+        self.i_g            = Signal(8)
+        self.i_b            = Signal(8)
+
+        # SPI panel
+        self.o_spi_clk      = Signal()
+        self.o_spi_mosi     = Signal()
+        self.o_spi_dc       = Signal()
+        self.o_spi_csn      = Signal(reset=1)
+        self.o_spi_resn     = Signal()
+        self.o_frame        = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        panel = self.panel
+        width, height = panel.WIDTH, panel.HEIGHT
+        clk_freq = self.clk_freq or platform.default_clk_frequency
+        clk_div = self.clk_div or max(2, ceil(clk_freq / panel.MAX_SPI_FREQ))
+
+        # Init sequence, then the window of a frame, in one ROM
+        init = InitSequence(panel.init_seq(), panel.ARG_COUNTS, clk_freq, panel.ARGS_DC)
+        header = InitSequence(panel.window(0, 0, width - 1, height - 1), panel.ARG_COUNTS,
+                              clk_freq, panel.ARGS_DC)
+        rom_data = init.rom + header.rom
+        rom = Memory(width=10, depth=len(rom_data), init=rom_data)
+        delays = Array(C(d) for d in init.delays or [0])
+        reset_clocks = int(panel.RESET_US * clk_freq // 1000000)
+
+        # Framebuffer
+        fb = Memory(width=self.color_bits, depth=width * height)
+        m.submodules.fb_w = fb_w = fb.write_port(domain=self.capture_domain)
+        m.submodules.fb_r = fb_r = fb.read_port(transparent=False)
+
+        # Capture, keeping a pixel when the count of panel pixels, adding
+        # width each source pixel, goes past the source width, the same for
+        # the lines
+        cap = m.d[self.capture_domain]
+
+        x_in   = Signal(range(self.src_x))
+        ax     = Signal(range(self.src_x + width))
+        out_x  = Signal(range(width))
+        ay     = Signal(range(self.src_y + height))
+        out_y  = Signal(range(height))
+        keep_x = Signal()
+        keep_y = Signal()
+
+        m.d.comb += [
+            keep_x.eq(ax + width >= self.src_x),
+            keep_y.eq(ay + height >= self.src_y),
+            fb_w.addr.eq(out_y * width + out_x),
+        ]
+        if self.color_bits == 8:
+            m.d.comb += fb_w.data.eq(Cat(self.i_b[6:8], self.i_g[5:8], self.i_r[5:8]))
+        else:
+            m.d.comb += fb_w.data.eq(Cat(self.i_b[3:8], self.i_g[2:8], self.i_r[3:8]))
+
+        with m.If(self.i_clk_pixel_ena):
+            with m.If(self.i_vsync):
+                cap += [
+                    ay.eq(0),
+                    out_y.eq(0)
+                ]
+            with m.If(self.i_hsync | self.i_vsync):
+                cap += [
+                    x_in.eq(0),
+                    ax.eq(0),
+                    out_x.eq(0)
+                ]
+            with m.Elif(~self.i_blank):
+                m.d.comb += fb_w.en.eq(keep_x & keep_y)
+                cap += [
+                    x_in.eq(x_in + 1),
+                    ax.eq(Mux(keep_x, ax + width - self.src_x, ax + width)),
+                    out_x.eq(out_x + keep_x)
+                ]
+                with m.If(x_in == self.src_x - 1): # End of the line
+                    cap += [
+                        x_in.eq(0),
+                        ax.eq(0),
+                        out_x.eq(0),
+                        ay.eq(Mux(keep_y, ay + height - self.src_y, ay + height)),
+                        out_y.eq(out_y + keep_y)
+                    ]
+
+        # SPI
+        div_cnt    = Signal(range(clk_div))
+        bit        = Signal(3)
+        byte_start = Signal()
+        clk_low    = Signal()
+        data       = Signal(8)
+        dc         = Signal()
+        clken      = Signal()
+        word       = Signal(10)
+        rom_addr   = Signal(range(len(rom_data)))
+        delay_index = Signal(range(len(init.delays) + 1))
+        delay_cnt  = Signal(max(reset_clocks, init.max_delay()).bit_length() + 1, reset=reset_clocks)
+        delay_set  = Signal()
+        resn       = Signal()
+        px         = Signal(range(width))
+        py         = Signal(range(height))
+        low_byte   = Signal()
+        color      = Signal(16) # RGB565
+
+        m.d.comb += [
+            self.o_spi_resn.eq(resn),
+            self.o_spi_csn.eq(~clken),
+            self.o_spi_dc.eq(dc),
+            self.o_spi_clk.eq(((clk_low ^ ~self.CLK_PHASE) | ~clken) ^ ~self.CLK_POLARITY),
+            self.o_spi_mosi.eq(data[7]),
+            word.eq(rom[rom_addr]),
+            byte_start.eq((div_cnt == 0) & (bit == 0)),
+            clk_low.eq((div_cnt != 0) & (div_cnt <= clk_div // 2)),
+            fb_r.addr.eq(py * width + px),
+        ]
+        if self.color_bits == 8:
+            m.d.comb += color.eq(rgb332_to_rgb565(fb_r.data))
+        else:
+            m.d.comb += color.eq(fb_r.data)
+
+        m.d.sync += self.o_frame.eq(0)
+
+        with m.If(delay_cnt[-1] == 0): # Reset, or a delay after the reset
+            m.d.sync += delay_cnt.eq(delay_cnt - 1)
+        with m.Else():
+            m.d.sync += [
+                resn.eq(1),
+                div_cnt.eq(div_cnt + 1)
+            ]
+            with m.If(div_cnt == clk_div - 1):
+                m.d.sync += [
+                    div_cnt.eq(0),
+                    bit.eq(bit + 1)
+                ]
+            with m.If(byte_start):
+                with m.FSM():
+                    with m.State("RESET"): # Wait after the reset
+                        m.d.sync += delay_cnt.eq(reset_clocks)
+                        m.next = "INIT"
+                    with m.State("INIT"):
+                        with m.If(delay_set): # Delay after the last byte
+                            m.d.sync += [
+                                delay_cnt.eq(delays[delay_index]),
+                                delay_index.eq(delay_index + 1),
+                                delay_set.eq(0),
+                                clken.eq(0)
+                            ]
+                        with m.Elif(rom_addr == len(init.rom)):
+                            m.d.sync += clken.eq(0)
+                            m.next = "HEADER"
+                        with m.Else():
+                            m.d.sync += [
+                                rom_addr.eq(rom_addr + 1),
+                                data.eq(word[0:8]),
+                                dc.eq(word[8]),
+                                delay_set.eq(word[9]),
+                                clken.eq(1)
+                            ]
+                    with m.State("HEADER"): # Window of the whole panel
+                        m.d.sync += [
+                            rom_addr.eq(rom_addr + 1),
+                            data.eq(word[0:8]),
+                            dc.eq(word[8]),
+                            clken.eq(1),
+                            px.eq(0),
+                            py.eq(0),
+                            low_byte.eq(0)
+                        ]
+                        with m.If(rom_addr == len(init.rom)):
+                            m.d.sync += self.o_frame.eq(1)
+                        with m.If(rom_addr == len(rom_data) - 1):
+                            m.d.sync += rom_addr.eq(len(init.rom))
+                            m.next = "PIXELS"
+                    with m.State("PIXELS"):
+                        m.d.sync += [
+                            dc.eq(1),
+                            low_byte.eq(~low_byte)
+                        ]
+                        with m.If(~low_byte):
+                            m.d.sync += data.eq(color[8:])
+                        with m.Else():
+                            m.d.sync += [
+                                data.eq(color[0:8]),
+                                px.eq(px + 1)
+                            ]
+                            with m.If(px == width - 1):
+                                m.d.sync += [
+                                    px.eq(0),
+                                    py.eq(py + 1)
+                                ]
+                                with m.If(py == height - 1):
+                                    m.next = "HEADER"
+            with m.Elif(div_cnt == 0): # Shift out byte
+                m.d.sync += data.eq(Cat(0b0, data[0:7]))
+
+        return m
@@ -0,0 +1,158 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator, Passive
+
+from init_seq import InitSequence, DC
+from panels import PANELS
+from panel_bridge import PanelBridge
+
+# Simulation of the VGA to SPI panel bridge with each panel backend.
+#
+# A stream of src_x by src_y pixels, in the pixel domain, is captured and
+# sent to a small panel of the same command set, with the init sequence
+# without its delays. The SPI bytes must be the init sequence, then frames
+# of the window commands and the pixels of the stream scaled down, back to
+# back. The frame rate of the real panel, at the CLK_FREQ of the backend,
+# is reported.
+#
+#   python panel_bridge_sim.py
+#   python panel_bridge_sim.py --panel st7789 --size 32 16 --src 64 20
+
+PIXEL_PERIOD = 4e-8
+
+
+# The source pattern, RGB888
+def pattern(src_x, src_y):
+    x, y = np.meshgrid(np.arange(src_x), np.arange(src_y))
+    return np.stack([(x * 6) & 0xff, (y * 10) & 0xff, ((x + y) * 5) & 0xff], axis=-1)
+
+
+# The pixels kept of n, scaled down to size
+def kept(n, size):
+    return [k for k in range(n) if (k + 1) * size // n > k * size // n]
+
+
+# RGB565 of the pixels sent, from RGB332 in the framebuffer
+def expected(image, width, height):
+    image = image[kept(image.shape[0], height)][:, kept(image.shape[1], width)]
+    r, g, b = image[..., 0] >> 5, image[..., 1] >> 5, image[..., 2] >> 6
+    r5 = (r << 2) | (r >> 1)
+    g6 = (g << 3) | g
+    b5 = (b << 3) | (b << 1) | (b >> 1)
+    return (r5 << 11) | (g6 << 5) | b5
+
+
+def simulate(panel_class, width, height, src_x, src_y):
+    class Panel(panel_class): # Small, and without the delays
+        WIDTH    = width
+        HEIGHT   = height
+        RESET_US = 1
+
+        def init_seq(self):
+            return [(cmd, args, 0) for cmd, args, _ in super().init_seq()]
+
+    panel = Panel()
+    clk_freq = panel_class.CLK_FREQ
+    dut = PanelBridge(panel, src_x, src_y, clk_freq=clk_freq, capture_domain="pixel")
+    image = pattern(src_x, src_y)
+
+    m = Module()
+    m.domains.pixel = ClockDomain("pixel")
+    m.submodules.bridge = dut
+
+    sim = Simulator(m)
+    sim.add_clock(1 / clk_freq)
+    sim.add_clock(PIXEL_PERIOD, domain="pixel")
+
+    result = {"bytes": [], "frames": []}
+
+    # The stream, with a line of vsync and a clock of hsync
+    def source():
+        yield Passive()
+        yield dut.i_clk_pixel_ena.eq(1)
+        while True:
+            yield dut.i_vsync.eq(1)
+            yield dut.i_blank.eq(1)
+            yield
+            yield dut.i_vsync.eq(0)
+            for y in range(src_y):
+                yield dut.i_hsync.eq(1)
+                yield
+                yield dut.i_hsync.eq(0)
+                yield dut.i_blank.eq(0)
+                for x in range(src_x):
+                    r, g, b = image[y, x]
+                    yield dut.i_r.eq(int(r))
+                    yield dut.i_g.eq(int(g))
+                    yield dut.i_b.eq(int(b))
+                    yield
+                yield dut.i_blank.eq(1)
+                for _ in range(4):
+                    yield
+    sim.add_sync_process(source, domain="pixel")
+
+    def spi():
+        last_clk = 1
+        byte = 0
+        count = 0
+        cycle = 0
+        while len(result["frames"]) < 3:
+            yield
+            cycle += 1
+            if (yield dut.o_frame):
+                result["frames"].append((cycle, len(result["bytes"])))
+            clk = yield dut.o_spi_clk
+            if clk and not last_clk and not (yield dut.o_spi_csn):
+                byte = (byte << 1) | (yield dut.o_spi_mosi)
+                count += 1
+                if count == 8:
+                    result["bytes"].append(byte | ((yield dut.o_spi_dc) << 8))
+                    byte = 0
+                    count = 0
+            last_clk = clk
+    sim.add_sync_process(spi)
+    sim.run()
+
+    init = InitSequence(panel.init_seq(), panel.ARG_COUNTS, clk_freq, panel.ARGS_DC)
+    header = InitSequence(panel.window(0, 0, width - 1, height - 1), panel.ARG_COUNTS,
+                          clk_freq, panel.ARGS_DC)
+    return result, image, [w & 0x1ff for w in init.rom], [w & 0x1ff for w in header.rom]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--panel", choices=PANELS.keys(), default=None, help="default all")
+    parser.add_argument("--size", type=int, nargs=2, default=(24, 16), help="of the panel simulated")
+    parser.add_argument("--src", type=int, nargs=2, default=(40, 24), help="size of the stream")
+    args = parser.parse_args()
+
+    width, height = args.size
+    src_x, src_y = args.src
+    failed = False
+    for name in [args.panel] if args.panel else PANELS:
+        panel_class = PANELS[name]
+        result, image, init, header = simulate(panel_class, width, height, src_x, src_y)
+        stream = result["bytes"]
+        (start, first), (end, last) = result["frames"][-2:]
+        frame = stream[first:last]
+        clk_div = max(2, int(np.ceil(panel_class.CLK_FREQ / panel_class.MAX_SPI_FREQ)))
+
+        pixels = [(frame[i] & 0xff) << 8 | (frame[i + 1] & 0xff) for i in range(len(header), len(frame) - 1, 2)]
+        ok = stream[:len(init)] == init and stream[len(init):len(init) + len(header)] == header and \
+             frame[:len(header)] == header and all(b & DC for b in frame[len(header):]) and \
+             len(frame) == len(header) + 2 * width * height and \
+             (np.array(pixels).reshape(height, width) == expected(image, width, height)).all()
+        back_to_back = end - start == len(frame) * 8 * clk_div
+        failed |= not (ok and back_to_back)
+
+        # The whole panel
+        clocks = (len(header) + 2 * panel_class.WIDTH * panel_class.HEIGHT) * 8 * clk_div
+        print("{:8} {}x{} SPI {:.1f}MHz: {:.1f} fps, frames {}, back to back {}".format(
+            name, panel_class.WIDTH, panel_class.HEIGHT, panel_class.CLK_FREQ / clk_div / 1e6,
+            panel_class.CLK_FREQ / clocks, "PASSED" if ok else "FAILED",
+            "PASSED" if back_to_back else "FAILED"))
+
+    print("FAILED" if failed else "PASSED")
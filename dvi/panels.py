@@ -0,0 +1,198 @@
+from enum import Enum
+
+# Backends of the small SPI panels for PanelBridge, each with its command
+# set: the init sequence, for InitSequence, the argument counts of its
+# commands, and the commands that set the window of the pixels that follow.
+# All of them are set to RGB565, two bytes for each pixel, with DC high.
+#
+# MAX_SPI_FREQ is the fastest write clock of the data sheet, and CLK_FREQ a
+# sync clock for it with a clock divider of 2, for a design with a PLL
+# output to spare. top_vgatest has none, and sends at the 25MHz clock.
+
+
+class SSD1331_CMD(Enum):
+    SET_COLUMN_ADDRESS = 0x15
+    SET_ROW_ADDRESS = 0x75
+    SET_CONTRAST_COLOR_A = 0x81
+    SET_CONTRAST_COLOR_B = 0x82
+    SET_CONTRAST_COLOR_C = 0x83
+    SET_MASTER_CURRENT_CONTROL = 0x87
+    SET_PRECHARGE_A = 0x8A
+    SET_PRECHARGE_B = 0x8B
+    SET_PRECHARGE_C = 0x8C
+    SET_REMAP_COLOR = 0xA0
+    SET_DISPLAY_START_LINE = 0xA1
+    SET_DISPLAY_OFFSET = 0xA2
+    SET_DISPLAY_MODE_NORMAL = 0xA4
+    SET_MULTIPLEX_RATIO = 0xA8
+    SET_MASTER_CONFIGURATION = 0xAD
+    SET_DISPLAY_OFF = 0xAE
+    SET_DISPLAY_ON = 0xAF
+    SET_POWER_SAVE_MODE = 0xB0
+    SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT = 0xB1
+    SET_DISPLAY_CLOCK_DIVIDER = 0xB3
+    SET_PRECHARGE_LEVEL = 0xBB
+    NOP = 0xBC
+    SET_VCOMH = 0xBE
+
+
+# 96x64 OLED, the arguments are sent as commands, with DC low
+class SSD1331Panel:
+    NAME         = "ssd1331"
+    WIDTH        = 96
+    HEIGHT       = 64
+    MAX_SPI_FREQ = 6.6e6 # 150ns
+    CLK_FREQ     = 12.5e6
+    RESET_US     = 10
+    ARGS_DC      = False
+    ARG_COUNTS = {
+        SSD1331_CMD.SET_COLUMN_ADDRESS: 2,
+        SSD1331_CMD.SET_ROW_ADDRESS: 2,
+        SSD1331_CMD.SET_CONTRAST_COLOR_A: 1,
+        SSD1331_CMD.SET_CONTRAST_COLOR_B: 1,
+        SSD1331_CMD.SET_CONTRAST_COLOR_C: 1,
+        SSD1331_CMD.SET_MASTER_CURRENT_CONTROL: 1,
+        SSD1331_CMD.SET_PRECHARGE_A: 1,
+        SSD1331_CMD.SET_PRECHARGE_B: 1,
+        SSD1331_CMD.SET_PRECHARGE_C: 1,
+        SSD1331_CMD.SET_REMAP_COLOR: 1,
+        SSD1331_CMD.SET_DISPLAY_START_LINE: 1,
+        SSD1331_CMD.SET_DISPLAY_OFFSET: 1,
+        SSD1331_CMD.SET_DISPLAY_MODE_NORMAL: 0,
+        SSD1331_CMD.SET_MULTIPLEX_RATIO: 1,
+        SSD1331_CMD.SET_MASTER_CONFIGURATION: 1,
+        SSD1331_CMD.SET_DISPLAY_OFF: 0,
+        SSD1331_CMD.SET_DISPLAY_ON: 0,
+        SSD1331_CMD.SET_POWER_SAVE_MODE: 1,
+        SSD1331_CMD.SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT: 1,
+        SSD1331_CMD.SET_DISPLAY_CLOCK_DIVIDER: 1,
+        SSD1331_CMD.SET_PRECHARGE_LEVEL: 1,
+        SSD1331_CMD.NOP: 0,
+        SSD1331_CMD.SET_VCOMH: 1,
+    }
+
+    def init_seq(self):
+        return [
+            (SSD1331_CMD.NOP, [], 1000),
+            (SSD1331_CMD.SET_DISPLAY_OFF, [], 0),
+            (SSD1331_CMD.SET_REMAP_COLOR, [0b01100010], 0), # 65K colour, rotation for the ULX3S
+            (SSD1331_CMD.SET_DISPLAY_START_LINE, [0x00], 0),
+            (SSD1331_CMD.SET_DISPLAY_OFFSET, [0x00], 0),
+            (SSD1331_CMD.SET_DISPLAY_MODE_NORMAL, [], 0),
+            (SSD1331_CMD.SET_MULTIPLEX_RATIO, [0b00111111], 0),
+            (SSD1331_CMD.SET_MASTER_CONFIGURATION, [0b10001110], 0),
+            (SSD1331_CMD.SET_POWER_SAVE_MODE, [0x00], 0),
+            (SSD1331_CMD.SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT, [0x74], 0),
+            (SSD1331_CMD.SET_DISPLAY_CLOCK_DIVIDER, [0xF0], 0),
+            (SSD1331_CMD.SET_PRECHARGE_A, [0x64], 0),
+            (SSD1331_CMD.SET_PRECHARGE_B, [0x78], 0),
+            (SSD1331_CMD.SET_PRECHARGE_C, [0x64], 0),
+            (SSD1331_CMD.SET_PRECHARGE_LEVEL, [0x31], 0),
+            (SSD1331_CMD.SET_CONTRAST_COLOR_A, [0xFF], 0),
+            (SSD1331_CMD.SET_CONTRAST_COLOR_B, [0xFF], 0),
+            (SSD1331_CMD.SET_CONTRAST_COLOR_C, [0xFF], 0),
+            (SSD1331_CMD.SET_VCOMH, [0x3E], 0),
+            (SSD1331_CMD.SET_MASTER_CURRENT_CONTROL, [0x06], 0),
+            (SSD1331_CMD.SET_DISPLAY_ON, [], 100000),
+        ]
+
+    def window(self, x0, y0, x1, y1):
+        return [
+            (SSD1331_CMD.SET_COLUMN_ADDRESS, [x0, x1], 0),
+            (SSD1331_CMD.SET_ROW_ADDRESS, [y0, y1], 0),
+        ]
+
+
+# Command set of the ST7789 and the ILI9341, the ILI9341 calls RASET PASET
+class MIPI_CMD(Enum):
+    NOP = 0x00
+    SWRESET = 0x01
+    SLPOUT = 0x11
+    NORON = 0x13
+    INVON = 0x21
+    DISPON = 0x29
+    CASET = 0x2A
+    RASET = 0x2B
+    RAMWR = 0x2C
+    MADCTL = 0x36
+    COLMOD = 0x3A
+
+
+MIPI_ARG_COUNTS = {
+    MIPI_CMD.NOP: 0,
+    MIPI_CMD.SWRESET: 0,
+    MIPI_CMD.SLPOUT: 0,
+    MIPI_CMD.NORON: 0,
+    MIPI_CMD.INVON: 0,
+    MIPI_CMD.DISPON: 0,
+    MIPI_CMD.CASET: 4,
+    MIPI_CMD.RASET: 4,
+    MIPI_CMD.RAMWR: 0,
+    MIPI_CMD.MADCTL: 1,
+    MIPI_CMD.COLMOD: 1,
+}
+
+
+def mipi_window(x0, y0, x1, y1):
+    return [
+        (MIPI_CMD.CASET, [x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF], 0),
+        (MIPI_CMD.RASET, [y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF], 0),
+        (MIPI_CMD.RAMWR, [], 0),
+    ]
+
+
+# 240x240 LCD, shown from row 80 of its memory, as in st7789
+class ST7789Panel:
+    NAME         = "st7789"
+    WIDTH        = 240
+    HEIGHT       = 240
+    MAX_SPI_FREQ = 62.5e6 # 16ns
+    CLK_FREQ     = 125e6
+    RESET_US     = 10
+    ARGS_DC      = True
+    ARG_COUNTS   = MIPI_ARG_COUNTS
+    Y_OFFSET     = 80
+
+    def init_seq(self):
+        return [
+            (MIPI_CMD.NOP, [], 8192),
+            (MIPI_CMD.SWRESET, [], 131072),
+            (MIPI_CMD.SLPOUT, [], 16384),
+            (MIPI_CMD.COLMOD, [0x55], 16384), # 16-bit colour
+            (MIPI_CMD.MADCTL, [0xC0], 0),
+            (MIPI_CMD.INVON, [], 16384),
+            (MIPI_CMD.NORON, [], 16384),
+            (MIPI_CMD.DISPON, [], 16384),
+        ]
+
+    def window(self, x0, y0, x1, y1):
+        return mipi_window(x0, y0 + self.Y_OFFSET, x1, y1 + self.Y_OFFSET)
+
+
+# 320x240 LCD, in landscape
+class ILI9341Panel:
+    NAME         = "ili9341"
+    WIDTH        = 320
+    HEIGHT       = 240
+    MAX_SPI_FREQ = 10e6 # 100ns
+    CLK_FREQ     = 20e6
+    RESET_US     = 10
+    ARGS_DC      = True
+    ARG_COUNTS   = MIPI_ARG_COUNTS
+
+    def init_seq(self):
+        return [
+            (MIPI_CMD.NOP, [], 5000),
+            (MIPI_CMD.SWRESET, [], 150000),
+            (MIPI_CMD.SLPOUT, [], 120000),
+            (MIPI_CMD.COLMOD, [0x55], 0),  # 16-bit colour
+            (MIPI_CMD.MADCTL, [0x28], 0),  # Row and column exchange, BGR
+            (MIPI_CMD.NORON, [], 10000),
+            (MIPI_CMD.DISPON, [], 20000),
+        ]
+
+    def window(self, x0, y0, x1, y1):
+        return mipi_window(x0, y0, x1, y1)
+
+
+PANELS = {panel.NAME: panel for panel in (SSD1331Panel, ST7789Panel, ILI9341Panel)}
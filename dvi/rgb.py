@@ -0,0 +1,9 @@
+from amaranth import *
+
+# Colour conversions shared by the SPI panel drivers
+
+
+# RGB565 of an RGB332 value, each channel repeating its bits to fill 5 or 6
+def rgb332_to_rgb565(rgb332):
+    b, g, r = rgb332[0:2], rgb332[2:5], rgb332[5:8]
+    return Cat(b[1], b, b, g, g, r[1:3], r)
@@ -0,0 +1,132 @@
+from amaranth import *
+from amaranth.build import Platform
+
+
+class Scaler(Elaboratable):
+    """Integer scaler from a low resolution source to the VGA generator.
+
+    Each source pixel is shown as a scale x scale block, so the VGA
+    resolution must be width * scale by height * scale, for example 1080p
+    from a 480x270 source with scale 4.
+
+    The source is read a pixel at a time at (o_src_x, o_src_y) when o_src_en
+    is set, and the data must be on i_src_data the next pixel clock, as from
+    a BRAM read port. Each source line is read once, on the first of its
+    scale output lines, and kept in a one line buffer for the other lines,
+    so the source is read at 1/scale^2 of the pixel clock.
+
+    The beam position comes from the VGA generator, which takes the scaled
+    pixel on o_r, o_g and o_b.
+    """
+    def __init__(self,
+                 width,      # Source resolution
+                 height,
+                 scale = 2,  # 2, 3 or 4
+                 bits_x = 16, # As the VGA generator
+                 bits_y = 16):
+        if scale not in (2, 3, 4):
+            raise ValueError("Scale must be 2, 3 or 4, not {}".format(scale))
+        self.i_beam_x   = Signal(bits_x)
+        self.i_beam_y   = Signal(bits_y)
+        self.o_src_x    = Signal(range(width))
+        self.o_src_y    = Signal(range(height))
+        self.o_src_en   = Signal()
+        self.i_src_data = Signal(24)
+        self.o_r        = Signal(8)
+        self.o_g        = Signal(8)
+        self.o_b        = Signal(8)
+        # Configuration
+        self.width  = width
+        self.height = height
+        self.scale  = scale
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        last_x = self.width * self.scale - 1
+        last_y = self.height * self.scale - 1
+
+        # Source position of the current line, moved on to the next line
+        # after its last pixel
+        R_src_y = Signal.like(self.o_src_y)
+        R_sub_y = Signal(range(self.scale))
+
+        with m.If((self.i_beam_x == last_x) & (self.i_beam_y <= last_y)):
+            with m.If(self.i_beam_y == last_y):
+                m.d.pixel += [
+                    R_src_y.eq(0),
+                    R_sub_y.eq(0),
+                ]
+            with m.Elif(R_sub_y == self.scale - 1):
+                m.d.pixel += [
+                    R_src_y.eq(R_src_y + 1),
+                    R_sub_y.eq(0),
+                ]
+            with m.Else():
+                m.d.pixel += R_sub_y.eq(R_sub_y + 1)
+
+        # Source position of the current pixel, and of the next one, which
+        # is read now so it is there when the VGA generator takes it. In the
+        # blanking it is the first pixel of the line.
+        R_src_x  = Signal.like(self.o_src_x)
+        R_sub_x  = Signal(range(self.scale))
+        next_x   = Signal.like(self.o_src_x)
+        next_sub = Signal.like(R_sub_x)
+
+        with m.If(self.i_beam_x < last_x):
+            with m.If(R_sub_x == self.scale - 1):
+                m.d.comb += [
+                    next_x.eq(R_src_x + 1),
+                    next_sub.eq(0),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    next_x.eq(R_src_x),
+                    next_sub.eq(R_sub_x + 1),
+                ]
+        m.d.pixel += [
+            R_src_x.eq(next_x),
+            R_sub_x.eq(next_sub),
+        ]
+
+        # Line buffer, written from the source on the first line and read
+        # on the others
+        line = Memory(width=24, depth=self.width)
+        m.submodules.line_r = line_r = line.read_port(domain="pixel")
+        m.submodules.line_w = line_w = line.write_port(domain="pixel")
+
+        fetch  = Signal()
+        R_read = Signal() # A new source pixel is on the read data
+        R_src  = Signal() # From the source, not the line buffer
+        R_x    = Signal.like(self.o_src_x)
+        R_hold = Signal(24)
+        data   = Signal(24)
+
+        m.d.comb += [
+            fetch.eq(next_sub == 0),
+            self.o_src_x.eq(next_x),
+            self.o_src_y.eq(R_src_y),
+            self.o_src_en.eq(fetch & (R_sub_y == 0)),
+            line_r.addr.eq(next_x),
+        ]
+        m.d.pixel += [
+            R_read.eq(fetch),
+            R_src.eq(R_sub_y == 0),
+            R_x.eq(next_x),
+        ]
+
+        m.d.comb += [
+            line_w.addr.eq(R_x),
+            line_w.data.eq(self.i_src_data),
+            line_w.en.eq(R_read & R_src),
+            data.eq(Mux(R_src, self.i_src_data, line_r.data)),
+        ]
+
+        # The pixel is held for the scale - 1 pixels after it was read
+        with m.If(R_read):
+            m.d.pixel += R_hold.eq(data)
+            m.d.comb += Cat(self.o_b, self.o_g, self.o_r).eq(data)
+        with m.Else():
+            m.d.comb += Cat(self.o_b, self.o_g, self.o_r).eq(R_hold)
+
+        return m
@@ -0,0 +1,114 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from vga import VGA
+from scaler import Scaler
+
+# Simulation of the integer scaler between a source image in BRAM and the
+# VGA generator. The displayed frames must be the source image with each
+# pixel repeated scale times in both directions.
+#
+#   python scaler_sim.py
+#   python scaler_sim.py --scale 3 --width 20 --height 6
+
+
+class ScalerPipeline(Elaboratable):
+    def __init__(self, image, scale):
+        self.o_r     = Signal(8)
+        self.o_g     = Signal(8)
+        self.o_b     = Signal(8)
+        self.o_de    = Signal()
+        # Configuration
+        self.image = image
+        self.scale = scale
+
+    def elaborate(self, platform):
+        m = Module()
+
+        height, width = self.image.shape
+
+        m.submodules.vga = vga = VGA(
+            resolution_x      = width * self.scale,
+            hsync_front_porch = 4,
+            hsync_pulse       = 4,
+            hsync_back_porch  = 4,
+            resolution_y      = height * self.scale,
+            vsync_front_porch = 1,
+            vsync_pulse       = 1,
+            vsync_back_porch  = 1,
+            bits_x            = 10,
+            bits_y            = 10
+        )
+        m.submodules.scaler = scaler = Scaler(width, height, self.scale, bits_x=10, bits_y=10)
+
+        source = Memory(width=24, depth=width * height, init=[int(p) for p in self.image.reshape(-1)])
+        m.submodules.source = rd = source.read_port(domain="pixel", transparent=False)
+
+        m.d.comb += [
+            rd.addr.eq(scaler.o_src_y * width + scaler.o_src_x),
+            rd.en.eq(scaler.o_src_en),
+            scaler.i_src_data.eq(rd.data),
+            scaler.i_beam_x.eq(vga.o_beam_x),
+            scaler.i_beam_y.eq(vga.o_beam_y),
+            vga.i_clk_en.eq(1),
+            vga.i_test_picture.eq(0),
+            vga.i_r.eq(scaler.o_r),
+            vga.i_g.eq(scaler.o_g),
+            vga.i_b.eq(scaler.o_b),
+            self.o_r.eq(vga.o_vga_r),
+            self.o_g.eq(vga.o_vga_g),
+            self.o_b.eq(vga.o_vga_b),
+            self.o_de.eq(vga.o_vga_de),
+        ]
+
+        return m
+
+
+def simulate(dut, cycles):
+    pixels = []
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-8, domain="pixel")
+
+    def process():
+        for _ in range(cycles):
+            yield
+            if (yield dut.o_de):
+                pixels.append(((yield dut.o_r) << 16) | ((yield dut.o_g) << 8) | (yield dut.o_b))
+
+    sim.add_sync_process(process, domain="pixel")
+    sim.run()
+
+    return np.array(pixels, dtype=np.uint32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, choices=[2, 3, 4], default=None, help="default all")
+    parser.add_argument("--width", type=int, default=12)
+    parser.add_argument("--height", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 1 << 24, size=(args.height, args.width), dtype=np.uint32)
+
+    failed = False
+    for scale in [args.scale] if args.scale else [2, 3, 4]:
+        w, h = args.width * scale, args.height * scale
+        # Nothing is displayed until the end of the first frame
+        cycles = (w + 12) * (h + 3) * (args.frames + 1)
+        pixels = simulate(ScalerPipeline(image, scale), cycles)
+        frames = pixels[:len(pixels) // (w * h) * w * h].reshape(-1, h, w)
+        expected = np.repeat(np.repeat(image, scale, axis=0), scale, axis=1)
+        # The VGA generator sends black for the first pixel of each line
+        ok = len(frames) == args.frames and (frames[:, :, 1:] == expected[:, 1:]).all()
+        failed |= not ok
+        print("Scale {}: {}x{} from {}x{}, {} frames, line buffer {} bits, full frame {} bits: {}".format(
+            scale, w, h, args.width, args.height, len(frames), args.width * 24, w * h * 24,
+            "PASSED" if ok else "FAILED"))
+    print("FAILED" if failed else "PASSED")
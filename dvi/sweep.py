@@ -0,0 +1,153 @@
+import argparse
+import csv
+import os
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from ulx4m import *
+
+from top_vgatest import top_module
+from vga_timings import *
+
+# Runs nextpnr with a number of seeds and placer options for each video mode,
+# keeps the bitstream of the best run that meets timing and records the
+# achieved Fmax of every clock domain in a CSV file.
+#
+# Synthesis (yosys) is done once per mode, only place and route is repeated.
+#
+#   python sweep.py 85F --seeds 8 --jobs 8
+#   python sweep.py 85F --modes "1280x1024@60Hz" "1366x768@60Hz"
+
+# Modes noted in top_vgatest.py as not passing timing.
+DEFAULT_MODES = [
+    '1152x864@60Hz',
+    '1280x800@60Hz',
+    '1366x768@60Hz',
+    '1280x1024@60Hz',
+    '1920x1080@60Hz',
+]
+
+# Info: Max frequency for clock '$glbnet$pixel_clk': 77.27 MHz (PASS at 74.25 MHz)
+FMAX_RE = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([0-9.]+) MHz \((PASS|FAIL) at ([0-9.]+) MHz\)")
+
+
+def clock_name(net):
+    # Turn a nextpnr clock net name into the name of the clock domain
+    name = net.replace("$glbnet$", "")
+    if name.endswith("_clk"):
+        name = name[:-4]
+    return name
+
+
+def parse_fmax(log):
+    # The log reports Fmax after placement and again after routing,
+    # so later entries replace earlier ones.
+    clocks = {}
+    for net, fmax, result, target in FMAX_RE.findall(log):
+        clocks[clock_name(net)] = (float(fmax), float(target), result == "PASS")
+    return clocks
+
+
+def nextpnr_args(platform, name):
+    return [
+        *platform._nextpnr_device_options[platform.device].split(),
+        "--package", platform._nextpnr_package_options[platform.package].upper(),
+        "--speed", platform.speed,
+        "--json", "{}.json".format(name),
+        "--lpf", "{}.lpf".format(name),
+    ]
+
+
+def place_and_route(build_dir, args, tag, seed, placer):
+    nextpnr = os.environ.get("NEXTPNR_ECP5", "nextpnr-ecp5")
+    log = "{}.tim".format(tag)
+    subprocess.run([nextpnr, "--quiet", "--timing-allow-fail", *args,
+                    "--seed", str(seed), "--placer", placer,
+                    "--log", log, "--textcfg", "{}.config".format(tag)],
+                   cwd=build_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    path = os.path.join(build_dir, log)
+    clocks = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            clocks = parse_fmax(f.read())
+    return tag, seed, placer, clocks
+
+
+def score(clocks):
+    # Worst ratio of achieved to required frequency over all clock domains
+    if not clocks:
+        return 0.0
+    return min(fmax / target for fmax, target, _ in clocks.values())
+
+
+def sweep_mode(platform_class, mode, seeds, placers, jobs, root, name="top", encoder_stages=1):
+    platform = platform_class()
+    build_dir = os.path.join(root, re.sub(r"[^0-9A-Za-z]+", "_", mode))
+
+    try:
+        plan = platform.build(top_module(platform, vga_timings[mode], encoder_stages=encoder_stages), name=name, do_build=False)
+    except ValueError as e:
+        # Usually the PLL can not generate the shift clock
+        print(mode, "skipped:", e)
+        return None
+
+    plan.execute_local(build_dir, run_script=False)
+
+    yosys = os.environ.get("YOSYS", "yosys")
+    subprocess.check_call([yosys, "-q", "-l", "{}.rpt".format(name), "{}.ys".format(name)], cwd=build_dir)
+
+    args = nextpnr_args(platform, name)
+    runs = [("{}_{}_{}".format(name, placer, seed), seed, placer) for placer in placers for seed in range(1, seeds + 1)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(place_and_route,
+                                [build_dir] * len(runs), [args] * len(runs),
+                                *zip(*runs)))
+
+    passed = [r for r in results if r[3] and all(p for _, _, p in r[3].values())]
+    best = max(passed or results, key=lambda r: score(r[3]))
+    tag, seed, placer, clocks = best
+
+    if passed:
+        ecppack = os.environ.get("ECPPACK", "ecppack")
+        subprocess.check_call([ecppack, "--compress", "--input", "{}.config".format(tag),
+                               "--bit", "{}.bit".format(name)], cwd=build_dir)
+        print(mode, "passed with placer", placer, "seed", seed, "->", os.path.join(build_dir, name + ".bit"))
+    else:
+        print(mode, "failed timing on all", len(results), "runs")
+
+    return [(mode, clock, target, fmax, ok, seed, placer, len(results), len(passed))
+            for clock, (fmax, target, ok) in sorted(clocks.items())]
+
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    parser.add_argument("--modes", nargs="+", choices=vga_timings.keys(), default=DEFAULT_MODES)
+    parser.add_argument("--seeds", type=int, default=4)
+    parser.add_argument("--placers", nargs="+", default=["heap", "sa"])
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--build-dir", default="build_sweep")
+    parser.add_argument("--csv", default="fmax.csv")
+    parser.add_argument("--encoder-stages", type=int, choices=[1, 2, 3], default=1)
+    args = parser.parse_args()
+
+    rows = []
+    for mode in args.modes:
+        result = sweep_mode(variants[args.variant], mode, args.seeds, args.placers, args.jobs, args.build_dir,
+                            encoder_stages=args.encoder_stages)
+        if result:
+            rows += result
+
+    with open(args.csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["mode", "clock", "target_mhz", "fmax_mhz", "passed", "seed", "placer", "runs", "runs_passed"])
+        writer.writerows(rows)
@@ -0,0 +1,163 @@
+import numpy as np
+
+# NumPy reference for the DVI TMDS 8b/10b code as implemented by
+# TMDSEncoder, working on whole arrays of pixels at once.
+#
+# The running DC bias is kept as the same 4-bit (modulo 16) value that the
+# encoder uses, so the reference is bit-identical to the hardware.
+
+# Control period symbols indexed by (vsync, hsync)
+CONTROL = np.array([0b1101010100, 0b0010101011, 0b0101010100, 0b1010101011], dtype=np.uint16)
+
+BIAS_STATES = 16
+
+# HDMI data island symbols, TERC4 indexed by the 4-bit value
+TERC4 = np.array([0b1010011100, 0b1001100011, 0b1011100100, 0b1011100010,
+                  0b0101110001, 0b0100011110, 0b0110001110, 0b0100111100,
+                  0b1011001100, 0b0100111001, 0b0110011100, 0b1011000110,
+                  0b1010001110, 0b1001110001, 0b0101100011, 0b1011000011], dtype=np.uint16)
+
+# HDMI guard bands for channels 0, 1 and 2
+VIDEO_GUARD  = np.array([0b1011001100, 0b0100110011, 0b1011001100], dtype=np.uint16)
+ISLAND_GUARD = 0b0100110011
+
+
+def popcount8(x):
+    x = np.asarray(x, dtype=np.uint16)
+    return sum((x >> i) & 1 for i in range(8))
+
+
+def transition_minimized(data):
+    """First stage of the encoder: the 9-bit xor or xnor chain."""
+    d = np.asarray(data, dtype=np.uint16)
+    ones = popcount8(d)
+    use_xnor = (ones > 4) | ((ones == 4) & ((d & 1) == 0))
+
+    q = d & 1
+    for i in range(1, 8):
+        bit = ((d >> i) ^ (q >> (i - 1))) & 1
+        bit = np.where(use_xnor, bit ^ 1, bit)
+        q = q | (bit << i)
+
+    return np.where(use_xnor, q, q | 0x100).astype(np.uint16)
+
+
+def encode_step(data, bias):
+    """Encode data in the given 4-bit bias states.
+
+    data and bias are broadcast against each other. Returns the 10-bit
+    symbols and the next bias states.
+    """
+    q_m = transition_minimized(data)
+    bias = np.asarray(bias, dtype=np.int16)
+
+    disparity = (12 + popcount8(q_m & 0xff)).astype(np.int16) & 15
+    q_m8 = ((q_m >> 8) & 1).astype(np.int16)
+    q_inv = ~q_m & 0xff
+
+    no_bias = (bias == 0) | (disparity == 0)
+    same_sign = ((bias >> 3) & 1) == ((disparity >> 3) & 1)
+
+    symbol = np.where(no_bias,
+                      np.where(q_m8 == 1, (q_m & 0xff) | 0x100, q_inv | 0x200),
+                      np.where(same_sign, q_inv | (q_m8 << 8) | 0x200, q_m))
+    next_bias = np.where(no_bias,
+                         np.where(q_m8 == 1, bias + disparity, bias - disparity),
+                         np.where(same_sign, bias + q_m8 - disparity, bias - (1 - q_m8) + disparity))
+
+    return symbol.astype(np.uint16), (next_bias & 15).astype(np.int16)
+
+
+def encode(data, c=0, blank=False, bias=0):
+    """Encode a stream of pixels for one channel.
+
+    data, c and blank are arrays (or scalars) of equal length. Returns the
+    symbols and the bias state left after the last pixel.
+
+    The bias carried from pixel to pixel makes the encoder sequential. Each
+    pixel is turned into a map from bias state to next bias state, and the
+    maps are combined with a parallel prefix scan, so the whole stream is
+    processed with array operations in log2(n) steps.
+    """
+    data = np.atleast_1d(np.asarray(data, dtype=np.uint16))
+    n = len(data)
+    c = np.broadcast_to(np.asarray(c, dtype=np.uint16), (n,))
+    blank = np.broadcast_to(np.asarray(blank, dtype=bool), (n,))
+
+    states = np.arange(BIAS_STATES, dtype=np.int16)[:, None]
+    symbols, next_bias = encode_step(data[None, :], states)
+
+    # Blanking sends a control symbol and resets the bias
+    symbols = np.where(blank, CONTROL[c & 3], symbols)
+    next_bias = np.where(blank, 0, next_bias).astype(np.int16)
+
+    # prefix[s, i]: bias after pixel i when starting pixel 0 in state s
+    prefix = next_bias
+    step = 1
+    while step < n:
+        prefix = np.concatenate([prefix[:, :step],
+                                 np.take_along_axis(prefix[:, step:], prefix[:, :-step], axis=0)], axis=1)
+        step *= 2
+
+    before = np.concatenate([[bias], prefix[bias, :-1]])
+    return symbols[before, np.arange(n)], int(prefix[bias, -1])
+
+
+def decode(symbols):
+    """Decode TMDS symbols.
+
+    Returns (data, c, de): the 8-bit data of video period symbols, the 2-bit
+    control value of control period symbols and a flag that is set for video
+    period symbols.
+    """
+    q = np.asarray(symbols, dtype=np.uint16)
+
+    # Control symbols have more transitions than any data symbol can have,
+    # so they can be recognised directly.
+    c = np.zeros(q.shape, dtype=np.uint8)
+    de = np.ones(q.shape, dtype=bool)
+    for i, code in enumerate(CONTROL):
+        match = q == code
+        c[match] = i
+        de &= ~match
+
+    # Bit 9 set: data bits were inverted to balance DC.
+    word = np.where(q & 0x200, ~q, q) & 0xff
+
+    # Bit 8 set: xor chain, cleared: xnor chain.
+    chain = (word ^ (word << 1)) & 0xfe
+    chain = np.where(q & 0x100, chain, ~chain & 0xfe)
+    data = (chain | (word & 1)).astype(np.uint8)
+
+    return np.where(de, data, 0).astype(np.uint8), c, de
+
+
+def terc4_decode(symbols):
+    """Decode TERC4 symbols. Returns the 4-bit values and a valid flag."""
+    q = np.asarray(symbols, dtype=np.uint16)
+    value = np.zeros(q.shape, dtype=np.uint8)
+    valid = np.zeros(q.shape, dtype=bool)
+    for i, code in enumerate(TERC4):
+        match = q == code
+        value[match] = i
+        valid |= match
+    return value, valid
+
+
+# The BCH(32,24) and BCH(64,56) generator polynomial of the HDMI spec,
+# 1 + x^6 + x^7 + x^8, the bit of each power set
+BCH_GENERATOR = (1 << 8) | (1 << 7) | (1 << 6) | 1
+
+
+def bch_remainder(bits):
+    """Remainder of an HDMI header or subpacket codeword, ECC included, bits in
+    sending order, divided by the generator polynomial: 0 if the ECC is right.
+
+    The first bit sent is the highest power of x, the ECC bits are the lowest.
+    """
+    remainder = 0
+    for bit in bits:
+        remainder = (remainder << 1) | int(bit)
+        if remainder >> 8:
+            remainder ^= BCH_GENERATOR
+    return remainder
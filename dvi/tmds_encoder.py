@@ -2,85 +2,100 @@ from amaranth import *
 from amaranth.build import Platform
 
 
+# Number of ones in each 4-bit value
+POPCOUNT4 = Array(C(bin(i).count("1"), 3) for i in range(16))
+
+
+def popcount(value):
+    # Sum of 4-bit table lookups, one LUT4 per result bit for each nibble
+    return sum(POPCOUNT4[value[i:i + 4]] for i in range(0, len(value), 4))
+
+
 class TMDSEncoder(Elaboratable):
-    def __init__(self):
+    def __init__(self, stages=1): # 1: single cycle, 2-3: pipelined
+        if stages not in (1, 2, 3):
+            raise ValueError("TMDSEncoder stages must be 1, 2 or 3, not {!r}".format(stages))
         self.i_data = Signal(8)
         self.i_c = Signal(2)
         self.i_blank = Signal()
         self.o_encoded = Signal(10)
+        # Configuration
+        self.stages = stages
+        # Pixel clocks from input to o_encoded
+        self.latency = stages
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
+        def register(stage, **signals):
+            # Pipeline register between stages, control signals travel with the data
+            registered = []
+            for name, s in signals.items():
+                r = Signal.like(s, name="{}_s{}".format(name, stage), reset_less=True)
+                m.d.pixel += r.eq(s)
+                registered.append(r)
+            return registered
+
+        data = self.i_data
+        c = self.i_c
+        blank = self.i_blank
+
         xored = Signal(9, reset_less=True)
         xnored = Signal(9, reset_less=True)
         ones = Signal(4, reset_less=True)
         data_word = Signal(9, reset_less=True)
-        data_word_inv = Signal(9, reset_less=True)
         data_word_disparity = Signal(4, reset_less=True)
         dc_bias = Signal(4, reset_less=True)
 
+        # Count how many ones are set in data.
+        m.d.comb += ones.eq(popcount(data))
+
+        if self.stages >= 3:
+            data, c, blank, ones = register(1, data=data, c=c, blank=blank, ones=ones)
+
         m.d.comb += [
-            xored[0].eq(self.i_data[0]),
-            xored[1].eq(self.i_data[1] ^ xored[0]),
-            xored[2].eq(self.i_data[2] ^ xored[1]),
-            xored[3].eq(self.i_data[3] ^ xored[2]),
-            xored[4].eq(self.i_data[4] ^ xored[3]),
-            xored[5].eq(self.i_data[5] ^ xored[4]),
-            xored[6].eq(self.i_data[6] ^ xored[5]),
-            xored[7].eq(self.i_data[7] ^ xored[6]),
+            xored[0].eq(data[0]),
+            xored[1].eq(data[1] ^ xored[0]),
+            xored[2].eq(data[2] ^ xored[1]),
+            xored[3].eq(data[3] ^ xored[2]),
+            xored[4].eq(data[4] ^ xored[3]),
+            xored[5].eq(data[5] ^ xored[4]),
+            xored[6].eq(data[6] ^ xored[5]),
+            xored[7].eq(data[7] ^ xored[6]),
             xored[8].eq(1)
         ]
 
         m.d.comb += [
-            xnored[0].eq(self.i_data[0]),
-            xnored[1].eq(~(self.i_data[1] ^ xnored[0])),
-            xnored[2].eq(~(self.i_data[2] ^ xnored[1])),
-            xnored[3].eq(~(self.i_data[3] ^ xnored[2])),
-            xnored[4].eq(~(self.i_data[4] ^ xnored[3])),
-            xnored[5].eq(~(self.i_data[5] ^ xnored[4])),
-            xnored[6].eq(~(self.i_data[6] ^ xnored[5])),
-            xnored[7].eq(~(self.i_data[7] ^ xnored[6])),
+            xnored[0].eq(data[0]),
+            xnored[1].eq(~(data[1] ^ xnored[0])),
+            xnored[2].eq(~(data[2] ^ xnored[1])),
+            xnored[3].eq(~(data[3] ^ xnored[2])),
+            xnored[4].eq(~(data[4] ^ xnored[3])),
+            xnored[5].eq(~(data[5] ^ xnored[4])),
+            xnored[6].eq(~(data[6] ^ xnored[5])),
+            xnored[7].eq(~(data[7] ^ xnored[6])),
             xnored[8].eq(0)
         ]
 
-        # Count how many ones are set in data.
-        m.d.comb += ones.eq(
-            0b0000 +
-            self.i_data[0] +
-            self.i_data[1] +
-            self.i_data[2] +
-            self.i_data[3] +
-            self.i_data[4] +
-            self.i_data[5] +
-            self.i_data[6] +
-            self.i_data[7]
-        )
-
         # Decide which encoding to use.
-        with m.If((ones > 4) | ((ones == 4) & (self.i_data[0] == 0))):
+        with m.If((ones > 4) | ((ones == 4) & (data[0] == 0))):
             m.d.comb += data_word.eq(xnored)
-            m.d.comb += data_word_inv.eq(~(xnored))
         with m.Else():
             m.d.comb += data_word.eq(xored)
-            m.d.comb += data_word_inv.eq(~(xored))
 
         # Work out the DC bias of the data word.
-        m.d.comb += data_word_disparity.eq(
-            0b1100 +
-            data_word[0] +
-            data_word[1] +
-            data_word[2] +
-            data_word[3] +
-            data_word[4] +
-            data_word[5] +
-            data_word[6] +
-            data_word[7]
-        )
+        m.d.comb += data_word_disparity.eq(0b1100 + popcount(data_word[:8]))
+
+        if self.stages >= 2:
+            data_word, data_word_disparity, c, blank = register(
+                self.stages - 1, data_word=data_word, data_word_disparity=data_word_disparity, c=c, blank=blank)
+
+        data_word_inv = Signal(9, reset_less=True)
+        m.d.comb += data_word_inv.eq(~data_word)
 
         # Work out what the output should be.
-        with m.If(self.i_blank):
-            with m.Switch(self.i_c):
+        with m.If(blank):
+            with m.Switch(c):
                 with m.Case(0b00):
                     m.d.pixel += self.o_encoded.eq(0b1101010100)
                 with m.Case(0b01):
@@ -94,10 +109,10 @@ class TMDSEncoder(Elaboratable):
             with m.If((dc_bias == 0) | (data_word_disparity == 0)):
                 # dataword has no disparity
                 with m.If(data_word[8]):
-                    m.d.pixel += self.o_encoded.eq(Cat(data_word[:8], 0b01))
+                    m.d.pixel += self.o_encoded.eq(Cat(data_word[:8], C(0b01, 2)))
                     m.d.pixel += dc_bias.eq(dc_bias + data_word_disparity)
                 with m.Else():
-                    m.d.pixel += self.o_encoded.eq(Cat(data_word_inv[:8], 0b10))
+                    m.d.pixel += self.o_encoded.eq(Cat(data_word_inv[:8], C(0b10, 2)))
                     m.d.pixel += dc_bias.eq(dc_bias - data_word_disparity)
             with m.Elif(((dc_bias[3] == 0) & (data_word_disparity[3] == 0)) |
                         ((dc_bias[3] == 1) & (data_word_disparity[3] == 1))):
@@ -0,0 +1,126 @@
+import argparse
+import sys
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from tmds_encoder import TMDSEncoder
+from tmds_lut_encoder import TMDSLutEncoder
+from tmds import CONTROL, BIAS_STATES, encode, encode_step, decode
+
+# Exhaustive equivalence check of TMDSEncoder against the NumPy reference
+# in tmds.py.
+#
+# Every reachable DC bias state is entered through the shortest data
+# sequence after a blanking period, then each of the 256 data values and
+# each of the 4 control codes is sent from that state. The simulated
+# symbols are compared with the reference encoding of the same stream and
+# decoded back to check the round trip.
+#
+# The pipelined variants must give the same symbols, only later, and the
+# lookup table encoder (with all 256 values in its ROM) exactly the same.
+#
+#   python tmds_encoder_sim.py
+#   python tmds_encoder_sim.py --stages 3
+#   python tmds_encoder_sim.py --lut
+
+def paths_to_states():
+    # Breadth first search over the bias states, starting from 0 after blanking
+    paths = {0: []}
+    frontier = [0]
+    while frontier:
+        new = []
+        for state in frontier:
+            _, next_bias = encode_step(np.arange(256), state)
+            for data, bias in enumerate(next_bias):
+                if int(bias) not in paths:
+                    paths[int(bias)] = paths[state] + [data]
+                    new.append(int(bias))
+        frontier = new
+    return paths
+
+
+def stimulus():
+    data  = []
+    c     = []
+    blank = []
+
+    def send(d=0, control=0, b=False):
+        data.append(d)
+        c.append(control)
+        blank.append(b)
+
+    paths = paths_to_states()
+    for state, path in sorted(paths.items()):
+        for value in range(256 + len(CONTROL)):
+            send(b=True)
+            for d in path:
+                send(d)
+            if value < 256:
+                send(value)
+            else:
+                send(control=value - 256, b=True)
+
+    return paths, np.array(data), np.array(c), np.array(blank)
+
+
+def simulate(data, c, blank, stages=1, lut=False):
+    if lut:
+        # The 4096 entry ROM compiles to a deeply nested python expression
+        sys.setrecursionlimit(100000)
+        dut = TMDSLutEncoder(range(256))
+        i_data = dut.i_index
+    else:
+        dut = TMDSEncoder(stages=stages)
+        i_data = dut.i_data
+    symbols = np.zeros(len(data), dtype=np.uint16)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-8, domain="pixel")
+
+    def process():
+        for i in range(len(data) + dut.latency):
+            if i < len(data):
+                yield i_data.eq(int(data[i]))
+                yield dut.i_c.eq(int(c[i]))
+                yield dut.i_blank.eq(bool(blank[i]))
+            yield
+            if i >= dut.latency:
+                # The encoder output is registered after the pipeline stages
+                symbols[i - dut.latency] = (yield dut.o_encoded)
+
+    sim.add_sync_process(process, domain="pixel")
+    sim.run()
+
+    return symbols
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", type=int, choices=[1, 2, 3], default=1)
+    parser.add_argument("--lut", action="store_true", help="check TMDSLutEncoder instead")
+    args = parser.parse_args()
+
+    paths, data, c, blank = stimulus()
+    print("Reachable bias states:", sorted(paths), "of", BIAS_STATES)
+    print("Simulating", len(data), "pixels,", "lookup table encoder" if args.lut else
+          "{} stage encoder".format(args.stages))
+
+    symbols = simulate(data, c, blank, args.stages, args.lut)
+    expected, _ = encode(data, c, blank)
+
+    mismatch = np.flatnonzero(symbols != expected)
+    for i in mismatch[:10]:
+        print("Pixel {}: data {:02x} c {} blank {} got {:010b} expected {:010b}".format(
+            i, data[i], c[i], blank[i], symbols[i], expected[i]))
+
+    decoded, control, de = decode(symbols)
+    video = ~blank
+    round_trip = ((decoded[video] == data[video]).all() and (control[blank] == c[blank]).all() and
+                  (de == video).all())
+
+    print("Mismatches:", len(mismatch))
+    print("Decode round trip:", "passed" if round_trip else "FAILED")
+    print("PASSED" if len(mismatch) == 0 and round_trip else "FAILED")
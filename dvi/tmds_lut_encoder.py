@@ -0,0 +1,49 @@
+from amaranth import *
+from amaranth.build import Platform
+
+from tmds import CONTROL, BIAS_STATES, encode_step
+
+
+class TMDSLutEncoder(Elaboratable):
+    # TMDS encoder for sources with few distinct values per channel.
+    #
+    # The symbol and next DC bias of every value in every bias state are
+    # precomputed by the reference model in tmds.py into a small ROM that is
+    # indexed by (value index, bias state). Only the bias register and the
+    # ROM are left in the pixel loop. Output is the same as TMDSEncoder,
+    # with the same latency.
+    def __init__(self, values): # 8-bit data for each index
+        self.i_index = Signal(range(max(len(values), 2)))
+        self.i_c = Signal(2)
+        self.i_blank = Signal()
+        self.o_encoded = Signal(10)
+        # Configuration
+        self.values = list(values)
+        self.latency = 1
+
+    def table(self):
+        # Entry (index << 4) | bias: next bias in bits 10-13, symbol in bits 0-9
+        init = []
+        for value in self.values:
+            symbols, next_bias = encode_step([value] * BIAS_STATES, range(BIAS_STATES))
+            init += [int(s) | (int(b) << 10) for s, b in zip(symbols, next_bias)]
+        return init
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        dc_bias = Signal(4, reset_less=True)
+
+        rom = Memory(width=14, depth=len(self.values) * BIAS_STATES, init=self.table())
+        m.submodules.rom = rd = rom.read_port(domain="comb")
+
+        m.d.comb += rd.addr.eq(Cat(dc_bias, self.i_index))
+
+        with m.If(self.i_blank):
+            m.d.pixel += self.o_encoded.eq(Array(C(int(s), 10) for s in CONTROL)[self.i_c])
+            m.d.pixel += dc_bias.eq(0)
+        with m.Else():
+            m.d.pixel += self.o_encoded.eq(rd.data[:10])
+            m.d.pixel += dc_bias.eq(rd.data[10:])
+
+        return m
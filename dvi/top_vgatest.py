@@ -2,14 +2,29 @@ import argparse
 
 from amaranth import *
 from amaranth.build import *
+from amaranth.lib.cdc import ResetSynchronizer
 from ulx4m import *
 
 from blink import Blink
 from vga2dvid import VGA2DVID
+from scaler import Scaler
+from panel_bridge import PanelBridge
+from panels import PANELS
 from vga import VGA
 from vga_timings import *
 from ecp5pll import ECP5PLL
 
+# SPI panel on the pins of the OLED example, for --panel
+panel_resource = [
+    Resource("panel", 0,
+        Subsignal("clk",  Pins("17", dir="o", conn=("gpio",0))),
+        Subsignal("mosi", Pins("15", dir="o", conn=("gpio",0))),
+        Subsignal("dc",   Pins("13", dir="o", conn=("gpio",0))),
+        Subsignal("resn", Pins("14", dir="o", conn=("gpio",0))),
+        Subsignal("csn",  Pins("12", dir="o", conn=("gpio",0))),
+        Attrs(IO_TYPE="LVCMOS33", DRIVE="4", PULLMODE="UP"))
+]
+
 #  Modes tested on an ASUS monitor:
 #
 #  640x350  @70Hz
@@ -41,11 +56,22 @@ class TopVGATest(Elaboratable):
                  timing: VGATiming, # VGATiming class
                  xadjustf=0, # adjust -3..3 if no picture
                  yadjustf=0, # or to fine-tune f
-                 ddr=True): # False: SDR, True: DDR
+                 ddr=True, # False: SDR, True: DDR
+                 gearbox=False, # With ddr, serialize 10:1 by ODDRX2F at 2.5x pixel clock
+                 encoder_stages=1, # 2 or 3 pipeline the TMDS encoders for high pixel clocks
+                 hdmi=False, # HDMI with a 440Hz test tone at 48kHz
+                 scale=1, # 2, 3 or 4 shows a low resolution pattern through the scaler
+                 panel=None): # A panel class of panels.py mirrors the picture to an SPI panel
         self.o_led = Signal(4)
         self.o_gpdi_dp = Signal(4)
         self.o_user_programn = Signal()
         self.o_wifi_gpio0 = Signal()
+        # SPI panel
+        self.o_panel_clk  = Signal()
+        self.o_panel_mosi = Signal()
+        self.o_panel_dc   = Signal()
+        self.o_panel_csn  = Signal()
+        self.o_panel_resn = Signal()
         # Configuration
         self.timing = timing
         self.x = timing.x
@@ -54,6 +80,15 @@ class TopVGATest(Elaboratable):
         self.xadjustf = xadjustf
         self.yadjustf = yadjustf
         self.ddr = ddr
+        self.gearbox = gearbox
+        self.encoder_stages = encoder_stages
+        self.hdmi = hdmi
+        self.scale = scale
+        self.panel = panel
+        if scale > 1 and (timing.x % scale or timing.y % scale):
+            raise ValueError("{}x{} is not a multiple of scale {}".format(timing.x, timing.y, scale))
+        if gearbox and not ddr:
+            raise ValueError("The gearbox serializer is DDR only")
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -79,11 +114,37 @@ class TopVGATest(Elaboratable):
             pll.register_clkin(clk_in,  platform.default_clk_frequency)
             pll.create_clkout(cd_sync,  platform.default_clk_frequency)
             pll.create_clkout(cd_pixel, pixel_f)
-            pll.create_clkout(cd_shift, pixel_f * 5.0 * (1.0 if self.ddr else 2.0))
 
             platform.add_clock_constraint(cd_sync.clk,  platform.default_clk_frequency)
             platform.add_clock_constraint(cd_pixel.clk, pixel_f)
-            platform.add_clock_constraint(cd_shift.clk, pixel_f * 5.0 * (1.0 if self.ddr else 2.0))
+
+            if (self.gearbox):
+                # The edge clock runs the ODDRX2F serializers at 5x pixel clock,
+                # the fabric side runs at 2.5x from the divided edge clock.
+                m.domains.eclk = cd_eclk = ClockDomain("eclk")
+                pll.create_clkout(cd_eclk, pixel_f * 5.0)
+
+                eclk = Signal()
+                m.submodules.eclksync = Instance("ECLKSYNCB",
+                    i_ECLKI = ClockSignal("eclk"),
+                    i_STOP  = 0b0,
+                    o_ECLKO = eclk)
+                m.submodules.clkdiv = Instance("CLKDIVF",
+                    p_DIV     = "2.0",
+                    i_CLKI    = eclk,
+                    i_RST     = 0b0,
+                    i_ALIGNWD = 0b0,
+                    o_CDIVX   = ClockSignal("shift"))
+
+                # Hold the gearbox in reset until the PLL locks, so it finds
+                # the phase of the divided clock once it is stable
+                m.submodules.shift_rst = ResetSynchronizer(~pll.locked, domain="shift")
+
+                platform.add_clock_constraint(eclk, pixel_f * 5.0)
+                platform.add_clock_constraint(cd_shift.clk, pixel_f * 2.5)
+            else:
+                pll.create_clkout(cd_shift, pixel_f * 5.0 * (1.0 if self.ddr else 2.0))
+                platform.add_clock_constraint(cd_shift.clk, pixel_f * 5.0 * (1.0 if self.ddr else 2.0))
 
             # VGA signal generator.
             vga_r = Signal(8)
@@ -105,21 +166,43 @@ class TopVGATest(Elaboratable):
                 bits_x            = 16, # Play around with the sizes because sometimes
                 bits_y            = 16  # a smaller/larger value will make it pass timing.
             )
-            with m.If(vga.o_beam_y < 400):
+            if (self.scale > 1):
+                # Low resolution pattern, read like a BRAM: 8x8 squares
+                # with a colour gradient, and a one pixel border.
+                m.submodules.scaler = scaler = Scaler(self.x // self.scale, self.y // self.scale, self.scale)
+                src_x = scaler.o_src_x
+                src_y = scaler.o_src_y
+                with m.If(scaler.o_src_en):
+                    with m.If((src_x == 0) | (src_y == 0) | (src_x == self.x // self.scale - 1) |
+                              (src_y == self.y // self.scale - 1)):
+                        m.d.pixel += scaler.i_src_data.eq(0xffffff)
+                    with m.Elif(src_x[3] ^ src_y[3]):
+                        m.d.pixel += scaler.i_src_data.eq(Cat(src_y[:8], src_x[:8], C(0x80, 8)))
+                    with m.Else():
+                        m.d.pixel += scaler.i_src_data.eq(0)
                 m.d.comb += [
-                    vga.i_r.eq(0xff),
-                    vga.i_g.eq(0),
-                    vga.i_b.eq(0)
-                ]
-            with m.Else():
-                m.d.comb += [
-                    vga.i_r.eq(0),
-                    vga.i_g.eq(0xff),
-                    vga.i_b.eq(0)
+                    scaler.i_beam_x.eq(vga.o_beam_x),
+                    scaler.i_beam_y.eq(vga.o_beam_y),
+                    vga.i_r.eq(scaler.o_r),
+                    vga.i_g.eq(scaler.o_g),
+                    vga.i_b.eq(scaler.o_b),
                 ]
+            else:
+                with m.If(vga.o_beam_y < 400):
+                    m.d.comb += [
+                        vga.i_r.eq(0xff),
+                        vga.i_g.eq(0),
+                        vga.i_b.eq(0)
+                    ]
+                with m.Else():
+                    m.d.comb += [
+                        vga.i_r.eq(0),
+                        vga.i_g.eq(0xff),
+                        vga.i_b.eq(0)
+                    ]
             m.d.comb += [
                 vga.i_clk_en.eq(1),
-                vga.i_test_picture.eq(1),
+                vga.i_test_picture.eq(self.scale == 1),
                 vga_r.eq(vga.o_vga_r),
                 vga_g.eq(vga.o_vga_g),
                 vga_b.eq(vga.o_vga_b),
@@ -129,8 +212,11 @@ class TopVGATest(Elaboratable):
             ]
 
             # VGA to digital video converter.
-            tmds = [Signal(2) for i in range(4)]
-            m.submodules.vga2dvid = vga2dvid = VGA2DVID(ddr=self.ddr, shift_clock_synchronizer=False)
+            tmds = [Signal(4 if self.gearbox else 2) for i in range(4)]
+            m.submodules.vga2dvid = vga2dvid = VGA2DVID(ddr="gearbox" if self.gearbox else self.ddr,
+                                                        shift_clock_synchronizer=False,
+                                                        encoder_stages=self.encoder_stages,
+                                                        hdmi=self.hdmi, timing=self.timing)
             m.d.comb += [
                 vga2dvid.i_red.eq(vga_r),
                 vga2dvid.i_green.eq(vga_g),
@@ -144,6 +230,54 @@ class TopVGATest(Elaboratable):
                 tmds[0].eq(vga2dvid.o_blue),
             ]
 
+            if (self.hdmi):
+                # 440Hz square wave, a sample every 48kHz of the pixel clock
+                audio_rate  = 48000
+                half_period = round(audio_rate / 440 / 2)
+                R_rate   = Signal(range(pixel_f + audio_rate))
+                R_tone   = Signal(range(half_period))
+                R_level  = Signal(16, reset=0x2000)
+                R_valid  = Signal()
+
+                with m.If(R_rate >= pixel_f - audio_rate):
+                    m.d.pixel += [
+                        R_rate.eq(R_rate + audio_rate - pixel_f),
+                        R_valid.eq(1),
+                        R_tone.eq(Mux(R_tone == half_period - 1, 0, R_tone + 1)),
+                    ]
+                    with m.If(R_tone == half_period - 1):
+                        m.d.pixel += R_level.eq(-R_level)
+                with m.Else():
+                    m.d.pixel += R_rate.eq(R_rate + audio_rate)
+                    with m.If(vga2dvid.o_audio_ready):
+                        m.d.pixel += R_valid.eq(0)
+
+                m.d.comb += [
+                    vga2dvid.i_audio_left.eq(R_level),
+                    vga2dvid.i_audio_right.eq(R_level),
+                    vga2dvid.i_audio_valid.eq(R_valid),
+                ]
+
+            if (self.panel):
+                # Mirror of the picture, scaled down to the panel, sent in
+                # the sync domain, as the PLL has no clock output left
+                m.submodules.panel_bridge = bridge = PanelBridge(self.panel(), self.x, self.y,
+                                                                 capture_domain="pixel")
+                m.d.comb += [
+                    bridge.i_clk_pixel_ena.eq(1),
+                    bridge.i_hsync.eq(vga_hsync),
+                    bridge.i_vsync.eq(vga_vsync),
+                    bridge.i_blank.eq(vga_blank),
+                    bridge.i_r.eq(vga_r),
+                    bridge.i_g.eq(vga_g),
+                    bridge.i_b.eq(vga_b),
+                    self.o_panel_clk.eq(bridge.o_spi_clk),
+                    self.o_panel_mosi.eq(bridge.o_spi_mosi),
+                    self.o_panel_dc.eq(bridge.o_spi_dc),
+                    self.o_panel_csn.eq(bridge.o_spi_csn),
+                    self.o_panel_resn.eq(bridge.o_spi_resn),
+                ]
+
             # LED blinky
             counter_width = 28
             countblink = Signal(4)
@@ -156,7 +290,20 @@ class TopVGATest(Elaboratable):
                 self.o_led[2].eq(vga_blank),
             ]
 
-            if (self.ddr):
+            if (self.gearbox):
+                # 4-bit words from the gearbox of VGA2DVID to 4:1 vendor
+                # specific DDR modules.
+                for i in range(4):
+                    m.submodules["ddrx2_{}".format(i)] = Instance("ODDRX2F",
+                        i_SCLK = ClockSignal("shift"),
+                        i_ECLK = eclk,
+                        i_RST  = 0b0,
+                        i_D0   = tmds[i][0],
+                        i_D1   = tmds[i][1],
+                        i_D2   = tmds[i][2],
+                        i_D3   = tmds[i][3],
+                        o_Q    = self.o_gpdi_dp[i])
+            elif (self.ddr):
                 # Vendor specific DDR modules.
                 # Convert SDR 2-bit input to DDR clocked 1-bit output (single-ended)
                 # onboard GPDI.
@@ -195,23 +342,10 @@ class TopVGATest(Elaboratable):
         return m
 
 
-if __name__ == "__main__":
-    variants = {
-        '12F': ULX4M_12F_Platform,
-        '45F': ULX4M_45F_Platform,
-        '85F': ULX4M_85F_Platform
-    }
-
-    # Figure out which FPGA variant we want to target...
-    parser = argparse.ArgumentParser()
-    parser.add_argument('variant', choices=variants.keys())
-    parser.add_argument("--tool", default="fujprog")
-    args = parser.parse_args()
-
-    platform = variants[args.variant]()
-
+def top_module(platform, timing, ddr=True, gearbox=False, encoder_stages=1, hdmi=False, scale=1, panel=None):
     m = Module()
-    m.submodules.top = top = TopVGATest(timing=vga_timings['1280x800@60Hz CVT-RB'])
+    m.submodules.top = top = TopVGATest(timing=timing, ddr=ddr, gearbox=gearbox, encoder_stages=encoder_stages,
+                                        hdmi=hdmi, scale=scale, panel=panel)
 
     leds = [platform.request("led", 0),
             platform.request("led", 1),
@@ -233,4 +367,43 @@ if __name__ == "__main__":
     for i in range(len(gpdi)):
         m.d.comb += gpdi[i].p.eq(top.o_gpdi_dp[i])
 
+    if panel:
+        platform.add_resources(panel_resource)
+        spi_panel = platform.request("panel")
+        m.d.comb += [
+            spi_panel.clk .eq(top.o_panel_clk),
+            spi_panel.mosi.eq(top.o_panel_mosi),
+            spi_panel.dc  .eq(top.o_panel_dc),
+            spi_panel.resn.eq(top.o_panel_resn),
+            spi_panel.csn .eq(top.o_panel_csn)
+        ]
+
+    return m
+
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    parser.add_argument("--tool", default="fujprog")
+    parser.add_argument("--mode", choices=vga_timings.keys(), default='1280x800@60Hz CVT-RB')
+    parser.add_argument("--encoder-stages", type=int, choices=[1, 2, 3], default=1)
+    parser.add_argument("--gearbox", action="store_true", help="10:1 serializer with ODDRX2F")
+    parser.add_argument("--hdmi", action="store_true", help="HDMI with a test tone")
+    parser.add_argument("--scale", type=int, choices=[1, 2, 3, 4], default=1, help="show a scaled pattern")
+    parser.add_argument("--panel", choices=PANELS.keys(), default=None, help="mirror to an SPI panel")
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+
+    m = top_module(platform, vga_timings[args.mode], gearbox=args.gearbox,
+                   encoder_stages=args.encoder_stages, hdmi=args.hdmi, scale=args.scale,
+                   panel=PANELS[args.panel] if args.panel else None)
+
     platform.build(m, do_program=True, nextpnr_opts="--timing-allow-fail", program_opts={"tool":args.tool})
@@ -54,8 +54,10 @@ class VGA(Elaboratable):
         self.bits_x           = bits_x
         self.bits_y           = bits_y
 
-    def elaborate(self, platform: Platform) -> Module:
-        m = Module()
+    def events(self, m, CounterX, CounterY):
+        # Conditions for the counters to be at each point of the frame.
+        # x_* and end_x must be set while CounterX is at the point, y_* on
+        # the first pixel of the line at least and end_y at the end of the line.
 
         # Constants
         C_hblank_on  = C(self.resolution_x - 1, unsigned(self.bits_x))
@@ -73,6 +75,22 @@ class VGA(Elaboratable):
         # frame y = 480 + 10 + 2 + 33 = 525
         # refresh rate = pixel clock / (frame x * frame y) = 25 MHz / (800 * 525) = 59.52 Hz
 
+        return dict(
+            x_hblank_on  = CounterX == C_hblank_on,
+            x_hblank_off = CounterX == C_hblank_off,
+            x_hsync_on   = CounterX == C_hsync_on,
+            x_hsync_off  = CounterX == C_hsync_off,
+            end_x        = CounterX == C_frame_x,
+            y_vblank_on  = CounterY == C_vblank_on,
+            y_vblank_off = CounterY == C_vblank_off,
+            y_vsync_on   = CounterY == C_vsync_on,
+            y_vsync_off  = CounterY == C_vsync_off,
+            end_y        = CounterY == C_frame_y,
+        )
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
         # Internal signals
         CounterX      = Signal(self.bits_x)
         CounterY      = Signal(self.bits_y)
@@ -94,11 +112,13 @@ class VGA(Elaboratable):
         T             = Signal(8)
         Z             = Signal(6)
 
+        event = self.events(m, CounterX, CounterY)
+
         with m.If(self.i_clk_en):
-            with m.If(CounterX == C_frame_x):
+            with m.If(event["end_x"]):
                 m.d.pixel += CounterX.eq(0)
 
-                with m.If(CounterY == C_frame_y):
+                with m.If(event["end_y"]):
                     m.d.pixel += CounterY.eq(0)
                 with m.Else():
                     m.d.pixel += CounterY.eq(CounterY + 1)
@@ -116,34 +136,34 @@ class VGA(Elaboratable):
         ]
 
         # Generate sync and blank.
-        with m.If(CounterX == C_hblank_on):
+        with m.If(event["x_hblank_on"]):
             m.d.pixel += [
                 R_blank_early.eq(1),
                 R_disp_early.eq(0)
             ]
-        with m.Elif(CounterX == C_hblank_off):
+        with m.Elif(event["x_hblank_off"]):
             m.d.pixel += [
                 R_blank_early.eq(R_vblank),
                 R_disp_early.eq(R_vdisp)
             ]
-        with m.If(CounterX == C_hsync_on):
+        with m.If(event["x_hsync_on"]):
             m.d.pixel += R_hsync.eq(1)
-        with m.Elif(CounterX == C_hsync_off):
+        with m.Elif(event["x_hsync_off"]):
             m.d.pixel += R_hsync.eq(0)
 
-        with m.If(CounterY == C_vblank_on):
+        with m.If(event["y_vblank_on"]):
             m.d.pixel += [
                 R_vblank.eq(1),
                 R_vdisp.eq(0)
             ]
-        with m.Elif(CounterY == C_vblank_off):
+        with m.Elif(event["y_vblank_off"]):
             m.d.pixel += [
                 R_vblank.eq(0),
                 R_vdisp.eq(1)
             ]
-        with m.If(CounterY == C_vsync_on):
+        with m.If(event["y_vsync_on"]):
             m.d.pixel += R_vsync.eq(1)
-        with m.Elif(CounterY == C_vsync_off):
+        with m.Elif(event["y_vsync_off"]):
             m.d.pixel += R_vsync.eq(0)
 
         # Test picture generator
@@ -2,6 +2,8 @@ from amaranth import *
 from amaranth.build import Platform
 
 from tmds_encoder import TMDSEncoder
+from gearbox import Gearbox
+from hdmi import DataIslands, VIDEO_GUARD, PREAMBLE_LENGTH, GUARD_LENGTH, island_length
 
 
 class VGA2DVID(Elaboratable):
@@ -9,29 +11,66 @@ class VGA2DVID(Elaboratable):
                  shift_clock_synchronizer = True,  # Try to get o_clk in sync with 'pixel'
                  parallel                 = True,  # Default output parallel data
                  serial                   = True,  # Default output serial data
-                 ddr                      = False, # Default use SDR for serial data
-                 depth                    = 8):
+                 ddr                      = False, # Default use SDR for serial data, "gearbox" for ODDRX2F
+                 depth                    = 8,
+                 encoder_stages           = 1,     # TMDS encoder pipeline stages, 1 to 3
+                 lut                      = False, # Encode the depth bits by ROM lookup
+                 palette                  = None,  # 24-bit colours selected by i_index, ROM lookup
+                 hdmi                     = False, # Add HDMI data islands (audio and InfoFrames)
+                 timing                   = None,  # VGATiming, needed for HDMI
+                 vic                      = 0,     # CEA-861 video identification code for HDMI
+                 audio_rate               = 48000):
         self.i_red = Signal(depth)
         self.i_green = Signal(depth)
         self.i_blue = Signal(depth)
         self.i_blank = Signal()
         self.i_hsync = Signal()
         self.i_vsync = Signal()
+        # Colour index, used instead of i_red, i_green and i_blue with a palette
+        self.i_index = Signal(range(max(len(palette), 2)) if palette else 1)
+        # HDMI audio samples, written into a FIFO
+        self.i_audio_left = Signal(16)
+        self.i_audio_right = Signal(16)
+        self.i_audio_valid = Signal()
+        self.o_audio_ready = Signal()
         # Parallel outputs
         self.o_red_par = Signal(10)
         self.o_green_par = Signal(10)
         self.o_blue_par = Signal(10)
-        # Serial outputs
-        self.o_red = Signal(2)
-        self.o_green = Signal(2)
-        self.o_blue = Signal(2)
-        self.o_clk = Signal(2)
+        # Serial outputs, 4 bits for the ODDRX2F with ddr="gearbox"
+        serial_bits = 4 if ddr == "gearbox" else 2
+        self.o_red = Signal(serial_bits)
+        self.o_green = Signal(serial_bits)
+        self.o_blue = Signal(serial_bits)
+        self.o_clk = Signal(serial_bits)
         # Configuration
         self.shift_clock_synchronizer = shift_clock_synchronizer
         self.parallel = parallel
         self.serial = serial
         self.ddr = ddr
+        self.gearbox = ddr == "gearbox"
         self.depth = depth
+        self.encoder_stages = encoder_stages
+        self.lut = lut
+        self.palette = palette
+        self.hdmi = hdmi
+        self.timing = timing
+        self.vic = vic
+        self.audio_rate = audio_rate
+        # Pixel clocks from inputs to parallel outputs, HDMI looks ahead for
+        # the start of video to send the video preamble and guard band
+        self.lookahead = PREAMBLE_LENGTH + GUARD_LENGTH if hdmi else 0
+        self.latency = (1 if lut or palette else encoder_stages) + 1 + self.lookahead
+
+        if hdmi:
+            if timing is None:
+                raise ValueError("VGA2DVID needs the video timing for HDMI")
+            # Data islands start with hsync, and must end at least 12 pixels
+            # before the video preamble
+            needed = 1 + island_length(2) + 12 + PREAMBLE_LENGTH + GUARD_LENGTH
+            if timing.h_sync_pulse + timing.h_back_porch < needed:
+                raise ValueError("HDMI data islands need {} pixels from the start of hsync to video, {}x{} has {}"
+                                 .format(needed, timing.x, timing.y, timing.h_sync_pulse + timing.h_back_porch))
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -64,17 +103,37 @@ class VGA2DVID(Elaboratable):
         green_d = Signal(8)
         blue_d  = Signal(8)
 
-        m.d.comb += c_blue.eq(Cat(self.i_hsync, self.i_vsync))
-        m.d.comb += red_d[8 - self.depth:8].eq(self.i_red[8 - self.depth:8])
-        m.d.comb += green_d[8 - self.depth:8].eq(self.i_green[8 - self.depth:8])
-        m.d.comb += blue_d[8 - self.depth:8].eq(self.i_blue[8 - self.depth:8])
+        red   = self.i_red
+        green = self.i_green
+        blue  = self.i_blue
+        index = self.i_index
+        hsync = self.i_hsync
+        vsync = self.i_vsync
+        blank = self.i_blank
+
+        if (self.hdmi):
+            # Delay the inputs, so the start of video is known in advance.
+            # blank_ahead[n] is blank n + 1 pixels ahead.
+            names = ("red", "green", "blue", "index", "hsync", "vsync", "blank")
+            blank_ahead = []
+            for i in range(self.lookahead):
+                inputs  = (red, green, blue, index, hsync, vsync, blank)
+                delayed = [Signal.like(s, name="{}_d{}".format(n, i)) for n, s in zip(names, inputs)]
+                m.d.pixel += [d.eq(s) for d, s in zip(delayed, inputs)]
+                blank_ahead.insert(0, blank)
+                red, green, blue, index, hsync, vsync, blank = delayed
+
+        m.d.comb += c_blue.eq(Cat(hsync, vsync))
+        m.d.comb += red_d[8 - self.depth:8].eq(red)
+        m.d.comb += green_d[8 - self.depth:8].eq(green)
+        m.d.comb += blue_d[8 - self.depth:8].eq(blue)
 
         # Fill vacant low bits with value repeated (so min/max is always 0 or 255).
         if (self.depth < 8):
             for i in range(8 - self.depth):
-                m.d.comb += red_d[i].eq(self.i_red[0])
-                m.d.comb += green_d[i].eq(self.i_green[0])
-                m.d.comb += blue_d[i].eq(self.i_blue[0])
+                m.d.comb += red_d[i].eq(red[0])
+                m.d.comb += green_d[i].eq(green[0])
+                m.d.comb += blue_d[i].eq(blue[0])
 
         if (self.shift_clock_synchronizer):
             # Sampler verifies if shift_clock state is synchronous with pixel clock
@@ -92,27 +151,128 @@ class VGA2DVID(Elaboratable):
             with m.Else():
                 m.d.shift += R_shift_clock_synchronizer.eq(0)
 
-        m.submodules.u21 = u21 = TMDSEncoder()
-        m.submodules.u22 = u22 = TMDSEncoder()
-        m.submodules.u23 = u23 = TMDSEncoder()
-
-        m.d.comb += [
-            u21.i_data.eq(red_d),
-            u21.i_c.eq(C_RED),
-            u21.i_blank.eq(self.i_blank),
-            encoded_red.eq(u21.o_encoded),
+        if self.palette or self.lut:
+            # Only imported when used, as its table is built with NumPy
+            from tmds_lut_encoder import TMDSLutEncoder
 
-            u22.i_data.eq(green_d),
-            u22.i_c.eq(C_GREEN),
-            u22.i_blank.eq(self.i_blank),
-            encoded_green.eq(u22.o_encoded),
+        if self.palette:
+            # One ROM entry per palette colour and bias state
+            m.submodules.u21 = u21 = TMDSLutEncoder([(c >> 16) & 0xff for c in self.palette])
+            m.submodules.u22 = u22 = TMDSLutEncoder([(c >> 8) & 0xff for c in self.palette])
+            m.submodules.u23 = u23 = TMDSLutEncoder([c & 0xff for c in self.palette])
+            m.d.comb += [
+                u21.i_index.eq(index),
+                u22.i_index.eq(index),
+                u23.i_index.eq(index),
+            ]
+        elif self.lut:
+            # One ROM entry per depth bit value and bias state, with the
+            # vacant low bits filled as above
+            values = [(v << (8 - self.depth)) | (((1 << (8 - self.depth)) - 1) if v & 1 else 0)
+                      for v in range(1 << self.depth)]
+            m.submodules.u21 = u21 = TMDSLutEncoder(values)
+            m.submodules.u22 = u22 = TMDSLutEncoder(values)
+            m.submodules.u23 = u23 = TMDSLutEncoder(values)
+            m.d.comb += [
+                u21.i_index.eq(red),
+                u22.i_index.eq(green),
+                u23.i_index.eq(blue),
+            ]
+        else:
+            # The encoders carry blank and the control bits (hsync, vsync) through
+            # their pipeline stages, so sync stays aligned with the pixel data.
+            m.submodules.u21 = u21 = TMDSEncoder(stages=self.encoder_stages)
+            m.submodules.u22 = u22 = TMDSEncoder(stages=self.encoder_stages)
+            m.submodules.u23 = u23 = TMDSEncoder(stages=self.encoder_stages)
+            m.d.comb += [
+                u21.i_data.eq(red_d),
+                u22.i_data.eq(green_d),
+                u23.i_data.eq(blue_d),
+            ]
 
-            u23.i_data.eq(blue_d),
+        m.d.comb += [
+            u21.i_blank.eq(blank),
+            u22.i_blank.eq(blank),
             u23.i_c.eq(c_blue),
-            u23.i_blank.eq(self.i_blank),
-            encoded_blue.eq(u23.o_encoded),
+            u23.i_blank.eq(blank),
         ]
 
+        if (self.hdmi):
+            m.submodules.islands = islands = DataIslands(self.timing.pixel_freq, audio_rate=self.audio_rate,
+                                                         vic=self.vic)
+            m.d.comb += [
+                islands.i_hsync.eq(hsync),
+                islands.i_vsync.eq(vsync),
+                islands.i_audio_left.eq(self.i_audio_left),
+                islands.i_audio_right.eq(self.i_audio_right),
+                islands.i_audio_valid.eq(self.i_audio_valid),
+                self.o_audio_ready.eq(islands.o_audio_ready),
+            ]
+
+            # The last 10 pixels of blanking before video are the video
+            # preamble (control bits of channel 1 and 2 set to 01 and 00)
+            # and the video guard band.
+            video_guard    = Signal()
+            video_preamble = Signal()
+            m.d.comb += [
+                video_guard.eq(blank & ~blank_ahead[GUARD_LENGTH - 1]),
+                video_preamble.eq(blank & ~blank_ahead[-1] & ~video_guard),
+            ]
+            with m.If(video_preamble):
+                m.d.comb += [
+                    u21.i_c.eq(0b00),
+                    u22.i_c.eq(0b01),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    u21.i_c.eq(islands.o_c2),
+                    u22.i_c.eq(islands.o_c1),
+                ]
+
+            # Guard bands and packets replace the encoder output, delayed
+            # by the encoder latency
+            replace = Signal()
+            symbols = Signal(30)
+            with m.If(video_guard):
+                m.d.comb += [
+                    replace.eq(1),
+                    symbols.eq(Cat(C(VIDEO_GUARD[0], 10), C(VIDEO_GUARD[1], 10), C(VIDEO_GUARD[2], 10))),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    replace.eq(islands.o_island),
+                    symbols.eq(Cat(islands.o_ch0, islands.o_ch1, islands.o_ch2)),
+                ]
+            for i in range(u21.latency):
+                replace_d = Signal(name="replace_d{}".format(i))
+                symbols_d = Signal(30, name="symbols_d{}".format(i))
+                m.d.pixel += [
+                    replace_d.eq(replace),
+                    symbols_d.eq(symbols),
+                ]
+                replace, symbols = replace_d, symbols_d
+
+            with m.If(replace):
+                m.d.comb += [
+                    encoded_blue.eq(symbols[:10]),
+                    encoded_green.eq(symbols[10:20]),
+                    encoded_red.eq(symbols[20:]),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    encoded_red.eq(u21.o_encoded),
+                    encoded_green.eq(u22.o_encoded),
+                    encoded_blue.eq(u23.o_encoded),
+                ]
+        else:
+            m.d.comb += [
+                u21.i_c.eq(C_RED),
+                u22.i_c.eq(C_GREEN),
+                encoded_red.eq(u21.o_encoded),
+                encoded_green.eq(u22.o_encoded),
+                encoded_blue.eq(u23.o_encoded),
+            ]
+
         m.d.pixel += [
             latched_red.eq(encoded_red),
             latched_green.eq(encoded_green),
@@ -151,7 +311,7 @@ class VGA2DVID(Elaboratable):
                     m.d.shift += R_sync_fail.eq(R_sync_fail + 1)
 
         # DDR
-        if (self.serial and self.ddr):
+        if (self.serial and self.ddr and not self.gearbox):
             with m.If(shift_clock[4:6] == SHIFT_CLOCK_INITIAL[4:6]):
                 m.d.shift += [
                     shift_red.eq(latched_red),
@@ -176,10 +336,25 @@ class VGA2DVID(Elaboratable):
                 with m.Else():
                     m.d.shift += R_sync_fail.eq(R_sync_fail + 1)
 
+        # Gearbox: two pixel words as five 4-bit words for ODDRX2F, with the
+        # shift domain at 2.5x the pixel clock
+        if (self.serial and self.gearbox):
+            m.submodules.gearbox = gearbox = Gearbox(channels=4)
+            m.d.comb += [
+                gearbox.i_data[3].eq(SHIFT_CLOCK_INITIAL),
+                gearbox.i_data[2].eq(latched_red),
+                gearbox.i_data[1].eq(latched_green),
+                gearbox.i_data[0].eq(latched_blue),
+                self.o_clk.eq(gearbox.o_data[3]),
+                self.o_red.eq(gearbox.o_data[2]),
+                self.o_green.eq(gearbox.o_data[1]),
+                self.o_blue.eq(gearbox.o_data[0]),
+            ]
+
         # SDR: use only bit 0 from each o_* channel
         # DDR: 2 bits per 1 clock period
         # (one bit output on rising edge, other on falling edge of shift clock)
-        if (self.serial):
+        if (self.serial and not self.gearbox):
             m.d.comb += [
                 self.o_red.eq(shift_red[:2]),
                 self.o_green.eq(shift_green[:2]),
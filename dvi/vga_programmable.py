@@ -0,0 +1,131 @@
+from amaranth import *
+from amaranth.build import Platform
+
+from vga import VGA
+
+# Mode registers. The first eight hold the counter value one pixel (or
+# line) before each point of the frame, so the comparisons are registered
+# ahead of time, the last one holds the last line of the frame.
+REGISTERS = [
+    "hblank_on", "hsync_on", "hsync_off", "hblank_off",
+    "vblank_on", "vsync_on", "vsync_off", "vblank_off",
+    "frame_y",
+]
+
+
+def mode_registers(timing):
+    """Mode register values for a VGATiming, in the order of REGISTERS."""
+    h_sync  = timing.x + timing.h_front_porch
+    h_total = h_sync + timing.h_sync_pulse + timing.h_back_porch
+    v_sync  = timing.y + timing.v_front_porch
+    v_total = v_sync + timing.v_sync_pulse + timing.v_back_porch
+    return [timing.x - 2, h_sync - 2, h_sync + timing.h_sync_pulse - 2, h_total - 2,
+            timing.y - 2, v_sync - 2, v_sync + timing.v_sync_pulse - 2, v_total - 2,
+            v_total - 1]
+
+
+# VGA generator with the video mode in registers instead of constants.
+#
+# The first mode is used after reset. Any of the modes can be loaded from
+# a ROM with i_mode and i_load, and single registers can be written with
+# i_reg_addr, i_reg_data and i_reg_we, for example from an SPI slave, with
+# values from mode_registers(). The counter widths fit the largest mode,
+# with at least 8 bits for the test picture.
+#
+# All comparisons with the mode registers are registered a pixel ahead,
+# so the counters only have an incrementer and a flag in their path.
+# A new mode takes effect at once, the frame it is loaded in is invalid.
+class ProgrammableVGA(VGA):
+    def __init__(self,
+                 modes, # List of VGATiming
+                 dbl_x = False,
+                 dbl_y = False):
+        values = [mode_registers(timing) for timing in modes]
+        first  = modes[0]
+        super().__init__(
+            resolution_x      = first.x,
+            hsync_front_porch = first.h_front_porch,
+            hsync_pulse       = first.h_sync_pulse,
+            hsync_back_porch  = first.h_back_porch,
+            resolution_y      = first.y,
+            vsync_front_porch = first.v_front_porch,
+            vsync_pulse       = first.v_sync_pulse,
+            vsync_back_porch  = first.v_back_porch,
+            bits_x            = max(8, max(v[3] + 1 for v in values).bit_length()),
+            bits_y            = max(8, max(v[8] for v in values).bit_length()),
+            dbl_x             = dbl_x,
+            dbl_y             = dbl_y)
+        self.i_mode     = Signal(range(max(len(modes), 2)))
+        self.i_load     = Signal()
+        self.i_reg_addr = Signal(range(len(REGISTERS)))
+        self.i_reg_data = Signal(max(self.bits_x, self.bits_y))
+        self.i_reg_we   = Signal()
+        self.o_loading  = Signal()
+        # Configuration
+        self.modes  = modes
+        self.values = values
+
+    def events(self, m, CounterX, CounterY):
+        width = len(self.i_reg_data)
+        regs  = [Signal(width, name="R_" + name, reset=value) for name, value in zip(REGISTERS, self.values[0])]
+        (R_hblank_on, R_hsync_on, R_hsync_off, R_hblank_off,
+         R_vblank_on, R_vsync_on, R_vsync_off, R_vblank_off, R_frame_y) = regs
+
+        # Mode ROM, read one register a clock
+        rom = Memory(width=width, depth=len(self.modes) * len(REGISTERS), init=sum(self.values, []))
+        m.submodules.mode_rom = rd = rom.read_port(domain="pixel")
+
+        R_loading = Signal()
+        R_mode    = Signal.like(self.i_mode)
+        R_index   = Signal(range(len(REGISTERS) + 1))
+
+        m.d.comb += [
+            rd.addr.eq(R_mode * len(REGISTERS) + R_index),
+            self.o_loading.eq(R_loading),
+        ]
+
+        with m.If(self.i_load & ~R_loading):
+            m.d.pixel += [
+                R_loading.eq(1),
+                R_mode.eq(self.i_mode),
+                R_index.eq(0),
+            ]
+        with m.Elif(R_loading):
+            m.d.pixel += R_index.eq(R_index + 1)
+            with m.If(R_index != 0):
+                m.d.pixel += Array(regs)[R_index - 1].eq(rd.data)
+            with m.If(R_index == len(REGISTERS)):
+                m.d.pixel += R_loading.eq(0)
+        with m.Elif(self.i_reg_we):
+            m.d.pixel += Array(regs)[self.i_reg_addr].eq(self.i_reg_data)
+
+        # Horizontal flags are set while CounterX is at the point
+        x_flags = [Signal(name="R_x_" + name) for name in REGISTERS[:4]]
+        with m.If(self.i_clk_en):
+            m.d.pixel += [flag.eq(CounterX == reg) for flag, reg in zip(x_flags, regs[:4])]
+        R_x_hblank_on, R_x_hsync_on, R_x_hsync_off, R_x_hblank_off = x_flags
+
+        # Vertical flags are set during the line before the point, and
+        # used on the first pixel of the line
+        y_flags = [Signal(name="R_y_" + name) for name in REGISTERS[4:8]]
+        R_line_start = Signal()
+        R_end_y      = Signal()
+        m.d.pixel += [flag.eq(CounterY == reg) for flag, reg in zip(y_flags, regs[4:8])]
+        m.d.pixel += [
+            R_line_start.eq(self.i_clk_en & R_x_hblank_off),
+            R_end_y.eq(CounterY == R_frame_y),
+        ]
+        R_y_vblank_on, R_y_vsync_on, R_y_vsync_off, R_y_vblank_off = y_flags
+
+        return dict(
+            x_hblank_on  = R_x_hblank_on,
+            x_hblank_off = R_x_hblank_off,
+            x_hsync_on   = R_x_hsync_on,
+            x_hsync_off  = R_x_hsync_off,
+            end_x        = R_x_hblank_off,
+            y_vblank_on  = R_line_start & R_y_vblank_on,
+            y_vblank_off = R_line_start & R_y_vblank_off,
+            y_vsync_on   = R_line_start & R_y_vsync_on,
+            y_vsync_off  = R_line_start & R_y_vsync_off,
+            end_y        = R_end_y,
+        )
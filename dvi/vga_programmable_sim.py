@@ -0,0 +1,160 @@
+import argparse
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from vga import VGA
+from vga_programmable import ProgrammableVGA, REGISTERS, mode_registers
+from vga_timings import VGATiming
+
+# Simulation of the programmable VGA generator against VGA with constant
+# timing, with small modes.
+#
+# After reset, ProgrammableVGA must give the same outputs as VGA with its
+# first mode, from the first clock. Then the second mode is loaded from the
+# ROM with i_load, and a third one, not in the ROM, is written register by
+# register with i_reg_we. The frame each mode is loaded in is invalid, the
+# frames after it must be those of VGA with the mode, from the start of a
+# frame.
+#
+#   python vga_programmable_sim.py
+#   python vga_programmable_sim.py --frames 4
+
+MODES = [
+    VGATiming(x=16, y=8, refresh_rate=0, pixel_freq=0, h_front_porch=2, h_sync_pulse=3, h_back_porch=4,
+              v_front_porch=1, v_sync_pulse=2, v_back_porch=2),
+    VGATiming(x=24, y=10, refresh_rate=0, pixel_freq=0, h_front_porch=3, h_sync_pulse=2, h_back_porch=5,
+              v_front_porch=2, v_sync_pulse=1, v_back_porch=3),
+]
+REG_MODE = VGATiming(x=12, y=6, refresh_rate=0, pixel_freq=0, h_front_porch=1, h_sync_pulse=2, h_back_porch=3,
+                     v_front_porch=1, v_sync_pulse=1, v_back_porch=1)
+
+
+def frame_clocks(timing):
+    return (timing.x + timing.h_front_porch + timing.h_sync_pulse + timing.h_back_porch) * \
+           (timing.y + timing.v_front_porch + timing.v_sync_pulse + timing.v_back_porch)
+
+
+def sample(vga):
+    """The outputs of a VGA generator this clock"""
+    values = []
+    for signal in (vga.o_beam_x, vga.o_beam_y, vga.o_vga_hsync, vga.o_vga_vsync, vga.o_vga_blank,
+                   vga.o_vga_de, vga.o_vga_r, vga.o_vga_g, vga.o_vga_b):
+        values.append((yield signal))
+    return tuple(values)
+
+
+def simulate(dut, control):
+    """Runs control(dut, samples) in the pixel domain, with the test picture
+    on, returns the outputs of every clock"""
+    m = Module()
+    m.domains.pixel = ClockDomain("pixel")
+    m.submodules.vga = dut
+
+    samples = []
+
+    sim = Simulator(m)
+    sim.add_clock(4e-8, domain="pixel")
+
+    def process():
+        yield dut.i_clk_en.eq(1)
+        yield dut.i_test_picture.eq(1)
+        yield from control(dut, samples)
+    sim.add_sync_process(process, domain="pixel")
+    sim.run()
+
+    return samples
+
+
+def reference(timing, bits_x, bits_y, clocks):
+    dut = VGA(
+        resolution_x      = timing.x,
+        hsync_front_porch = timing.h_front_porch,
+        hsync_pulse       = timing.h_sync_pulse,
+        hsync_back_porch  = timing.h_back_porch,
+        resolution_y      = timing.y,
+        vsync_front_porch = timing.v_front_porch,
+        vsync_pulse       = timing.v_sync_pulse,
+        vsync_back_porch  = timing.v_back_porch,
+        bits_x            = bits_x,
+        bits_y            = bits_y)
+
+    def control(dut, samples):
+        for _ in range(clocks):
+            yield
+            samples.append((yield from sample(dut)))
+
+    return simulate(dut, control)
+
+
+def frame_starts(samples, start):
+    """Indexes of the first clock of each frame from start"""
+    return [i for i in range(start, len(samples)) if samples[i][:2] == (0, 0)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=2, help="compared for each mode")
+    args = parser.parse_args()
+
+    dut = ProgrammableVGA(MODES)
+    marks = {}
+
+    def control(dut, samples):
+        def run(clocks):
+            for _ in range(clocks):
+                yield
+                samples.append((yield from sample(dut)))
+
+        def loaded(name, timing):
+            # Up to a frame of counters wrapping at their width, the invalid
+            # frame, then the frames to compare
+            marks[name] = len(samples)
+            yield from run((1 << dut.bits_x) * (1 << dut.bits_y) + (args.frames + 2) * frame_clocks(timing))
+
+        yield from run(args.frames * frame_clocks(MODES[0]) + 7)
+
+        # The second mode from the ROM
+        yield dut.i_mode.eq(1)
+        yield dut.i_load.eq(1)
+        yield from run(1)
+        yield dut.i_load.eq(0)
+        while (yield dut.o_loading):
+            yield from run(1)
+        yield from loaded("rom", MODES[1])
+
+        # A mode written a register at a time
+        for addr, value in enumerate(mode_registers(REG_MODE)):
+            yield dut.i_reg_addr.eq(addr)
+            yield dut.i_reg_data.eq(value)
+            yield dut.i_reg_we.eq(1)
+            yield from run(1)
+        yield dut.i_reg_we.eq(0)
+        yield from loaded("registers", REG_MODE)
+
+    samples = simulate(dut, control)
+
+    failed = False
+    checks = [("After reset", MODES[0], 0, None), ("ROM load", MODES[1], marks["rom"], 1),
+              ("Register writes", REG_MODE, marks["registers"], 1)]
+    for name, timing, start, skip in checks:
+        clocks = args.frames * frame_clocks(timing)
+        ref = reference(timing, dut.bits_x, dut.bits_y, clocks + 2 * frame_clocks(timing))
+        if skip is None:
+            # Both from reset
+            got, want = samples[:clocks], ref[:clocks]
+        else:
+            # From the start of the frame after the invalid one, against the
+            # start of the second frame of the reference
+            starts = frame_starts(samples, start)
+            begin = starts[skip] if len(starts) > skip else len(samples)
+            ref_begin = frame_starts(ref, 1)[0]
+            got, want = samples[begin:begin + clocks], ref[ref_begin:ref_begin + clocks]
+        errors = [i for i in range(clocks) if i >= len(got) or got[i] != want[i]]
+        failed |= bool(errors)
+        print("{}: {} frames of {}x{}: {}".format(name, args.frames, timing.x, timing.y,
+                                                   "FAILED" if errors else "PASSED"))
+        for i in errors[:5]:
+            print("  clock {}: {}, not {}".format(i, got[i] if i < len(got) else None, want[i]))
+
+    print("FAILED" if failed else "PASSED")
@@ -0,0 +1,419 @@
+import argparse
+import os
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator, Passive
+
+from vga2dvid import VGA2DVID
+from vga import VGA
+from vga_timings import *
+from spi_osd import SpiOsd
+from tmds import decode
+from readhex import readhex
+from readbin import readbin
+
+# Cycle level simulation of the Life video pipeline:
+#
+#   cells -> VGA -> SpiOsd -> VGA2DVID -> TMDSEncoder
+#
+# The parallel TMDS symbols are captured every pixel clock, decoded back to
+# RGB and compared with the frame the cells, or the VGA test picture, and
+# the OSD text should give. Each frame is written out as a PNG as well.
+#
+#   python dvi_sim.py --mode 640x480@60Hz --cells mem/guns.bin
+#   python dvi_sim.py --backend cxxrtl --cells mem/breeder1.bin
+#
+# The cxxrtl backend compiles the design to C++ with yosys and g++, and is
+# a lot faster than the python simulator for full size frames.
+
+# Position and size in characters of the OSD
+OSD_X       = 220
+OSD_Y       = 60
+OSD_CHARS_X = 64
+OSD_CHARS_Y = 20
+
+class DviPipeline(Elaboratable):
+    def __init__(self,
+                 timing: VGATiming, # VGATiming class
+                 cells = None, # Cell bytes, 8 cells per byte, msb first
+                 fore_color = 0xffff00,
+                 back_color = 0x0f0f0f,
+                 osd = False,
+                 cell_port = False): # Cells from the testbench, not a Memory
+        self.o_red   = Signal(10)
+        self.o_green = Signal(10)
+        self.o_blue  = Signal(10)
+        # Cell reads, as a synchronous read port: i_cell_data is the byte
+        # at o_cell_addr the clock before
+        self.o_cell_addr = Signal(range(max(len(cells or []), 2)))
+        self.i_cell_data = Signal(8)
+        # Configuration
+        self.timing     = timing
+        self.cells      = cells
+        self.fore_color = C(fore_color, 24)
+        self.back_color = C(back_color, 24)
+        self.osd        = osd
+        self.cell_port  = cell_port
+
+    def ports(self):
+        return [self.o_red, self.o_green, self.o_blue]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.domains.sync  = cd_sync  = ClockDomain("sync")
+        m.domains.pixel = cd_pixel = ClockDomain("pixel")
+
+        # The OSD SPI slave is idle, so it can share the pixel clock
+        m.d.comb += ClockSignal("sync").eq(ClockSignal("pixel"))
+
+        m.submodules.vga = vga = VGA(
+            resolution_x      = self.timing.x,
+            hsync_front_porch = self.timing.h_front_porch,
+            hsync_pulse       = self.timing.h_sync_pulse,
+            hsync_back_porch  = self.timing.h_back_porch,
+            resolution_y      = self.timing.y,
+            vsync_front_porch = self.timing.v_front_porch,
+            vsync_pulse       = self.timing.v_sync_pulse,
+            vsync_back_porch  = self.timing.v_back_porch,
+            bits_x            = 16,
+            bits_y            = 16
+        )
+
+        m.d.comb += [
+            vga.i_clk_en.eq(1),
+            vga.i_test_picture.eq(self.cells is None),
+        ]
+
+        if self.cells is not None:
+            # Cell memory, read one pixel ahead as the read port is synchronous.
+            # The python simulator cannot compile a Memory of a whole frame of
+            # cells, so it can be read by the testbench instead.
+            if self.cell_port:
+                r = Record([("addr", len(self.o_cell_addr)), ("data", 8)])
+                m.d.comb += [
+                    self.o_cell_addr.eq(r.addr),
+                    r.data.eq(self.i_cell_data),
+                ]
+            else:
+                mem = Memory(width = 8, depth = len(self.cells), init = self.cells)
+                m.submodules.r = r = mem.read_port(domain="pixel")
+
+            h_total = self.timing.x + self.timing.h_front_porch + self.timing.h_sync_pulse + self.timing.h_back_porch
+            v_total = self.timing.y + self.timing.v_front_porch + self.timing.v_sync_pulse + self.timing.v_back_porch
+
+            next_x = Signal(16)
+            next_y = Signal(16)
+            bit    = Signal(3)
+            live   = Signal()
+
+            with m.If(vga.o_beam_x == h_total - 1):
+                m.d.comb += next_x.eq(0)
+                m.d.comb += next_y.eq(Mux(vga.o_beam_y == v_total - 1, 0, vga.o_beam_y + 1))
+            with m.Else():
+                m.d.comb += next_x.eq(vga.o_beam_x + 1)
+                m.d.comb += next_y.eq(vga.o_beam_y)
+
+            m.d.comb += [
+                r.addr.eq((next_y * self.timing.x + next_x) >> 3),
+                live.eq(r.data.bit_select(~bit, 1)),
+            ]
+            m.d.pixel += bit.eq(next_x[:3])
+
+            with m.If(live):
+                m.d.comb += [
+                    vga.i_r.eq(self.fore_color[16:]),
+                    vga.i_g.eq(self.fore_color[8:16]),
+                    vga.i_b.eq(self.fore_color[:8])
+                ]
+            with m.Else():
+                m.d.comb += [
+                    vga.i_r.eq(self.back_color[16:]),
+                    vga.i_g.eq(self.back_color[8:16]),
+                    vga.i_b.eq(self.back_color[:8])
+                ]
+
+        m.submodules.osd = osd = SpiOsd(start_x=OSD_X, start_y=OSD_Y, chars_x=OSD_CHARS_X, chars_y=OSD_CHARS_Y,
+                                        init_on=self.osd)
+
+        m.d.comb += [
+            osd.i_csn.eq(1), # SPI idle
+            osd.clk_ena.eq(1),
+            osd.i_hsync.eq(vga.o_vga_hsync),
+            osd.i_vsync.eq(vga.o_vga_vsync),
+            osd.i_blank.eq(vga.o_vga_blank),
+            osd.i_r.eq(vga.o_vga_r),
+            osd.i_g.eq(vga.o_vga_g),
+            osd.i_b.eq(vga.o_vga_b),
+        ]
+
+        m.submodules.vga2dvid = vga2dvid = VGA2DVID(serial=False, shift_clock_synchronizer=False)
+
+        m.d.comb += [
+            vga2dvid.i_red.eq(osd.o_r),
+            vga2dvid.i_green.eq(osd.o_g),
+            vga2dvid.i_blue.eq(osd.o_b),
+            vga2dvid.i_hsync.eq(osd.o_hsync),
+            vga2dvid.i_vsync.eq(osd.o_vsync),
+            vga2dvid.i_blank.eq(osd.o_blank),
+            self.o_red.eq(vga2dvid.o_red_par),
+            self.o_green.eq(vga2dvid.o_green_par),
+            self.o_blue.eq(vga2dvid.o_blue_par),
+        ]
+
+        return m
+
+
+def frame_cycles(timing):
+    return ((timing.x + timing.h_front_porch + timing.h_sync_pulse + timing.h_back_porch) *
+            (timing.y + timing.v_front_porch + timing.v_sync_pulse + timing.v_back_porch))
+
+
+def run_pysim(dut, cycles):
+    symbols = np.zeros((cycles, 3), dtype=np.uint16)
+
+    # The font and tile memories compile to deeply nested python expressions
+    sys.setrecursionlimit(100000)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-8, domain="pixel")
+
+    def process():
+        for i in range(cycles):
+            yield
+            symbols[i] = [(yield dut.o_red), (yield dut.o_green), (yield dut.o_blue)]
+
+    sim.add_sync_process(process, domain="pixel")
+
+    if dut.cell_port:
+        def cell_memory():
+            yield Passive()
+            while True:
+                yield
+                addr = yield dut.o_cell_addr
+                yield dut.i_cell_data.eq(dut.cells[addr] if addr < len(dut.cells) else 0)
+
+        sim.add_sync_process(cell_memory, domain="pixel")
+    sim.run()
+
+    return symbols
+
+
+CXXRTL_MAIN = """
+#include <cstdio>
+#include <cstdint>
+#include "dvi_pipeline.cc"
+
+int main(int argc, char **argv) {
+    cxxrtl_design::p_top top;
+    long cycles = atol(argv[1]);
+    FILE *f = fopen(argv[2], "wb");
+    uint16_t symbol[3];
+
+    top.p_pixel__rst.set<bool>(false);
+    for (long i = 0; i < cycles; i++) {
+        top.p_pixel__clk.set<bool>(false);
+        top.step();
+        top.p_pixel__clk.set<bool>(true);
+        top.step();
+        symbol[0] = top.p_o__red.get<uint16_t>();
+        symbol[1] = top.p_o__green.get<uint16_t>();
+        symbol[2] = top.p_o__blue.get<uint16_t>();
+        fwrite(symbol, sizeof(symbol), 1, f);
+    }
+
+    fclose(f);
+    return 0;
+}
+"""
+
+
+def run_cxxrtl(dut, cycles, build_dir="build_sim"):
+    from amaranth.back import rtlil
+    from amaranth._toolchain.yosys import find_yosys
+
+    # Amaranth 0.3 names signals from the bytecode of their caller, which it
+    # cannot read from python 3.11 on, and yosys mistakes the ports of
+    # unnamed signals for constants
+    if Signal().name is None:
+        raise RuntimeError("The cxxrtl backend needs named signals, use python 3.10 or older")
+
+    os.makedirs(build_dir, exist_ok=True)
+
+    yosys = find_yosys(lambda ver: ver >= (0, 10))
+    # The reset is a port, driven low by main.cc, so it is not a constant
+    design = rtlil.convert(dut, ports=[ClockSignal("pixel"), ResetSignal("pixel"), *dut.ports()])
+    with open(os.path.join(build_dir, "dvi_pipeline.cc"), "w") as f:
+        f.write(yosys.run(["-q", "-"], "read_rtlil <<rtlil\n{}\nrtlil\nproc\nflatten\nwrite_cxxrtl".format(design)))
+    with open(os.path.join(build_dir, "main.cc"), "w") as f:
+        f.write(CXXRTL_MAIN)
+
+    # The cxxrtl runtime headers moved to runtime/ in yosys 0.33. SpiOsd
+    # reads past the end of its tile map at the start of each line, which
+    # cxxrtl asserts on unless CXXRTL_NDEBUG is set.
+    include = os.path.join(yosys.data_dir(), "include")
+    runtime = os.path.join(include, "backends", "cxxrtl", "runtime")
+    subprocess.check_call([os.environ.get("CXX", "g++"), "-std=c++14", "-O2", "-DCXXRTL_NDEBUG",
+                           "-I", include, "-I", runtime, "-o", "dvi_pipeline", "main.cc"], cwd=build_dir)
+
+    start = time.time()
+    subprocess.check_call([os.path.join(".", "dvi_pipeline"), str(cycles), "symbols.bin"], cwd=build_dir)
+    elapsed = time.time() - start
+
+    symbols = np.fromfile(os.path.join(build_dir, "symbols.bin"), dtype=np.uint16).reshape(-1, 3)
+    return symbols, elapsed
+
+
+def frames(symbols, timing):
+    """Split a captured TMDS stream into RGB frames."""
+    data = []
+    for channel in range(3):
+        d, c, de = decode(symbols[:, channel])
+        data.append(d)
+    vsync = (c & 2) != 0 # blue channel carries hsync and vsync
+
+    # Frames are separated by the rising edge of vsync and lines end on the
+    # falling edge of the display enable. The first line after reset is
+    # longer than the others, as the pipeline starts up in the display area,
+    # so lines are taken from their end.
+    vsync_start = np.flatnonzero(vsync[1:] & ~vsync[:-1]) + 1
+    line_end    = np.flatnonzero(de[:-1] & ~de[1:]) + 1
+    line_start  = line_end - timing.x
+
+    images = []
+    for begin, end in zip(np.concatenate([[0], vsync_start]), np.concatenate([vsync_start, [len(de)]])):
+        lines = line_start[(line_start >= begin) & (line_start < end)]
+        if len(lines) < timing.y:
+            continue # Incomplete frame
+        index = lines[:timing.y, None] + np.arange(timing.x)
+        images.append(np.stack([d[index] for d in data], axis=-1))
+
+    return images
+
+
+def test_picture(timing):
+    """The test picture of VGA, from its beam position."""
+    x = np.arange(timing.x)[None, :]
+    y = np.arange(timing.y)[:, None]
+    a = np.where((((x >> 5) & 7) == 2) & (((y >> 5) & 7) == 2), 0xff, 0)
+    w = np.where((x & 0xff) == (y & 0xff), 0xff, 0)
+    z = np.where(((y >> 3) & 3) == (~(x >> 3) & 3), 0xff, 0)
+    t = np.where((y >> 6) & 1, 0xff, 0)
+    r = ((((x & 0x3f) & z) << 1) | w) & ~a & 0xff
+    g = ((x & t & 0xff) | w) & ~a & 0xff
+    b = ((y & 0xff) | w | a) & 0xff
+    return np.stack(np.broadcast_arrays(r, g, b), axis=-1)
+
+
+def osd_text(rgb):
+    """Draws the OSD characters of osd.mem over rgb, where SpiOsd puts them."""
+    tiles = np.zeros((OSD_CHARS_Y + 1) * OSD_CHARS_X, dtype=int)
+    tile_map = readhex("osd.mem")
+    tiles[:len(tile_map)] = tile_map
+    font = np.zeros(4096, dtype=int)
+    font_rows = readbin("font_bizcat8x16.mem")
+    font[:len(font_rows)] = font_rows
+
+    # Osd starts the window 3 pixels in, a line down, and stops a pixel short
+    # of its end. The font row of each pixel is fetched 2 pixels before, so
+    # the first pixel of a line takes the tile fetched at the end of the
+    # line before, the first of the next character row.
+    osd_y = np.arange(16 * OSD_CHARS_Y - 1)[:, None]
+    osd_x = np.arange(1, 8 * OSD_CHARS_X)[None, :]
+    fetch = np.where(osd_x < 2, 8 * OSD_CHARS_X - 1, osd_x - 2)
+    glyph = font[16 * tiles[(osd_y >> 4) * OSD_CHARS_X + ((fetch + 1) >> 3)] + (osd_y & 15)]
+    lit = (glyph >> ((8 - osd_x) & 7)) & 1
+
+    colours = np.array([[0x50, 0x30, 0x20], [0xff, 0xff, 0xff]])
+    rgb[OSD_Y + 1:OSD_Y + 16 * OSD_CHARS_Y, OSD_X + 3:OSD_X + 8 * OSD_CHARS_X + 2] = colours[lit]
+
+
+def expected_frame(timing, cells=None, fore_color=0xffff00, back_color=0x0f0f0f, osd=False):
+    """The RGB frame DviPipeline should show."""
+    if cells is None:
+        rgb = test_picture(timing)
+    else:
+        live = np.unpackbits(np.array(cells, dtype=np.uint8))[:timing.x * timing.y].reshape(timing.y, timing.x)
+        colours = np.array([[(color >> shift) & 0xff for shift in (16, 8, 0)] for color in (back_color, fore_color)])
+        rgb = colours[live]
+    if osd:
+        osd_text(rgb)
+    # VGA blanks the first pixel of each line, but for the very first one
+    # after reset, as it starts in the display area
+    first = rgb[0, 0].copy()
+    rgb[:, 0] = 0
+    return rgb, first
+
+
+def write_png(filename, rgb):
+    height, width, _ = rgb.shape
+    raw = b"".join(b"\x00" + row.tobytes() for row in rgb.astype(np.uint8))
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw)))
+        f.write(chunk(b"IEND", b""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=vga_timings.keys(), default='1024x768@60Hz')
+    parser.add_argument("--cells", help="cell file, e.g. mem/guns.bin, test picture if not given")
+    parser.add_argument("--osd", action="store_true", help="show the OSD")
+    parser.add_argument("--frames", type=int, default=1)
+    parser.add_argument("--backend", choices=["pysim", "cxxrtl"], default="pysim")
+    parser.add_argument("--prefix", default="frame")
+    args = parser.parse_args()
+
+    timing = vga_timings[args.mode]
+    if args.osd and (timing.x < OSD_X + 8 * OSD_CHARS_X + 2 or timing.y < OSD_Y + 16 * OSD_CHARS_Y):
+        parser.error("The OSD does not fit in {}".format(args.mode))
+
+    cells = None
+    if args.cells:
+        with open(args.cells, "rb") as f:
+            cells = list(f.read((timing.x * timing.y) // 8))
+
+    dut = DviPipeline(timing, cells=cells, osd=args.osd, cell_port=args.backend == "pysim")
+
+    # A few extra cycles to flush the pipeline
+    cycles = frame_cycles(timing) * args.frames + 16
+
+    if args.backend == "cxxrtl":
+        symbols, elapsed = run_cxxrtl(dut, cycles)
+    else:
+        start = time.time()
+        symbols = run_pysim(dut, cycles)
+        elapsed = time.time() - start
+
+    print("Simulated {} pixel clocks in {:.1f}s, {:.0f} pixels/s".format(cycles, elapsed, cycles / elapsed))
+
+    expected, first = expected_frame(timing, cells, osd=args.osd)
+
+    failed = False
+    images = frames(symbols, timing)
+    for i, image in enumerate(images):
+        filename = "{}{}.png".format(args.prefix, i)
+        write_png(filename, image)
+        want = expected.copy()
+        if i == 0:
+            want[0, 0] = first
+        wrong = np.argwhere((image != want).any(axis=-1))
+        failed |= len(wrong) > 0
+        print("Wrote {}, {} pixels wrong: {}".format(filename, len(wrong), "FAILED" if len(wrong) else "PASSED"))
+        for y, x in wrong[:5]:
+            print("  ({}, {}): {}, not {}".format(x, y, image[y, x].tolist(), want[y, x].tolist()))
+
+    print("FAILED" if failed or len(images) < args.frames else "PASSED")
@@ -111,7 +111,7 @@ class Osd(Elaboratable):
                 m.d.pixel += [
                     r_vga_r.eq(self.i_osd_r),
                     r_vga_g.eq(self.i_osd_g),
-                    r_vga_r.eq(self.i_osd_b),
+                    r_vga_b.eq(self.i_osd_b),
                 ]
             with m.Else():
                 m.d.pixel += [
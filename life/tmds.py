@@ -0,0 +1,36 @@
+import numpy as np
+
+# NumPy reference for the DVI TMDS 8b/10b code, working on whole arrays of
+# 10-bit symbols at once.
+
+# Control period symbols indexed by (vsync, hsync)
+CONTROL = np.array([0b1101010100, 0b0010101011, 0b0101010100, 0b1010101011])
+
+
+def decode(symbols):
+    """Decode TMDS symbols.
+
+    Returns (data, c, de): the 8-bit data of video period symbols, the 2-bit
+    control value of control period symbols and a flag that is set for video
+    period symbols.
+    """
+    q = np.asarray(symbols, dtype=np.uint16)
+
+    # Control symbols have more transitions than any data symbol can have,
+    # so they can be recognised directly.
+    c = np.zeros(q.shape, dtype=np.uint8)
+    de = np.ones(q.shape, dtype=bool)
+    for i, code in enumerate(CONTROL):
+        match = q == code
+        c[match] = i
+        de &= ~match
+
+    # Bit 9 set: data bits were inverted to balance DC.
+    word = np.where(q & 0x200, ~q, q) & 0xff
+
+    # Bit 8 set: xor chain, cleared: xnor chain.
+    chain = (word ^ (word << 1)) & 0xfe
+    chain = np.where(q & 0x100, chain, ~chain & 0xfe)
+    data = (chain | (word & 1)).astype(np.uint8)
+
+    return np.where(de, data, 0).astype(np.uint8), c, de
@@ -0,0 +1,50 @@
+from enum import Enum
+
+# Compiler of the init sequences of the SPI displays, on the host, when the
+# design is built.
+#
+# A sequence is a list of commands, (cmd, args, delay), with the delay after
+# the command in microseconds, 0 for none. Commands and arguments can be
+# Enum members or ints. The number of arguments of each command is checked
+# against arg_counts, a dict from the command to the count, and a command
+# not in it is an error.
+#
+# The sequence compiles to a ROM of 10 bit words, with a byte to send in the
+# low 8 bits, DC, set for the arguments if args_dc, and DELAY, set on the
+# last byte of a command with a delay. The delays, in clocks at clk_freq,
+# are in a table of their own, in the order of the commands, so the drivers
+# need no parsing of the sequence, and no multiplier or shifter for the
+# delays.
+DC    = 1 << 8
+DELAY = 1 << 9
+
+
+def _byte(value):
+    value = value.value if isinstance(value, Enum) else value
+    if not 0 <= value <= 0xFF:
+        raise ValueError("Init sequence byte {:#x} out of range".format(value))
+    return value
+
+
+class InitSequence:
+    def __init__(self, seq, arg_counts, clk_freq, args_dc=True):
+        self.rom = []
+        self.delays = []
+        arg_counts = {_byte(cmd): n for cmd, n in arg_counts.items()}
+
+        for cmd, args, delay in seq:
+            code = _byte(cmd)
+            if code not in arg_counts:
+                raise ValueError("Unknown command {:#04x} in init sequence".format(code))
+            if len(args) != arg_counts[code]:
+                raise ValueError("Command {:#04x} takes {} arguments, not {}".format(
+                                 code, arg_counts[code], len(args)))
+            self.rom.append(code)
+            self.rom.extend(_byte(arg) | (DC if args_dc else 0) for arg in args)
+            if delay:
+                self.rom[-1] |= DELAY
+                self.delays.append(int(delay * clk_freq // 1000000))
+
+    # Clocks of the longest delay, to size the counter
+    def max_delay(self):
+        return max(self.delays, default=0)
@@ -1,6 +1,6 @@
 from enum import Enum
 
-from amaranth import Array, Value
+from init_seq import InitSequence
 
 
 class OLED_INIT(Enum):
@@ -32,33 +32,63 @@ class OLED_INIT(Enum):
     SET_DISPLAY_ON = 0xAF
 
 
+# Arguments of each command
+oled_init_args = {
+    OLED_INIT.NOP1: 0,
+    OLED_INIT.NOP2: 0,
+    OLED_INIT.NOP3: 0,
+    OLED_INIT.SET_DISPLAY_OFF: 0,
+    OLED_INIT.SET_REMAP_COLOR: 1,
+    OLED_INIT.SET_DISPLAY_START_LINE: 1,
+    OLED_INIT.SET_DISPLAY_MODE_NORMAL: 0,
+    OLED_INIT.SET_MULTIPLEX_RATIO: 1,
+    OLED_INIT.SET_MASTER_CONFIGURATION: 1,
+    OLED_INIT.SET_POWER_SAVE_MODE: 1,
+    OLED_INIT.SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT: 1,
+    OLED_INIT.SET_DISPLAY_CLOCK_DIVIDER: 1,
+    OLED_INIT.SET_PRECHARGE_A: 1,
+    OLED_INIT.SET_PRECHARGE_B: 1,
+    OLED_INIT.SET_PRECHARGE_C: 1,
+    OLED_INIT.SET_PRECHARGE_LEVEL: 1,
+    OLED_INIT.SET_VCOMH: 1,
+    OLED_INIT.SET_MASTER_CURRENT_CONTROL: 1,
+    OLED_INIT.SET_CONTRAST_COLOR_A: 1,
+    OLED_INIT.SET_CONTRAST_COLOR_B: 1,
+    OLED_INIT.SET_CONTRAST_COLOR_C: 1,
+    OLED_INIT.SET_COLUMN_ADDRESS: 2,
+    OLED_INIT.SET_ROW_ADDRESS: 2,
+    OLED_INIT.SET_DISPLAY_ON: 0,
+}
+
+# The last command is a placeholder, the pixels are sent in its place
 oled_init_seq_list = [
-    OLED_INIT.NOP1,
-    OLED_INIT.SET_DISPLAY_OFF,
-    OLED_INIT.SET_REMAP_COLOR, OLED_INIT.ULX3S_REMAP,
-    OLED_INIT.SET_DISPLAY_START_LINE, 0x00,
-    OLED_INIT.SET_DISPLAY_OFFSET, 0x00,
-    OLED_INIT.SET_DISPLAY_MODE_NORMAL,
-    OLED_INIT.SET_MULTIPLEX_RATIO, 0b00111111,
-    OLED_INIT.SET_MASTER_CONFIGURATION, 0b10001110,
-    OLED_INIT.SET_POWER_SAVE_MODE, 0x00,
-    OLED_INIT.SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT, 0x74,
-    OLED_INIT.SET_DISPLAY_CLOCK_DIVIDER, 0xF0,
-    OLED_INIT.SET_PRECHARGE_A, 0x64,
-    OLED_INIT.SET_PRECHARGE_B, 0x78,
-    OLED_INIT.SET_PRECHARGE_C, 0x64,
-    OLED_INIT.SET_PRECHARGE_LEVEL, 0x31,
-    OLED_INIT.SET_CONTRAST_COLOR_A, 0xFF,
-    OLED_INIT.SET_CONTRAST_COLOR_B, 0xFF,
-    OLED_INIT.SET_CONTRAST_COLOR_C, 0xFF,
-    OLED_INIT.SET_VCOMH, 0x3E,
-    OLED_INIT.SET_MASTER_CURRENT_CONTROL, 0x06,
-    OLED_INIT.SET_COLUMN_ADDRESS, 0x00, 0x5F,
-    OLED_INIT.SET_ROW_ADDRESS, 0x00, 0x3F,
-    OLED_INIT.SET_DISPLAY_ON,
-    OLED_INIT.NOP1,
+    (OLED_INIT.NOP1, [], 0),
+    (OLED_INIT.SET_DISPLAY_OFF, [], 0),
+    (OLED_INIT.SET_REMAP_COLOR, [OLED_INIT.ULX3S_REMAP], 0),
+    (OLED_INIT.SET_DISPLAY_START_LINE, [0x00], 0),
+    (OLED_INIT.SET_DISPLAY_OFFSET, [0x00], 0),
+    (OLED_INIT.SET_DISPLAY_MODE_NORMAL, [], 0),
+    (OLED_INIT.SET_MULTIPLEX_RATIO, [0b00111111], 0),
+    (OLED_INIT.SET_MASTER_CONFIGURATION, [0b10001110], 0),
+    (OLED_INIT.SET_POWER_SAVE_MODE, [0x00], 0),
+    (OLED_INIT.SET_PHASE_1_AND_2_PERIOD_ADJUSTMENT, [0x74], 0),
+    (OLED_INIT.SET_DISPLAY_CLOCK_DIVIDER, [0xF0], 0),
+    (OLED_INIT.SET_PRECHARGE_A, [0x64], 0),
+    (OLED_INIT.SET_PRECHARGE_B, [0x78], 0),
+    (OLED_INIT.SET_PRECHARGE_C, [0x64], 0),
+    (OLED_INIT.SET_PRECHARGE_LEVEL, [0x31], 0),
+    (OLED_INIT.SET_CONTRAST_COLOR_A, [0xFF], 0),
+    (OLED_INIT.SET_CONTRAST_COLOR_B, [0xFF], 0),
+    (OLED_INIT.SET_CONTRAST_COLOR_C, [0xFF], 0),
+    (OLED_INIT.SET_VCOMH, [0x3E], 0),
+    (OLED_INIT.SET_MASTER_CURRENT_CONTROL, [0x06], 0),
+    (OLED_INIT.SET_COLUMN_ADDRESS, [0x00, 0x5F], 0),
+    (OLED_INIT.SET_ROW_ADDRESS, [0x00, 0x3F], 0),
+    (OLED_INIT.SET_DISPLAY_ON, [], 0),
+    (OLED_INIT.NOP1, [], 0),
 ]
 
-oled_init_seq = Array(Value for _ in range(len(oled_init_seq_list)))
-for i in range(len(oled_init_seq_list)):
-    oled_init_seq[i] = oled_init_seq_list[i]
+
+# The SSD1331 takes the arguments as commands, with DC low
+def oled_init_seq(clk_freq):
+    return InitSequence(oled_init_seq_list, oled_init_args, clk_freq, args_dc=False)
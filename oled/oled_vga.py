@@ -3,10 +3,12 @@ from amaranth.build import Platform
 from ulx4m import *
 
 from oled_init import *
+from init_seq import DELAY
 
 
 class OLED_VGA(Elaboratable):
-    def __init__(self, color_bits=8):
+    def __init__(self, color_bits=8, clk_freq=None):
+        self.clk_freq = clk_freq
         self.i_clk_en = Signal()
         self.i_clk_pixel_ena = Signal()
         self.i_hsync = Signal()
@@ -25,6 +27,11 @@ class OLED_VGA(Elaboratable):
         # Constants
         C_last_init_send_as_data = C(1, 16)
 
+        # Init sequence, compiled to a ROM and a table of delays
+        seq = oled_init_seq(self.clk_freq or platform.default_clk_frequency)
+        oled_init_rom = Memory(width=10, depth=len(seq.rom), init=seq.rom)
+        delays = Array(C(d) for d in seq.delays or [0])
+
         # Internal signals
         R_reset_cnt = Signal(2, reset=0)
         # Initialization sequence replay counter.
@@ -34,13 +41,29 @@ class OLED_VGA(Elaboratable):
         # (0)           -- spi clock cycle
         R_spi_data = Signal(8)
         R_dc       = Signal(reset=0) # 0 = command, 1 = data
-        R_x        = Signal(7, reset=1)
-        R_y        = Signal(6, reset=1)
+        R_x        = Signal(7, reset=1) # The last init byte is sent in place of pixel 0
+        R_y        = Signal(6, reset=0)
         R_x_in     = Signal(7)
         R_y_in     = Signal(6)
-        R_scanline = Array(Signal(8) for _ in range(96))
+        R_init_word = Signal(10)
+        R_delay    = Signal(range(seq.max_delay() + 1))
+        R_delay_index = Signal(range(len(seq.delays) + 1))
+
+        m.d.comb += R_init_word.eq(oled_init_rom[R_init_cnt[4:]])
 
-        # Track signal's pixel coordinates and buffer one line.
+        # Frame buffer in BRAM, written from the signal and read for SPI, so
+        # the display is sent as fast as SPI goes, not a line at a time.
+        R_frame = Memory(width=8, depth=96 * 64)
+        m.submodules.frame_w = frame_w = R_frame.write_port()
+        m.submodules.frame_r = frame_r = R_frame.read_port(transparent=False)
+
+        m.d.comb += [
+            frame_w.addr.eq(R_y_in * 96 + R_x_in),
+            frame_w.data.eq(self.i_pixel),
+            frame_r.addr.eq(R_y * 96 + R_x),
+        ]
+
+        # Track signal's pixel coordinates and buffer the frame.
         with m.If(self.i_clk_pixel_ena):
             with m.If(self.i_vsync):
                 m.d.sync += R_y_in.eq(0)
@@ -49,7 +72,7 @@ class OLED_VGA(Elaboratable):
                     m.d.sync += R_x_in.eq(0)
                 with m.Else():
                     with m.If(self.i_blank == 0):
-                        m.d.sync += R_scanline[R_x_in].eq(self.i_pixel)
+                        m.d.comb += frame_w.en.eq(1)
 
                         # If R_x_in == 95
                         with m.If(R_x_in == 0b101_1111):
@@ -60,16 +83,24 @@ class OLED_VGA(Elaboratable):
 
         with m.If(R_reset_cnt[-2:] != 0b10):
             m.d.sync += R_reset_cnt.eq(R_reset_cnt + 1)
-        with m.Elif(R_init_cnt[4:] != len(oled_init_seq)):
+        with m.Elif(R_init_cnt[4:] != len(seq.rom)):
             # Load new byte (either from init sequence or next pixel).
             with m.If(R_init_cnt[:4] == 0):
-                with m.If(R_y_in == R_y):
+                with m.If(R_delay != 0):
+                    # Delay after the last byte sent.
+                    m.d.sync += R_delay.eq(R_delay - 1)
+                with m.Else():
                     m.d.sync += R_init_cnt.eq(R_init_cnt + 1)
                     with m.If(R_dc == 0):
                         # Init sequence.
-                        m.d.sync += R_spi_data.eq(oled_init_seq[R_init_cnt[4:]])
+                        m.d.sync += R_spi_data.eq(R_init_word[:8])
+                        with m.If(R_init_word & DELAY):
+                            m.d.sync += [
+                                R_delay.eq(delays[R_delay_index]),
+                                R_delay_index.eq(R_delay_index + 1)
+                            ]
                     with m.Else():
-                        m.d.sync += R_spi_data.eq(R_scanline[R_x])
+                        m.d.sync += R_spi_data.eq(frame_r.data)
                         # Tracks XY pixel coordinates currently written to SPI display.
                         with m.If(R_x == 0b101_1111): # If R_x = 95
                             m.d.sync += R_x.eq(0)
@@ -83,10 +114,10 @@ class OLED_VGA(Elaboratable):
                         m.d.sync += R_spi_data.eq(Cat(0b0, R_spi_data[:-1]))
 
         # Send last N bytes as data.
-        with m.If(R_init_cnt[4:] == ((len(oled_init_seq) - 1) - (C_last_init_send_as_data - 1))):
+        with m.If(R_init_cnt[4:] == ((len(seq.rom) - 1) - (C_last_init_send_as_data - 1))):
             m.d.sync += R_dc.eq(1)
-        with m.If(R_init_cnt[4:] == (len(oled_init_seq) - 1)):
-            m.d.sync += R_init_cnt[4:].eq((len(oled_init_seq) - 1) - (C_last_init_send_as_data - 1))
+        with m.If(R_init_cnt[4:] == (len(seq.rom) - 1)):
+            m.d.sync += R_init_cnt[4:].eq((len(seq.rom) - 1) - (C_last_init_send_as_data - 1))
 
         m.d.comb += [
             self.o_spi_resn.eq(~R_reset_cnt[-2]),
@@ -44,7 +44,8 @@ class Top_OLED_VGA(Elaboratable):
         R_counter = Signal(64)
         m.d.sync += R_counter.eq(R_counter + 1)
 
-        # VGA signal generator
+        # VGA signal generator, the lines no longer need to be as long as
+        # sending them to the OLED, as OLED_VGA buffers the whole frame
         vga_hsync_test = Signal()
         vga_vsync_test = Signal()
         vga_blank_test = Signal()
@@ -52,9 +53,9 @@ class Top_OLED_VGA(Elaboratable):
 
         m.submodules.vga = vga = DomainRenamer({"pixel":"sync"})(VGA(
             resolution_x      = 96,
-            hsync_front_porch = 1800,
-            hsync_pulse       = 1,
-            hsync_back_porch  = 1800,
+            hsync_front_porch = 16,
+            hsync_pulse       = 8,
+            hsync_back_porch  = 16,
             resolution_y      = 64,
             vsync_front_porch = 1,
             vsync_pulse       = 1,
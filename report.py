@@ -0,0 +1,185 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Synthesizes every example and collects resource usage (from the yosys
+# stat output) and Fmax per clock domain (from the nextpnr log).
+#
+# Each run is appended to a CSV history and the latest results are written
+# to a JSON file. Fmax drops and growth in resource usage against the
+# previous run are reported, so regressions show up straight away.
+#
+#   python report.py 85F
+#   python report.py 85F --examples life/life.py dvi/top_vgatest.py
+
+EXAMPLES = [
+    "audio/music1.py",
+    "audio/music2.py",
+    "audio/music2a.py",
+    "audio/music3.py",
+    "audio/music4.py",
+    "blinky/blinky.py",
+    "debounce/debounce.py",
+    "dvi/top_vgatest.py",
+    "gpio/gpio.py",
+    "leds/ledglow.py",
+    "leds/leds.py",
+    "life/life.py",
+    "mitecpu/mitecpu.py",
+    "oled/top_oled_vga.py",
+    "ps2_keyboard/ps2_usb.py",
+    "ps2_keyboard/ps2test.py",
+    "sdram16/test_sdram16.py",
+    "sdram16/test_framebuffer.py",
+    "st7789/gamepi15.py",
+    "st7789/st7789_test.py",
+    "uart/uart_test.py",
+]
+
+# Cells counted from the yosys stat output
+CELLS = ["LUT4", "TRELLIS_FF", "CCU2C", "DP16KD", "MULT18X18D", "TRELLIS_DPR16X4"]
+
+# Run the example's __main__ with programming disabled
+BUILD_ONLY = """
+import runpy, sys
+from amaranth.build.plat import Platform
+build = Platform.build
+def build_only(self, *args, **kwargs):
+    kwargs["do_program"] = False
+    return build(self, *args, **kwargs)
+Platform.build = build_only
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# Info: Max frequency for clock '$glbnet$pixel_clk': 77.27 MHz (PASS at 74.25 MHz)
+FMAX_RE  = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([0-9.]+) MHz \((?:PASS|FAIL) at ([0-9.]+) MHz\)")
+# Info: 	          TRELLIS_SLICE:   123/41820     0%
+USAGE_RE = re.compile(r"^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", re.M)
+# Older yosys prints "LUT4  300", newer prints "300  LUT4"
+CELL_RE  = re.compile(r"^\s+(?:(\w+)\s+(\d+)|(\d+)\s+(\w+))\s*$", re.M)
+
+
+def clock_name(net):
+    name = net.replace("$glbnet$", "")
+    if name.endswith("_clk"):
+        name = name[:-4]
+    return name
+
+
+def parse_yosys(log):
+    # Only the statistics of the final (flattened) top module are wanted
+    stat = log[log.rfind("=== "):]
+    cells = {}
+    for name_a, count_a, count_b, name_b in CELL_RE.findall(stat):
+        name, count = (name_a, count_a) if name_a else (name_b, count_b)
+        if name in CELLS:
+            cells[name] = int(count)
+    return cells
+
+
+def parse_nextpnr(log):
+    fmax = {}
+    for net, mhz, target in FMAX_RE.findall(log):
+        fmax[clock_name(net)] = (float(mhz), float(target))
+    usage = {}
+    for name, used, available in USAGE_RE.findall(log):
+        usage[name] = (int(used), int(available))
+    return fmax, usage
+
+
+def build(example, variant):
+    directory, script = os.path.split(example)
+    start = datetime.datetime.now().timestamp()
+    subprocess.run([sys.executable, "-c", BUILD_ONLY, script, variant], cwd=directory)
+
+    metrics = {}
+    rpt = os.path.join(directory, "build", "top.rpt")
+    tim = os.path.join(directory, "build", "top.tim")
+
+    if os.path.exists(rpt) and os.path.getmtime(rpt) >= start:
+        with open(rpt) as f:
+            for name, count in parse_yosys(f.read()).items():
+                metrics[name] = count
+
+    if os.path.exists(tim) and os.path.getmtime(tim) >= start:
+        with open(tim) as f:
+            fmax, usage = parse_nextpnr(f.read())
+        for clock, (mhz, target) in fmax.items():
+            metrics["fmax_" + clock] = mhz
+            metrics["target_" + clock] = target
+        for name, (used, available) in usage.items():
+            metrics[name] = used
+
+    return metrics
+
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def read_history(filename, variant):
+    # Latest value of each (example, metric) pair for this FPGA variant
+    previous = {}
+    if os.path.exists(filename):
+        with open(filename, newline="") as f:
+            for row in csv.DictReader(f):
+                if row["variant"] == variant:
+                    previous[(row["example"], row["metric"])] = float(row["value"])
+    return previous
+
+
+def regressions(results, previous, tolerance):
+    for example, metrics in results.items():
+        for metric, value in metrics.items():
+            old = previous.get((example, metric))
+            if old is None or metric.startswith("target_"):
+                continue
+            if metric.startswith("fmax_"):
+                if value < old * (1 - tolerance):
+                    yield example, metric, old, value
+            elif value > old * (1 + tolerance):
+                yield example, metric, old, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=['12F', '45F', '85F'])
+    parser.add_argument("--examples", nargs="+", default=EXAMPLES)
+    parser.add_argument("--history", default="report_history.csv")
+    parser.add_argument("--json", default="report.json")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    previous = read_history(args.history, args.variant)
+
+    results = {}
+    for example in args.examples:
+        print("Building", example)
+        results[example] = build(example, args.variant)
+        if not results[example]:
+            print("No reports found for", example)
+
+    date = datetime.datetime.now().isoformat(timespec="seconds")
+    commit = git_commit()
+
+    new = not os.path.exists(args.history)
+    with open(args.history, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(["date", "commit", "variant", "example", "metric", "value"])
+        for example, metrics in results.items():
+            for metric, value in sorted(metrics.items()):
+                writer.writerow([date, commit, args.variant, example, metric, value])
+
+    with open(args.json, "w") as f:
+        json.dump({"date": date, "commit": commit, "variant": args.variant, "results": results}, f, indent=2, sort_keys=True)
+
+    for example, metric, old, value in regressions(results, previous, args.tolerance):
+        print("Regression:", example, metric, old, "->", value)
@@ -0,0 +1,238 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from sdram16 import Sdram
+from sdram_model import SdramModel
+from sdram_arbiter import SdramArbiter
+
+# Simulation of the SDRAM arbiter with four clients in their own clock
+# domains, against the SDRAM model:
+#
+#   port 0, slow:  a client reading the loaded block in bursts, but taking
+#                  the data only every 32 of its clocks, so its FIFO fills
+#   port 1, cpu:   a CPU making random reads and writes
+#   port 2, spi:   a loader writing a block, then writing all the time
+#   port 3, pixel: a display reading the loaded block in bursts
+#
+# The slow client is the first port, but its bandwidth is what it takes.
+# The CPU and the loader take all the bandwidth they get, the display is
+# the lowest priority port and gets what is left, or its share from the
+# lane. With page bursts each display read is a whole page, 64 reads of 8
+# words.
+#
+#   python arbiter_sim.py
+#   python arbiter_sim.py --arbitration round_robin --no-lane
+#   python arbiter_sim.py --burst-length page
+
+CPU_PERIOD   = 20e-9
+PIXEL_PERIOD = 40e-9
+SPI_PERIOD   = 100e-9
+SLOW_PERIOD  = 30e-9
+
+
+class ArbiterTest(Elaboratable):
+    def __init__(self, arbitration, lane, burst_length=4):
+        self.i_init = Signal()
+        self.ctrl = Sdram(burst_length=burst_length, interleave=True)
+        self.arbiter = SdramArbiter(["slow", "cpu", "spi", "pixel"], burst_length=burst_length,
+                                    arbitration=arbitration, lane=3 if lane else None,
+                                    lane_slots=1, lane_period=2,
+                                    fifo_depth=65 if burst_length == "page" else 16)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.ctrl = ctrl = self.ctrl
+        # The arbiter is in the clock of the controller
+        m.submodules.arbiter = DomainRenamer({"sync": "sdram"})(self.arbiter)
+        arbiter = self.arbiter
+
+        m.d.comb += [
+            ctrl.init.eq(self.i_init),
+            ctrl.ds.eq(arbiter.o_ds),
+            ctrl.addr.eq(arbiter.o_addr),
+            ctrl.valid.eq(arbiter.o_req_read | arbiter.o_req_write),
+            ctrl.we.eq(arbiter.o_req_write),
+            ctrl.burst.eq(arbiter.o_burst),
+            ctrl.din.eq(arbiter.o_data),
+            arbiter.i_req_ready.eq(ctrl.ready),
+            arbiter.i_data_burst.eq(ctrl.dout_burst),
+            arbiter.i_data_burst_valid.eq(ctrl.dout_burst_valid),
+        ]
+
+        return m
+
+
+def simulate(dut, block, time):
+    slow, cpu, loader, display = dut.arbiter.ports
+    model = SdramModel(dut.ctrl)
+    rng = np.random.default_rng(1)
+    data = [int(d) for d in rng.integers(0, 1 << 16, size=block)]
+    stats = {"cpu": 0, "loader": 0, "display": 0, "slow": 0, "errors": []}
+    loaded = []
+
+    sim = Simulator(dut)
+    sim.add_clock(10e-9, domain="sdram")
+    sim.add_clock(CPU_PERIOD, domain="cpu")
+    sim.add_clock(PIXEL_PERIOD, domain="pixel")
+    sim.add_clock(SPI_PERIOD, domain="spi")
+    sim.add_clock(SLOW_PERIOD, domain="slow")
+    sim.add_sync_process(model.process, domain="sdram")
+
+    def init():
+        yield dut.i_init.eq(1)
+        for _ in range(16):
+            yield
+        yield dut.i_init.eq(0)
+    sim.add_sync_process(init, domain="sdram")
+
+    def request(port, addr, we=0, value=0, burst=0):
+        yield port.i_addr.eq(addr)
+        yield port.i_we.eq(we)
+        yield port.i_data.eq(value)
+        yield port.i_burst.eq(burst)
+        yield port.i_valid.eq(1)
+        yield
+        while not (yield port.o_ready):
+            yield
+        yield port.i_valid.eq(0)
+
+    # The loader writes the block the display shows, then keeps writing
+    # somewhere else
+    def loader_process():
+        # Wait for the SDRAM initialization
+        for _ in range(300):
+            yield
+        for addr, value in enumerate(data):
+            yield from request(loader, addr, 1, value)
+        loaded.append(True)
+        addr = 0
+        while True:
+            yield from request(loader, (1 << 17) + addr, 1, addr)
+            stats["loader"] += 1
+            addr += 1
+    sim.add_sync_process(loader_process, domain="spi")
+
+    # The CPU makes random writes, and reads that wait for the data
+    def cpu_process():
+        ref = {}
+        while not loaded:
+            yield
+        while True:
+            addr = (1 << 16) + int(rng.integers(0, 64))
+            if rng.integers(0, 2) or addr not in ref:
+                value = int(rng.integers(0, 1 << 16))
+                ref[addr] = value
+                yield from request(cpu, addr, 1, value)
+            else:
+                yield from request(cpu, addr)
+                yield cpu.i_rd_ready.eq(1)
+                yield
+                while not (yield cpu.o_rd_valid):
+                    yield
+                yield cpu.i_rd_ready.eq(0)
+                value = (yield cpu.o_rd_data) & 0xffff
+                if value != ref[addr]:
+                    stats["errors"].append("CPU read {:04x} at {:x}, not {:04x}".format(value, addr, ref[addr]))
+            stats["cpu"] += 1
+    sim.add_sync_process(cpu_process, domain="cpu")
+
+    # The display reads the block over and over, a request and a word
+    # every pixel clock at most
+    def display_process():
+        words = dut.arbiter.burst_words
+        step = 512 if dut.arbiter.burst_length == "page" else words
+        yield display.i_rd_ready.eq(1)
+        while not loaded:
+            yield
+        addr = 0
+        checked = 0
+        yield display.i_burst.eq(1)
+        while True:
+            yield display.i_addr.eq(addr)
+            yield display.i_valid.eq(1)
+            yield
+            if (yield display.o_ready):
+                addr = (addr + step) % block
+            if (yield display.o_rd_valid):
+                value = yield display.o_rd_data
+                for i in range(words):
+                    if (value >> (16 * i)) & 0xffff != data[(checked + i) % block]:
+                        stats["errors"].append("Display read at {}".format(checked + i))
+                checked += words
+                stats["display"] += words
+    sim.add_sync_process(display_process, domain="pixel")
+
+    # The slow client asks for bursts all the time, but takes their data
+    # every 32 of its clocks, so reads wait for room in its FIFO. A lost burst
+    # puts the words after it out of step.
+    def slow_process():
+        words = dut.arbiter.burst_words
+        step = 512 if dut.arbiter.burst_length == "page" else words
+        while not loaded:
+            yield
+        # The last writes of the loader, from its request FIFO
+        for _ in range(100):
+            yield
+        addr = 0
+        checked = 0
+        clock = 0
+        yield slow.i_burst.eq(1)
+        yield slow.i_valid.eq(1)
+        while True:
+            take = clock % 32 == 0
+            yield slow.i_rd_ready.eq(take)
+            yield slow.i_addr.eq(addr)
+            yield
+            if (yield slow.o_ready):
+                addr = (addr + step) % block
+            if take and (yield slow.o_rd_valid):
+                value = yield slow.o_rd_data
+                for i in range(words):
+                    if (value >> (16 * i)) & 0xffff != data[(checked + i) % block]:
+                        stats["errors"].append("Slow read at {}".format(checked + i))
+                checked += words
+                stats["slow"] += words
+            clock += 1
+    sim.add_sync_process(slow_process, domain="slow")
+
+    sim.run_until(time, run_passive=True)
+
+    return stats, model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--arbitration", choices=["priority", "round_robin"], default=None, help="default both")
+    parser.add_argument("--no-lane", action="store_true", help="without a lane for the display")
+    parser.add_argument("--burst-length", choices=["4", "8", "page"], default=None, help="default 4 and page")
+    parser.add_argument("--block", type=int, default=512, help="a multiple of 512 for page bursts")
+    parser.add_argument("--time", type=float, default=300e-6)
+    args = parser.parse_args()
+
+    failed = False
+    burst_lengths = [args.burst_length] if args.burst_length else ["4", "page"]
+    for burst_length in [int(b) if b.isdigit() else b for b in burst_lengths]:
+        for arbitration in [args.arbitration] if args.arbitration else ["priority", "round_robin"]:
+            for lane in [False] if args.no_lane else [False, True]:
+                stats, model = simulate(ArbiterTest(arbitration, lane, burst_length), args.block, args.time)
+                errors = stats["errors"] + model.errors
+                if not stats["display"]:
+                    errors.append("No display reads")
+                if not stats["slow"]:
+                    errors.append("No slow client reads")
+                failed |= bool(errors)
+                print("burst {}, {}, {}: CPU {} accesses, loader {:.1f} MB/s, display {:.1f} MB/s, "
+                      "slow {:.1f} MB/s: {}".format(
+                    burst_length, arbitration, "display lane" if lane else "no lane", stats["cpu"],
+                    2e-6 * stats["loader"] / args.time, 2e-6 * stats["display"] / args.time,
+                    2e-6 * stats["slow"] / args.time,
+                    "FAILED" if errors else "PASSED"))
+                for error in errors[:10]:
+                    print(error)
+
+    print("FAILED" if failed else "PASSED")
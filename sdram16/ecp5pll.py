@@ -11,6 +11,10 @@ class ECP5PLL(Elaboratable):
     provides up to four clock outputs, but the last output (CLKOS3) is fed back into the feedback input.
 
     The frequency ranges are based on: https://github.com/YosysHQ/prjtrellis/blob/master/libtrellis/tools/ecppll.cpp
+
+    With dynamic_phase, the phase of an output is stepped at run time: phase_sel selects the output, see
+    phase_sel_of, and each pulse of phase_step moves it by 1/8 of the VCO period, later or earlier with
+    phase_dir. phase_steps gives the steps in a period of an output.
     """
     num_clkouts_max = 3
 
@@ -21,9 +25,14 @@ class ECP5PLL(Elaboratable):
     clko_freq_range = (3.125e6, 400e6)
     vco_freq_range = (400e6, 800e6)
 
-    def __init__(self):
+    def __init__(self, dynamic_phase=False):
         self.reset = Signal()
         self.locked = Signal()
+        self.dynamic_phase = dynamic_phase
+        self.phase_sel = Signal(2)
+        self.phase_dir = Signal()
+        self.phase_step = Signal()
+        self.phase_loadreg = Signal()
         self.clkin_freq = None
         self.vcxo_freq = None
         self.num_clkouts = 0
@@ -94,6 +103,14 @@ class ECP5PLL(Elaboratable):
                     return config
         raise ValueError("No PLL config found")
 
+    def phase_sel_of(self, n):
+        """The phase_sel of clock output n"""
+        return {0: 0b11, 1: 0b00, 2: 0b01}[n]
+
+    def phase_steps(self, n):
+        """Dynamic phase steps in a period of clock output n"""
+        return 8 * self.compute_config()["clko{}_div".format(n)]
+
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
@@ -116,6 +133,16 @@ class ECP5PLL(Elaboratable):
             p_CLKI_DIV=config["clki_div"],
         )
 
+        if self.dynamic_phase:
+            self.params.update(
+                p_DPHASE_SOURCE="ENABLED",
+                i_PHASESEL1=self.phase_sel[1],
+                i_PHASESEL0=self.phase_sel[0],
+                i_PHASEDIR=self.phase_dir,
+                i_PHASESTEP=self.phase_step,
+                i_PHASELOADREG=self.phase_loadreg,
+            )
+
         for n, (clock_domain, frequency, phase, margin) in sorted(self.clkouts.items()):
             n_to_l = {0: "P", 1: "S", 2: "S2"}
             div = config["clko{}_div".format(n)]
@@ -0,0 +1,97 @@
+# micropython ESP32
+# SDRAM loader for the SPI to SDRAM DMA, spi_dma.py
+
+# this code is SPI master to FPGA SPI slave
+# bytes written below 32MB go to the SDRAM, the FPGA keeps a CRC-32
+# of them, and can read a block of the SDRAM back and compute its CRC-32
+
+# from machine import SPI, Pin
+# spi=SPI(2, baudrate=4000000, polarity=0, phase=0, bits=8, firstbit=SPI.MSB, sck=Pin(16), mosi=Pin(4), miso=Pin(12))
+# ld=ld_sdram(spi, Pin(5, Pin.OUT))
+# ld.load_file("/sd/nes/rom.nes", addr=0)
+
+from struct import pack, unpack
+from binascii import crc32
+from time import sleep_ms
+
+class ld_sdram:
+  def __init__(self,spi,cs,regs=0xF2):
+    self.spi=spi
+    self.cs=cs
+    self.cs.off()
+    self.regs=regs << 24
+
+  def write(self, addr, data):
+    self.cs.on()
+    self.spi.write(bytearray([0,(addr >> 24) & 0xFF, (addr >> 16) & 0xFF, (addr >> 8) & 0xFF, addr & 0xFF]))
+    self.spi.write(data)
+    self.cs.off()
+
+  def read(self, addr, length):
+    block = bytearray(length)
+    self.cs.on()
+    self.spi.write(bytearray([1,(addr >> 24) & 0xFF, (addr >> 16) & 0xFF, (addr >> 8) & 0xFF, addr & 0xFF, 0]))
+    self.spi.readinto(block)
+    self.cs.off()
+    return block
+
+  # DMA registers
+  def reg(self, offset):
+    return unpack("<I", self.read(self.regs | offset, 4))[0]
+
+  def crc(self):
+    return self.reg(0)
+
+  def bytes_written(self):
+    return self.reg(8)
+
+  def busy(self):
+    return self.reg(12) & 3
+
+  # words lost to a full write FIFO since the last clear
+  def overflow(self):
+    return self.reg(12) & 4
+
+  def clear(self):
+    self.write(self.regs | 12, bytearray([1]))
+
+  # CRC-32 of a block of the SDRAM, read back by the FPGA
+  def verify(self, addr, length):
+    self.write(self.regs, pack("<II", addr, length))
+    self.write(self.regs | 12, bytearray([2]))
+    while self.busy():
+      sleep_ms(1)
+    return self.reg(4)
+
+  # read from file -> write to SDRAM, returns the CRC-32 of the data
+  def load_stream(self, filedata, addr=0, maxlen=0x2000000, blocksize=1024):
+    block = bytearray(blocksize)
+    crc = 0
+    self.clear()
+    # Request load
+    self.cs.on()
+    self.spi.write(bytearray([0,(addr >> 24) & 0xFF, (addr >> 16) & 0xFF, (addr >> 8) & 0xFF, addr & 0xFF]))
+    bytes_loaded = 0
+    while bytes_loaded < maxlen:
+      n = filedata.readinto(block)
+      if n:
+        data = memoryview(block)[:min(n, maxlen - bytes_loaded)]
+        self.spi.write(data)
+        crc = crc32(data, crc)
+        bytes_loaded += len(data)
+      else:
+        break
+    self.cs.off()
+    if self.overflow():
+      raise OSError("SDRAM load overflow, lower the SPI baudrate")
+    if self.bytes_written() != bytes_loaded or self.crc() != crc:
+      raise OSError("SDRAM load CRC error")
+    return bytes_loaded, crc
+
+  # load a file, and check it is in the SDRAM
+  def load_file(self, filename, addr=0, verify=True):
+    with open(filename, "rb") as filedata:
+      length, crc = self.load_stream(filedata, addr)
+    if verify and self.verify(addr, length) != crc:
+      raise OSError("SDRAM verify error")
+    return length
@@ -0,0 +1,153 @@
+from amaranth import *
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.fifo import AsyncFIFO
+
+# Double buffered 16-bit (RGB565) framebuffer in SDRAM for the VGA generator.
+#
+# The sync domain side drives the Sdram controller port, and must be in the
+# clock of the controller, see DomainRenamer. Scan lines are read in 4 word
+# bursts into a line FIFO ahead of the beam, and the pixel domain side takes
+# a pixel from it on every o_fetch_next of the VGA generator.
+#
+# Producers write words of the back buffer with i_wr_addr, i_wr_data and
+# i_wr_en when o_wr_ready is set, and swap the buffers with i_flip, which
+# takes effect at the next vsync. While o_flip_pending is set, the back
+# buffer is still being shown.
+#
+# Reads take all requests while the FIFO has room for their data, writes
+# take the others.
+class Framebuffer(Elaboratable):
+    def __init__(self,
+                 width          = 640,
+                 height         = 480,
+                 base           = 0,   # Word address of the first buffer
+                 fifo_depth     = 256): # Bursts of 4 words
+        # Sdram port, sync domain
+        self.o_addr       = Signal(24)
+        self.o_req_read   = Signal()
+        self.o_req_write  = Signal()
+        self.i_req_ready  = Signal()
+        self.o_burst      = Signal()
+        self.o_data       = Signal(16)
+        self.i_data_burst = Signal(64)
+        self.i_data_burst_valid = Signal()
+        # Producer, sync domain
+        self.i_wr_addr    = Signal(range(width * height))
+        self.i_wr_data    = Signal(16)
+        self.i_wr_en      = Signal()
+        self.o_wr_ready   = Signal()
+        self.i_flip       = Signal()
+        self.o_flip_pending = Signal()
+        # VGA generator, pixel domain
+        self.i_fetch_next = Signal()
+        self.i_vsync      = Signal()
+        self.o_r          = Signal(8)
+        self.o_g          = Signal(8)
+        self.o_b          = Signal(8)
+        # Configuration
+        self.width = width
+        self.height = height
+        self.base = base
+        self.fifo_depth = fifo_depth
+        # Buffers are 4 word aligned for the bursts
+        self.page = (width * height + 3) & ~3
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bursts = self.page // 4
+
+        # Bursts with a flag for the first one of each frame
+        m.submodules.fifo = fifo = AsyncFIFO(width=65, depth=self.fifo_depth, r_domain="pixel", w_domain="sync")
+
+        # Sync domain
+        vsync   = Signal()
+        R_vsync = Signal()
+        m.submodules.vsync_sync = FFSynchronizer(self.i_vsync, vsync, o_domain="sync")
+        m.d.sync += R_vsync.eq(vsync)
+
+        R_front   = Signal()
+        R_flip    = Signal()
+        R_burst   = Signal(range(bursts + 1)) # Next burst of the frame
+        R_return  = Signal(range(bursts))     # Next burst to come back
+
+        # Bursts requested that are not in the FIFO yet
+        in_flight = Signal(range(self.fifo_depth + 1))
+        want_read = Signal()
+        sent      = Signal()
+
+        m.d.comb += [
+            want_read.eq((R_burst != bursts) & (fifo.w_level + in_flight < self.fifo_depth - 1)),
+            sent.eq(want_read & self.i_req_ready),
+            self.o_wr_ready.eq(~want_read & self.i_req_ready),
+            self.o_flip_pending.eq(R_flip),
+            self.o_req_read.eq(want_read),
+            self.o_req_write.eq(~want_read & self.i_wr_en),
+            self.o_burst.eq(1),
+            self.o_data.eq(self.i_wr_data),
+        ]
+
+        with m.If(want_read):
+            m.d.comb += self.o_addr.eq(self.base + Mux(R_front, self.page, 0) + (R_burst << 2))
+        with m.Else():
+            m.d.comb += self.o_addr.eq(self.base + Mux(R_front, 0, self.page) + self.i_wr_addr)
+
+        m.d.sync += in_flight.eq(in_flight + sent - self.i_data_burst_valid)
+
+        with m.If(self.i_flip):
+            m.d.sync += R_flip.eq(1)
+
+        # A new frame is read from the vsync after the last one was read,
+        # from the other buffer after a flip
+        with m.If(vsync & ~R_vsync & (R_burst == bursts)):
+            m.d.sync += R_burst.eq(0)
+            with m.If(R_flip):
+                m.d.sync += [
+                    R_front.eq(~R_front),
+                    R_flip.eq(0),
+                ]
+        with m.Elif(sent):
+            m.d.sync += R_burst.eq(R_burst + 1)
+
+        # Bursts come back in order, the first of a frame is flagged
+        with m.If(self.i_data_burst_valid):
+            m.d.sync += R_return.eq(Mux(R_return == bursts - 1, 0, R_return + 1))
+
+        m.d.comb += [
+            fifo.w_data.eq(Cat(self.i_data_burst, R_return == 0)),
+            fifo.w_en.eq(self.i_data_burst_valid),
+        ]
+
+        # Pixel domain: 4 pixels per burst. At vsync, anything left of a
+        # frame that was not shown in full is dropped.
+        R_word    = Signal(2)
+        R_skip    = Signal()
+        R_vsync_p = Signal()
+        pixel     = Signal(16)
+        first     = fifo.r_data[64]
+
+        m.d.pixel += R_vsync_p.eq(self.i_vsync)
+        m.d.comb += pixel.eq(fifo.r_data.word_select(R_word, 16))
+
+        with m.If(self.i_vsync & ~R_vsync_p):
+            m.d.pixel += [
+                R_skip.eq(1),
+                R_word.eq(0),
+            ]
+        with m.Elif(R_skip):
+            with m.If(fifo.r_rdy & first):
+                m.d.pixel += R_skip.eq(0)
+            with m.Else():
+                m.d.comb += fifo.r_en.eq(1)
+        with m.Elif(self.i_fetch_next & fifo.r_rdy):
+            m.d.pixel += R_word.eq(R_word + 1)
+            m.d.comb += fifo.r_en.eq(R_word == 3)
+
+        with m.If(fifo.r_rdy & ~R_skip):
+            m.d.comb += [
+                self.o_r.eq(Cat(pixel[13:16], pixel[11:16])),
+                self.o_g.eq(Cat(pixel[9:11], pixel[5:11])),
+                self.o_b.eq(Cat(pixel[2:5], pixel[0:5])),
+            ]
+
+        return m
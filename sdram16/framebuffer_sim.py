@@ -0,0 +1,175 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from sdram16 import Sdram
+from sdram_model import SdramModel
+from framebuffer import Framebuffer
+from vga import VGA
+
+# Simulation of the SDRAM framebuffer with the VGA generator.
+#
+# The Sdram controller runs against the SDRAM model, with the framebuffer in
+# the sdram domain as on the board. A producer writes a frame into
+# the back buffer and flips, then writes a second frame and flips again.
+# The displayed frames must be the first frame and then the second one.
+#
+#   python framebuffer_sim.py
+#   python framebuffer_sim.py --width 32 --height 8
+
+
+class FramebufferPipeline(Elaboratable):
+    def __init__(self, width, height):
+        self.i_init = Signal()
+        self.o_r    = Signal(8)
+        self.o_g    = Signal(8)
+        self.o_b    = Signal(8)
+        self.o_de   = Signal()
+        self.o_vsync = Signal()
+        # Submodules the simulation drives
+        self.ctrl = Sdram()
+        self.fb   = Framebuffer(width, height, fifo_depth=16)
+        self.fb_sdram = DomainRenamer({"sync": "sdram"})(self.fb)
+        self.vga  = VGA(
+            resolution_x      = width,
+            hsync_front_porch = 4,
+            hsync_pulse       = 4,
+            hsync_back_porch  = 4,
+            resolution_y      = height,
+            vsync_front_porch = 1,
+            vsync_pulse       = 1,
+            vsync_back_porch  = 1,
+            bits_x            = 10,
+            bits_y            = 10
+        )
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.ctrl = ctrl = self.ctrl
+        m.submodules.fb   = self.fb_sdram
+        fb = self.fb
+        m.submodules.vga  = vga  = self.vga
+
+        m.d.comb += [
+            ctrl.init.eq(self.i_init),
+            ctrl.addr.eq(fb.o_addr),
+            ctrl.valid.eq(fb.o_req_read | fb.o_req_write),
+            ctrl.we.eq(fb.o_req_write),
+            fb.i_req_ready.eq(ctrl.ready),
+            ctrl.burst.eq(fb.o_burst),
+            ctrl.din.eq(fb.o_data),
+            ctrl.ds.eq(0b11),
+            fb.i_data_burst.eq(ctrl.dout_burst),
+            fb.i_data_burst_valid.eq(ctrl.dout_burst_valid),
+            fb.i_fetch_next.eq(vga.o_fetch_next),
+            fb.i_vsync.eq(vga.o_vga_vsync),
+            vga.i_clk_en.eq(1),
+            vga.i_test_picture.eq(0),
+            vga.i_r.eq(fb.o_r),
+            vga.i_g.eq(fb.o_g),
+            vga.i_b.eq(fb.o_b),
+            self.o_r.eq(vga.o_vga_r),
+            self.o_g.eq(vga.o_vga_g),
+            self.o_b.eq(vga.o_vga_b),
+            self.o_de.eq(vga.o_vga_de),
+            self.o_vsync.eq(vga.o_vga_vsync),
+        ]
+
+        return m
+
+
+def rgb565(image):
+    r = (image >> 11) & 0x1f
+    g = (image >> 5) & 0x3f
+    b = image & 0x1f
+    return (((r << 3) | (r >> 2)) << 16) | (((g << 2) | (g >> 4)) << 8) | ((b << 3) | (b >> 2))
+
+
+def simulate(dut, images, frames):
+    height, width = images[0].shape
+    shown = []
+    model = SdramModel(dut.ctrl)
+
+    sim = Simulator(dut)
+    sim.add_clock(10e-9, domain="sdram")
+    sim.add_clock(40e-9, domain="pixel")
+    sim.add_sync_process(model.process, domain="sdram")
+
+    def init():
+        yield dut.i_init.eq(1)
+        for _ in range(16):
+            yield
+        yield dut.i_init.eq(0)
+    sim.add_sync_process(init, domain="sdram")
+
+    def producer():
+        fb = dut.fb
+        # Wait for the SDRAM initialization
+        for _ in range(300):
+            yield
+        for image in images:
+            for addr, value in enumerate(image.reshape(-1)):
+                yield fb.i_wr_addr.eq(addr)
+                yield fb.i_wr_data.eq(int(value))
+                yield fb.i_wr_en.eq(1)
+                yield
+                while not (yield fb.o_wr_ready):
+                    yield
+            yield fb.i_wr_en.eq(0)
+            yield fb.i_flip.eq(1)
+            yield
+            yield fb.i_flip.eq(0)
+            yield
+            while (yield fb.o_flip_pending):
+                yield
+    sim.add_sync_process(producer, domain="sdram")
+
+    def display():
+        pixels = []
+        vsync = 0
+        while len(shown) < frames:
+            yield
+            if (yield dut.o_de):
+                pixels.append(((yield dut.o_r) << 16) | ((yield dut.o_g) << 8) | (yield dut.o_b))
+            if (yield dut.o_vsync) and not vsync:
+                if len(pixels) == width * height:
+                    shown.append(np.array(pixels).reshape(height, width))
+                pixels = []
+            vsync = yield dut.o_vsync
+    sim.add_sync_process(display, domain="pixel")
+
+    sim.run_until(1e-9 * 40 * frames * (width + 12) * (height + 3) * 2, run_passive=True)
+
+    return shown, model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=16)
+    parser.add_argument("--height", type=int, default=6)
+    parser.add_argument("--frames", type=int, default=12)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    images = [rng.integers(0, 1 << 16, size=(args.height, args.width)) for _ in range(2)]
+
+    shown, model = simulate(FramebufferPipeline(args.width, args.height), images, args.frames)
+
+    # The VGA generator sends black for the first pixel of each line, so
+    # the last pixel of each line is not shown
+    expected = [rgb565(image)[:, :-1] for image in images]
+    sequence = []
+    for frame in shown:
+        match = [i for i, e in enumerate(expected) if (frame[:, 1:] == e).all()]
+        sequence.append(match[0] if match else None)
+
+    print("Frames shown:", len(shown), "images:", sequence)
+    for error in model.errors[:10]:
+        print(error)
+    ok = (not model.errors and 0 in sequence and 1 in sequence and
+          sequence.index(0) < sequence.index(1) and None not in sequence[sequence.index(0):])
+    print("PASSED" if ok else "FAILED")
@@ -0,0 +1,217 @@
+from amaranth import *
+
+from sdram_bist import LFSR_SEED, lfsr_next
+
+# Calibration of the phase of the SDRAM clock, with the dynamic phase steps
+# of the PLL, see ECP5PLL.
+#
+# At each phase step of a whole period, a short test writes test_words words
+# and reads them back with bursts. Then the longest run of steps that passed,
+# going round the period, is found, and the clock is stepped to its centre.
+# The test data is an LFSR, with every other word complemented, so all the
+# data lines change on every word.
+#
+# The calibration uses mem, with the signals of sdram_controller, until
+# o_done, then passes its own signals of the same names through to mem, so
+# a client, such as SdramBist, runs at the phase found. o_results has a bit
+# for each step that passed, o_phase the step chosen, from the phase at the
+# start, and o_window the length of the run, 0 if none passed.
+class PhaseCalibration(Elaboratable):
+    def __init__(self, mem, steps, test_words=256, settle=1024, step_clocks=8):
+        self.mem = mem
+        self.steps = steps
+        self.test_words = test_words
+        self.settle = settle
+        self.step_clocks = step_clocks
+
+        # PLL dynamic phase, connect to phase_step of ECP5PLL
+        self.o_phase_step = Signal()
+
+        # Results
+        self.o_done    = Signal()
+        self.o_results = Signal(steps)
+        self.o_phase   = Signal(range(steps))
+        self.o_window  = Signal(range(steps + 1))
+
+        # Client, after the calibration
+        self.burst_length = mem.burst_length
+        self.address   = Signal(24)
+        self.req_read  = Signal()
+        self.req_write = Signal()
+        self.burst     = Signal()
+        self.data_in   = Signal(16)
+        self.req_ready = Signal()
+        self.data_out  = Signal(16)
+        self.data_valid = Signal()
+        self.data_out_burst = Signal(len(mem.data_out_burst))
+        self.data_burst_valid = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        mem = self.mem
+        step = 512 if mem.burst_length == "page" else mem.burst_length
+        words = self.test_words
+
+        # Read data to the client at all times, requests after the calibration
+        m.d.comb += [
+            self.data_out.eq(mem.data_out),
+            self.data_valid.eq(mem.data_valid),
+            self.data_out_burst.eq(mem.data_out_burst),
+            self.data_burst_valid.eq(mem.data_burst_valid),
+        ]
+
+        with m.If(self.o_done):
+            m.d.comb += [
+                mem.address.eq(self.address),
+                mem.req_read.eq(self.req_read),
+                mem.req_write.eq(self.req_write),
+                mem.burst.eq(self.burst),
+                mem.data_in.eq(self.data_in),
+                self.req_ready.eq(mem.req_ready),
+            ]
+
+        n_req    = Signal(range(words + step + 1))
+        n_chk    = Signal(range(words + 1))
+        req_lfsr = Signal(16, reset=LFSR_SEED)
+        chk_lfsr = Signal(16, reset=LFSR_SEED)
+        err      = Signal()
+        wait     = Signal(range(max(self.settle, 2 * self.step_clocks) + 1))
+        current  = Signal(range(self.steps))   # Step being tested
+        moves    = Signal(range(self.steps + 1)) # Steps to make
+        swept    = Signal()                      # All steps tested
+
+        # Scan of the results, twice round for the windows that wrap
+        scan     = Signal(self.steps)
+        index    = Signal(range(2 * self.steps))
+        run      = Signal(range(self.steps + 1))
+        best_end = Signal(range(2 * self.steps))
+        centre   = Signal(range(2 * self.steps))
+
+        taken = Signal()
+        m.d.comb += taken.eq(mem.req_ready & (mem.req_read | mem.req_write))
+
+        with m.FSM(domain="sdram"):
+            with m.State("SETTLE"):
+                m.d.sdram += wait.eq(wait + 1)
+                with m.If(wait == self.settle - 1):
+                    m.d.sdram += [
+                        wait.eq(0),
+                        n_req.eq(0),
+                        n_chk.eq(0),
+                        req_lfsr.eq(LFSR_SEED),
+                        chk_lfsr.eq(LFSR_SEED),
+                        err.eq(0),
+                    ]
+                    m.next = "WRITE"
+
+            with m.State("WRITE"):
+                m.d.comb += [
+                    mem.address.eq(n_req),
+                    mem.req_write.eq(1),
+                    mem.data_in.eq(req_lfsr ^ Mux(n_req[0], 0xffff, 0)),
+                ]
+                with m.If(taken):
+                    m.d.sdram += [
+                        n_req.eq(n_req + 1),
+                        req_lfsr.eq(lfsr_next(req_lfsr)),
+                    ]
+                    with m.If(n_req == words - 1):
+                        m.d.sdram += n_req.eq(0)
+                        m.next = "READ"
+
+            with m.State("READ"):
+                m.d.comb += [
+                    mem.address.eq(n_req),
+                    mem.req_read.eq(n_req < words),
+                    mem.burst.eq(1),
+                ]
+                with m.If(taken):
+                    m.d.sdram += n_req.eq(n_req + step)
+                with m.If(n_chk == words):
+                    m.d.sdram += self.o_results.bit_select(current, 1).eq(~err)
+                    with m.If(current == self.steps - 1):
+                        m.d.sdram += swept.eq(1)
+                    m.next = "STEP"
+
+            # A pulse of the PLL phase step, to the next step
+            with m.State("STEP"):
+                m.d.sdram += wait.eq(wait + 1)
+                m.d.comb += self.o_phase_step.eq(wait < self.step_clocks)
+                with m.If(wait == 2 * self.step_clocks - 1):
+                    m.d.sdram += wait.eq(0)
+                    with m.If(swept):
+                        # Back to the start, after a whole period
+                        m.d.sdram += [
+                            scan.eq(self.o_results),
+                            index.eq(0),
+                            run.eq(0),
+                            self.o_window.eq(0),
+                        ]
+                        m.next = "SCAN"
+                    with m.Else():
+                        m.d.sdram += current.eq(current + 1)
+                        m.next = "SETTLE"
+
+            with m.State("SCAN"):
+                m.d.sdram += [
+                    scan.eq(Cat(scan[1:], scan[0])),
+                    index.eq(index + 1),
+                ]
+                with m.If(scan[0]):
+                    with m.If(run != self.steps):
+                        m.d.sdram += run.eq(run + 1)
+                        with m.If(run + 1 > self.o_window):
+                            m.d.sdram += [
+                                self.o_window.eq(run + 1),
+                                best_end.eq(index),
+                            ]
+                with m.Else():
+                    m.d.sdram += run.eq(0)
+                with m.If(index == 2 * self.steps - 1):
+                    m.next = "CENTRE"
+
+            with m.State("CENTRE"):
+                m.d.comb += centre.eq(best_end - ((self.o_window - 1) >> 1))
+                m.d.sdram += [
+                    self.o_phase.eq(Mux(centre >= self.steps, centre - self.steps, centre)),
+                    moves.eq(Mux(centre >= self.steps, centre - self.steps, centre)),
+                ]
+                with m.If(self.o_window == 0):
+                    m.d.sdram += [
+                        self.o_phase.eq(0),
+                        moves.eq(0),
+                    ]
+                m.next = "MOVE"
+
+            with m.State("MOVE"):
+                with m.If(moves == 0):
+                    m.next = "SETTLE_DONE"
+                with m.Else():
+                    m.d.sdram += wait.eq(wait + 1)
+                    m.d.comb += self.o_phase_step.eq(wait < self.step_clocks)
+                    with m.If(wait == 2 * self.step_clocks - 1):
+                        m.d.sdram += [
+                            wait.eq(0),
+                            moves.eq(moves - 1),
+                        ]
+
+            with m.State("SETTLE_DONE"):
+                m.d.sdram += wait.eq(wait + 1)
+                with m.If(wait == self.settle - 1):
+                    m.d.sdram += self.o_done.eq(1)
+                    m.next = "DONE"
+
+            with m.State("DONE"):
+                pass
+
+        # Check the words read
+        with m.If(mem.data_valid & ~self.o_done):
+            m.d.sdram += [
+                n_chk.eq(n_chk + 1),
+                chk_lfsr.eq(lfsr_next(chk_lfsr)),
+            ]
+            with m.If(mem.data_out != (chk_lfsr ^ Mux(n_chk[0], 0xffff, 0))):
+                m.d.sdram += err.eq(1)
+
+        return m
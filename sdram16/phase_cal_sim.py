@@ -0,0 +1,104 @@
+import argparse
+
+from amaranth.sim import Simulator
+
+from sdram_sim import ControllerSim, SDRAM_PERIOD
+from sdram_model import SdramModel
+from sdram_bist_sim import key
+from phase_cal import PhaseCalibration
+
+# Simulation of the SDRAM clock phase calibration against the SDRAM model.
+#
+# The PLL is modelled by counting the phase steps, and a bit of the data
+# read is stuck at the phases outside a window, as when the data is sampled
+# too close to its edges. The calibration must pick the centre of the
+# window, also when it wraps round the period, and then pass a client's
+# writes and reads through at that phase.
+#
+#   python phase_cal_sim.py
+#   python phase_cal_sim.py --steps 24 --window 20 6
+
+TEST_WORDS = 64
+
+
+def simulate(steps, first, length, burst_length):
+    dut = ControllerSim(PhaseCalibration, burst_length, steps=steps, test_words=TEST_WORDS,
+                        settle=16, step_clocks=2)
+    cal = dut.test
+    model = SdramModel(dut.ctrl)
+    good = [(first + i) % steps for i in range(length)]
+    result = {"phase": 0, "client": []}
+
+    sim = Simulator(dut)
+    sim.add_clock(SDRAM_PERIOD, domain="sdram")
+    sim.add_sync_process(model.process, domain="sdram")
+
+    # The PLL, reads are bad outside the window
+    def pll():
+        phase = 0
+        last = 0
+        while not (yield cal.o_done):
+            step = yield cal.o_phase_step
+            if step and not last:
+                phase = (phase + 1) % steps
+            last = step
+            faults = {} if phase in good else {key(a): (0x0100, 0x0100) for a in range(TEST_WORDS)}
+            model.faults.clear()
+            model.faults.update(faults)
+            yield
+        result["phase"] = phase
+
+    def process():
+        yield dut.i_init.eq(1)
+        yield
+        yield dut.i_init.eq(0)
+        yield from pll()
+
+        # A client through the calibration
+        for addr in range(4):
+            yield cal.address.eq(0x1000 + addr)
+            yield cal.data_in.eq(0x5a00 + addr)
+            yield cal.req_write.eq(1)
+            yield
+            while not (yield cal.req_ready):
+                yield
+        yield cal.req_write.eq(0)
+        yield cal.address.eq(0x1000)
+        yield cal.req_read.eq(1)
+        yield
+        while not (yield cal.req_ready):
+            yield
+        yield cal.req_read.eq(0)
+        while len(result["client"]) < burst_length:
+            yield
+            if (yield cal.data_valid):
+                result["client"].append((yield cal.data_out))
+    sim.add_sync_process(process, domain="sdram")
+    sim.run()
+
+    return result, model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=32, help="phase steps in a period")
+    parser.add_argument("--window", type=int, nargs=2, default=None, metavar=("FIRST", "LENGTH"),
+                        help="default a window inside the period and one that wraps")
+    parser.add_argument("--burst-length", choices=["1", "2", "4"], default="4")
+    args = parser.parse_args()
+
+    windows = [tuple(args.window)] if args.window else [(9, 12), (args.steps - 5, 11)]
+    failed = False
+    for first, length in windows:
+        result, model = simulate(args.steps, first, length, int(args.burst_length))
+        want = (first + length - 1 - (length - 1) // 2) % args.steps
+        client = [0x5a00 + i for i in range(int(args.burst_length))]
+        ok = not model.errors and result["phase"] == want and result["client"] == client
+        failed |= not ok
+        print("Window of {} steps from {}: phase {}, centre {}, client {}: {}".format(
+            length, first, result["phase"], want, "read back" if result["client"] == client else "FAILED",
+            "PASSED" if ok else "FAILED"))
+        for error in model.errors[:10]:
+            print(error)
+
+    print("FAILED" if failed else "PASSED")
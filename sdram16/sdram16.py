@@ -1,8 +1,34 @@
+from math import ceil
+
 from amaranth import *
 
 # SDRAM controller with 16-bit reads and writes
+#
+# A request can be made every sdram clock, it is taken when valid and ready
+# are both set: a write of din to addr with we, else a read of addr. Reads
+# are bursts of burst_length words (1, 2, 4, 8 or "page" for the 512 words of
+# a row) from a burst_length aligned address. Bursts of 8 words and page
+# bursts are only made with burst set, else one word is read. Writes are
+# single words.
+#
+# Read data comes back in order, each word in dout when dout_valid is set,
+# and the words of a burst, 8 at a time for a page, in dout_burst when
+# dout_burst_valid is set, first word in the low bits.
+#
+# Rows are left open, a bank is only precharged when another of its rows is
+# accessed, or for refresh. A refresh is owed every refresh interval, and
+# refreshes are made when there is no request. Up to 8 of them are put off
+# while the port is busy, then one is forced before the next request, so
+# the SDRAM still gets one every refresh interval on average. While a request
+# waits for its read or write, the row of the next one is opened if it is in
+# another bank, so the activate is hidden behind the data of the one before.
+# With interleave, the bank is in the address bits just above the column, so
+# a sequential stream goes through the banks a row at a time, and streams in
+# different parts of the memory are mostly in different banks.
 class Sdram(Elaboratable):
-    def __init__(self):
+    def __init__(self, burst_length=4, interleave=False, clk_freq=100e6):
+        if burst_length not in (1, 2, 4, 8, "page"):
+            raise ValueError("Burst length must be 1, 2, 4, 8 or \"page\", not {!r}".format(burst_length))
 
         # Chip interface
         self.sd_data_in  = Signal(16)
@@ -18,45 +44,59 @@ class Sdram(Elaboratable):
 
         # Control
         self.init        = Signal()
-        self.sync        = Signal()
 
         # Port
+        self.valid       = Signal()
+        self.ready       = Signal()
         self.din         = Signal(16)
-        self.dout        = Signal(16)
         self.addr        = Signal(24) # Word address
         self.ds          = Signal(2)
-        self.oe          = Signal()
         self.we          = Signal()
+        self.burst       = Signal()
+        self.dout        = Signal(16)
+        self.dout_valid  = Signal()
+
+        # Configuration
+        self.burst_length = burst_length
+        self.interleave   = interleave
+        self.clk_freq     = clk_freq
+        # Words in dout_burst
+        self.burst_words  = 8 if burst_length == "page" else burst_length
+        self.dout_burst   = Signal(16 * self.burst_words)
+        self.dout_burst_valid = Signal()
 
     def elaborate(self, platform):
 
         m = Module()
 
+        # Timing of the IS42S16160 in sdram clocks
+        def cycles(ns):
+            return max(1, ceil(ns * self.clk_freq / 1e9))
+
+        T_RCD  = cycles(20) # Activate to read or write
+        T_RP   = cycles(20) # Precharge to activate
+        T_RAS  = cycles(42) # Activate to precharge
+        T_RC   = cycles(63) # Activate or refresh to activate or refresh
+        T_RRD  = cycles(14) # Activate to activate in another bank
+        T_WR   = 2          # Write to precharge
+        T_REFI = int(64e-3 / 8192 * self.clk_freq) # Refresh interval
+        POSTPONE = 8       # Refreshes that can be put off
+
         # Configure SDRAM access
-        RASCAS_DELAY   = C(2,3)
-        BURST_LENGTH   = C(0,3)
+        BURST_LENGTH   = C({1: 0, 2: 1, 4: 2, 8: 3, "page": 7}[self.burst_length],3)
         ACCESS_TYPE    = C(0,1)
-        CAS_LATENCY    = C(2,3)
+        # CL2 is good to 100 MHz in all the speed grades, 133 MHz in the -7
+        # and faster ones, CL3 to the top speed of each
+        CAS_LATENCY    = 2 if self.clk_freq <= 100e6 else 3
         OP_MODE        = C(0,2)
         NO_WRITE_BURST = C(1,1)
 
-        MODE = Cat([BURST_LENGTH, ACCESS_TYPE, CAS_LATENCY, OP_MODE, NO_WRITE_BURST, C(0,1)])
-
-        # States
-        STATE_FIRST     = C(0,3)
-        STATE_CMD_START = C(1,3)
-        STATE_CMD_CONT  = STATE_CMD_START + RASCAS_DELAY
-        STATE_READ      = STATE_CMD_CONT + CAS_LATENCY + C(1,3)
-        STATE_HIGHZ     = STATE_READ - C(1,3)
+        MODE = Cat([BURST_LENGTH, ACCESS_TYPE, C(CAS_LATENCY,3), OP_MODE, NO_WRITE_BURST, C(0,1)])
 
-        # Reset counts down after init set
-        reset = Signal(5)
-        stage = Signal(3)
-
-        with m.If(self.init):
-            m.d.sdram += reset.eq(C(0x1f,5))
-        with m.Elif((stage == STATE_FIRST) & (reset != 0)):
-            m.d.sdram += reset.eq(reset-1)
+        # Words of the longest read, long bursts are stopped after one word
+        # for a single read
+        long_burst = self.burst_length in (8, "page")
+        max_words  = 512 if self.burst_length == "page" else self.burst_words
 
         # SDRAM commands
         CMD_INHIBIT          = C(0b1111,4)
@@ -79,31 +119,199 @@ class Sdram(Elaboratable):
             self.sd_we.eq(sd_cmd[0])
         ]
 
-        mode     = Signal(2)
+        drive    = Signal()
         din_r    = Signal(16)
 
         m.d.comb += [
             self.sd_data_out.eq(din_r),
-            self.sd_data_dir.eq(mode[1]),
+            self.sd_data_dir.eq(drive),
         ]
 
-        addr_r   = Signal(13)
-        ds_r     = Signal(2)
-        old_sync = Signal()
+        m.d.sdram += [
+            sd_cmd.eq(CMD_INHIBIT),
+            drive.eq(0)
+        ]
 
-        with m.If(stage.any()):
-            m.d.sdram += stage.eq(stage+1)
+        # Reset counts down every 8 clocks from power on, and after init set
+        reset    = Signal(5, reset=0x1f)
+        prescale = Signal(3)
 
-        m.d.sdram += [
-            old_sync.eq(self.sync),
-            sd_cmd.eq(CMD_INHIBIT)
+        m.d.sdram += prescale.eq(prescale + 1)
+
+        with m.If(self.init):
+            m.d.sdram += reset.eq(C(0x1f,5))
+        with m.Elif((prescale == 0) & (reset != 0)):
+            m.d.sdram += reset.eq(reset-1)
+
+        # Bank, row and column of the request
+        if self.interleave:
+            col  = self.addr[:9]
+            bank = self.addr[9:11]
+            row  = self.addr[11:24]
+        else:
+            col  = Cat(self.addr[:8], self.addr[23])
+            bank = self.addr[21:23]
+            row  = self.addr[8:21]
+
+        # Request queue, the request being done and the next one
+        fields = [("we", 1), ("bank", 2), ("row", 13), ("col", 9), ("din", 16), ("ds", 2), ("burst", 1)]
+        new    = {"we": self.we, "bank": bank, "row": row, "col": col,
+                  "din": self.din, "ds": self.ds, "burst": self.burst}
+        head   = {name: Signal(width, name="head_" + name) for name, width in fields}
+        nxt    = {name: Signal(width, name="next_" + name) for name, width in fields}
+        q_valid = Signal(2)
+        push    = Signal()
+        pop     = Signal()
+
+        def load(req, values):
+            return [req[name].eq(values[name]) for name, _ in fields]
+
+        m.d.comb += [
+            self.ready.eq(~q_valid[1] & (reset == 0)),
+            push.eq(self.valid & self.ready)
+        ]
+
+        with m.If(pop):
+            with m.If(q_valid[1]):
+                m.d.sdram += load(head, nxt)
+                m.d.sdram += q_valid.eq(0b01)
+            with m.Elif(push):
+                m.d.sdram += load(head, new)
+            with m.Else():
+                m.d.sdram += q_valid.eq(0b00)
+        with m.Elif(push):
+            with m.If(q_valid[0]):
+                m.d.sdram += load(nxt, new)
+                m.d.sdram += q_valid.eq(0b11)
+            with m.Else():
+                m.d.sdram += load(head, new)
+                m.d.sdram += q_valid.eq(0b01)
+
+        # Open row of each bank, and the clocks less one until a command is
+        # allowed
+        row_open = Signal(4)
+        rows     = Array(Signal(13, name="row{}".format(i)) for i in range(4))
+        t_act    = [Signal(range(T_RC + 1), name="t_act{}".format(i)) for i in range(4)]
+        t_pre    = [Signal(range(max(T_RAS, T_WR, max_words) + 1), name="t_pre{}".format(i)) for i in range(4)]
+        t_rw     = [Signal(range(T_RCD + 1), name="t_rw{}".format(i)) for i in range(4)]
+        t_rrd    = Signal(range(T_RRD + 1))
+        t_read   = Signal(range(max_words + 1))
+        t_write  = Signal(range(CAS_LATENCY + max_words + 2))
+        t_bst    = Signal(range(max_words + 1)) # To the end of a long burst
+
+        # Keep a command off for at least the clocks from now
+        def at_least(timer, clocks):
+            return timer.eq(Mux(timer >= clocks, timer - 1, clocks - 1))
+
+        for timer in t_act + t_pre + t_rw + [t_rrd, t_read, t_write, t_bst]:
+            m.d.sdram += timer.eq(Mux(timer != 0, timer - 1, 0))
+
+        # Refreshes owed, one more every refresh interval
+        refresh_cnt = Signal(range(T_REFI))
+        refresh_tick = Signal()
+        pending     = Signal(range(POSTPONE + 1))
+        refreshing  = Signal() # Banks are being precharged for a refresh
+        refresh     = Signal()
+        refresh_cmd = Signal()
+
+        m.d.comb += refresh_tick.eq(refresh_cnt == 0)
+        m.d.sdram += refresh_cnt.eq(Mux(refresh_tick, T_REFI - 1, refresh_cnt - 1))
+
+        with m.If(refresh_tick & ~refresh_cmd & (pending != POSTPONE)):
+            m.d.sdram += pending.eq(pending + 1)
+        with m.Elif(~refresh_tick & refresh_cmd):
+            m.d.sdram += pending.eq(pending - 1)
+
+        # Refresh when the port is idle, or when the refreshes can not be put
+        # off any longer
+        m.d.comb += refresh.eq(refreshing | (pending == POSTPONE) |
+                               ((pending != 0) & ~q_valid[0] & ~self.valid))
+
+        # Commands the two requests can make now
+        t_act_a = Array(t_act)
+        t_pre_a = Array(t_pre)
+        t_rw_a  = Array(t_rw)
+
+        def bank_state(req, prefix):
+            is_open = Signal(name=prefix + "_open")
+            hit     = Signal(name=prefix + "_hit")
+            m.d.comb += [
+                is_open.eq(row_open.bit_select(req["bank"], 1)),
+                hit.eq(is_open & (rows[req["bank"]] == req["row"]))
+            ]
+            return is_open, hit
+
+        head_open, head_hit = bank_state(head, "head")
+        next_open, next_hit = bank_state(nxt, "next")
+
+        head_rw  = Signal()
+        head_pre = Signal()
+        head_act = Signal()
+        other    = Signal() # The next request is in another bank
+        next_pre = Signal()
+        next_act = Signal()
+        bst      = Signal()
+
+        m.d.comb += [
+            head_rw.eq(q_valid[0] & head_hit & (t_rw_a[head["bank"]] == 0) &
+                       Mux(head["we"], t_write == 0, t_read == 0)),
+            head_pre.eq(q_valid[0] & head_open & ~head_hit & (t_pre_a[head["bank"]] == 0)),
+            head_act.eq(q_valid[0] & ~head_open & (t_act_a[head["bank"]] == 0) & (t_rrd == 0)),
+            other.eq(q_valid[1] & (nxt["bank"] != head["bank"])),
+            next_pre.eq(other & next_open & ~next_hit & (t_pre_a[nxt["bank"]] == 0)),
+            next_act.eq(other & ~next_open & (t_act_a[nxt["bank"]] == 0) & (t_rrd == 0)),
+            # A read at the end of a long burst stops it
+            bst.eq((t_bst == 1) & ~(head_rw & ~head["we"] & ~refresh))
         ]
 
-        with m.If(~old_sync & self.sync):
-            m.d.sdram += stage.eq(1)
+        # Words of a read
+        words_n = Signal(range(max_words + 1))
+        if long_burst:
+            m.d.comb += words_n.eq(Mux(head["burst"], max_words, 1))
+        else:
+            m.d.comb += words_n.eq(max_words)
+
+        def precharge(req):
+            m.d.sdram += [
+                sd_cmd.eq(CMD_PRECHARGE),
+                self.sd_addr[10].eq(0),
+                self.sd_ba.eq(req["bank"]),
+                row_open.bit_select(req["bank"], 1).eq(0)
+            ]
+            for i in range(4):
+                with m.If(req["bank"] == i):
+                    m.d.sdram += at_least(t_act[i], T_RP)
+
+        def activate(req):
+            m.d.sdram += [
+                sd_cmd.eq(CMD_ACTIVE),
+                self.sd_addr.eq(req["row"]),
+                self.sd_ba.eq(req["bank"]),
+                row_open.bit_select(req["bank"], 1).eq(1),
+                rows[req["bank"]].eq(req["row"]),
+                at_least(t_rrd, T_RRD)
+            ]
+            for i in range(4):
+                with m.If(req["bank"] == i):
+                    m.d.sdram += [
+                        at_least(t_act[i], T_RC),
+                        at_least(t_pre[i], T_RAS),
+                        at_least(t_rw[i], T_RCD)
+                    ]
+
+        # Reads on the way, until their data is on sd_data_in
+        read     = Signal()
+        rd_pipe  = Signal(CAS_LATENCY + 1)
+        rd_words = [Signal(range(max_words + 1), name="rd_words{}".format(i)) for i in range(CAS_LATENCY + 1)]
+
+        m.d.sdram += [
+            rd_pipe.eq(Cat(read, rd_pipe[:-1])),
+            rd_words[0].eq(words_n)
+        ]
+        m.d.sdram += [rd_words[i].eq(rd_words[i - 1]) for i in range(1, CAS_LATENCY + 1)]
 
         with m.If(reset != 0):
-            with m.If(stage == STATE_CMD_START):
+            with m.If(prescale == 1):
                 with m.If(reset == 13):
                     m.d.sdram += [
                         sd_cmd.eq(CMD_PRECHARGE),
@@ -115,49 +323,114 @@ class Sdram(Elaboratable):
                         self.sd_addr.eq(MODE)
                     ]
             m.d.sdram += [
-                mode.eq(0),
+                q_valid.eq(0),
+                row_open.eq(0),
+                pending.eq(0),
+                refreshing.eq(0),
                 self.sd_dqm.eq(C(0b11,2))
             ]
         with m.Else():
-            # Normal operation
-            with m.If(stage == STATE_CMD_START):
-                with m.If(self.we | self.oe):
-                    # RAS phase
+            # Normal operation, a command every clock
+            m.d.sdram += self.sd_dqm.eq(C(0b00,2))
+
+            with m.If(bst):
+                # Stop a long burst after one word, or at the end of a page
+                m.d.sdram += sd_cmd.eq(CMD_BURST_TERMINATE)
+            with m.Elif(refresh):
+                # Refresh, with all banks precharged
+                m.d.sdram += refreshing.eq(1)
+                with m.If(row_open.any()):
+                    with m.If(Cat(t == 0 for t in t_pre).all()):
+                        m.d.sdram += [
+                            sd_cmd.eq(CMD_PRECHARGE),
+                            self.sd_addr[10].eq(1),
+                            row_open.eq(0)
+                        ]
+                        m.d.sdram += [at_least(t, T_RP) for t in t_act]
+                with m.Elif(Cat(t == 0 for t in t_act).all()):
+                    m.d.comb += refresh_cmd.eq(1)
                     m.d.sdram += [
-                        mode.eq(Cat(self.oe, self.we)),
-                        sd_cmd.eq(CMD_ACTIVE),
-                        self.sd_addr.eq(self.addr[8:21]),
-                        self.sd_ba.eq(self.addr[21:23]),
-                        ds_r.eq(self.ds),
-                        din_r.eq(self.din),
-                        addr_r.eq(Cat([self.addr[:8],self.addr[23],C(0b0010,4)]))
+                        sd_cmd.eq(CMD_AUTO_REFRESH),
+                        refreshing.eq(0)
                     ]
+                    m.d.sdram += [at_least(t, T_RC) for t in t_act]
+            with m.Elif(head_rw):
+                m.d.comb += pop.eq(1)
+                m.d.sdram += [
+                    sd_cmd.eq(Mux(head["we"], CMD_WRITE, CMD_READ)),
+                    self.sd_addr.eq(head["col"]),
+                    self.sd_ba.eq(head["bank"])
+                ]
+                with m.If(head["we"]):
+                    m.d.sdram += [
+                        din_r.eq(head["din"]),
+                        drive.eq(1),
+                        self.sd_dqm.eq(~head["ds"])
+                    ]
+                    for i in range(4):
+                        with m.If(head["bank"] == i):
+                            m.d.sdram += at_least(t_pre[i], T_WR)
                 with m.Else():
+                    # The data bus is taken until the end of the burst
+                    m.d.comb += read.eq(1)
                     m.d.sdram += [
-                        sd_cmd.eq(CMD_AUTO_REFRESH),
-                        mode.eq(0)
+                        t_read.eq(words_n - 1),
+                        t_write.eq(CAS_LATENCY + words_n)
                     ]
+                    if long_burst:
+                        m.d.sdram += t_bst.eq(Mux(words_n == 8, 0, words_n))
+                    for i in range(4):
+                        with m.If(head["bank"] == i):
+                            m.d.sdram += at_least(t_pre[i], words_n)
+            with m.Elif(head_pre):
+                precharge(head)
+            with m.Elif(head_act):
+                activate(head)
+            with m.Elif(next_pre):
+                precharge(nxt)
+            with m.Elif(next_act):
+                activate(nxt)
 
-            # CAS phase
-            with m.If((stage == STATE_CMD_CONT) & (mode != 0)):
-                m.d.sdram += [
-                    sd_cmd.eq(Mux(mode[1], CMD_WRITE, CMD_READ)),
-                    self.sd_addr.eq(addr_r)
-                ]
+        # Read data, the words of a burst are put together in dout_burst
+        word_cnt = Signal(range(max_words + 1))
+        index    = Signal(range(self.burst_words))
+        words    = [Signal(16, name="word{}".format(i)) for i in range(self.burst_words)]
+        capture  = Signal()
+        last     = Signal()
 
-                with m.If(mode[1]):
-                    m.d.sdram += self.sd_dqm.eq(~ds_r)
-                with m.Else():
-                    m.d.sdram += self.sd_dqm.eq(C(0b00,2))
+        m.d.sdram += [
+            self.dout_valid.eq(0),
+            self.dout_burst_valid.eq(0)
+        ]
+
+        with m.If(rd_pipe[-1]):
+            m.d.comb += [
+                capture.eq(1),
+                last.eq(rd_words[-1] == 1)
+            ]
+            m.d.sdram += word_cnt.eq(rd_words[-1] - 1)
+        with m.Elif(word_cnt != 0):
+            m.d.comb += [
+                capture.eq(1),
+                last.eq(word_cnt == 1)
+            ]
+            m.d.sdram += word_cnt.eq(word_cnt - 1)
 
-            with m.If(stage == STATE_HIGHZ):
+        with m.If(capture):
+            m.d.sdram += [
+                self.dout.eq(self.sd_data_in),
+                self.dout_valid.eq(1),
+                index.eq(index + 1)
+            ]
+            for i in range(self.burst_words):
+                with m.If(index == i):
+                    m.d.sdram += words[i].eq(self.sd_data_in)
+            with m.If(last | (index == self.burst_words - 1)):
                 m.d.sdram += [
-                    self.sd_dqm.eq(C(0b11,2)),
-                    mode[1].eq(0)
+                    self.dout_burst.eq(Cat(Mux(index == i, self.sd_data_in, words[i])
+                                           for i in range(self.burst_words))),
+                    self.dout_burst_valid.eq(1),
+                    index.eq(0)
                 ]
 
-            with m.If((stage == STATE_READ) & (mode != 0)):
-                m.d.sdram += self.dout.eq(self.sd_data_in)
-
         return m
-
@@ -0,0 +1,233 @@
+from amaranth import *
+from amaranth.lib.fifo import AsyncFIFO, SyncFIFO
+
+# Multi-port front end for the Sdram controller.
+#
+# Each port has a request FIFO and a read data FIFO, in the clock domain of
+# its client, so clients use a valid/ready handshake in their own domain.
+# The sync domain is the clock of the controller, see DomainRenamer.
+#
+# A request is taken when i_valid and o_ready are both set: a write of
+# i_data to i_addr with i_we, the bytes set in i_ds, else a read of i_addr,
+# a burst with i_burst.
+# Read data comes back in order on o_rd_data, when o_rd_valid is set, and is
+# taken with i_rd_ready. It has the words of the Sdram dout_burst, first word
+# in the low bits, a single word read is in the low 16 bits. A page burst
+# comes as 64 of them.
+#
+# The arbiter offers the controller a request every clock, from the port
+# chosen by priority, the lowest port number first, or round robin. The lane
+# port gets lane_slots of every lane_period clocks before the others, which
+# guarantees the bandwidth of a display refresh whatever the other ports do.
+# A read is only sent when its port has room for the data, which comes back
+# in the order of the reads, so page bursts need a fifo_depth of 64, or 65
+# with ports in other domains, where the read FIFO keeps an entry spare.
+class SdramPort:
+    def __init__(self, domain, data_width):
+        # Requests
+        self.i_valid    = Signal()
+        self.o_ready    = Signal()
+        self.i_we       = Signal()
+        self.i_addr     = Signal(24)
+        self.i_data     = Signal(16)
+        self.i_burst    = Signal()
+        self.i_ds       = Signal(2, reset=0b11)
+        # Read data
+        self.o_rd_valid = Signal()
+        self.i_rd_ready = Signal()
+        self.o_rd_data  = Signal(data_width)
+        # Configuration
+        self.domain = domain
+
+
+class SdramArbiter(Elaboratable):
+    def __init__(self,
+                 domains,                  # Clock domain of each port
+                 burst_length   = 4,       # As the Sdram controller
+                 arbitration    = "priority",
+                 lane           = None,    # Port with guaranteed bandwidth
+                 lane_slots     = 1,
+                 lane_period    = 2,
+                 fifo_depth     = 16):
+        if arbitration not in ("priority", "round_robin"):
+            raise ValueError("Arbitration must be \"priority\" or \"round_robin\", not {!r}".format(arbitration))
+        if lane is not None and not 0 < lane_slots <= lane_period:
+            raise ValueError("Lane slots must be from 1 to the lane period {}, not {}".format(lane_period, lane_slots))
+        # A spare entry in the read FIFOs of ports in other domains
+        page_depth = 64 + any(domain != "sync" for domain in domains)
+        if burst_length == "page" and fifo_depth < page_depth:
+            raise ValueError("Page bursts need a FIFO depth of {} or more, for the 64 reads of 8 words, not {}"
+                             .format(page_depth, fifo_depth))
+
+        # Sdram port, sync domain
+        self.burst_words  = 8 if burst_length == "page" else burst_length
+        self.o_addr       = Signal(24)
+        self.o_req_read   = Signal()
+        self.o_req_write  = Signal()
+        self.i_req_ready  = Signal()
+        self.o_burst      = Signal()
+        self.o_data       = Signal(16)
+        self.o_ds         = Signal(2)
+        self.i_data_burst = Signal(16 * self.burst_words)
+        self.i_data_burst_valid = Signal()
+        # Client ports
+        self.ports = [SdramPort(domain, 16 * self.burst_words) for domain in domains]
+        # Configuration
+        self.burst_length = burst_length
+        self.arbitration = arbitration
+        self.lane = lane
+        self.lane_slots = lane_slots
+        self.lane_period = lane_period
+        self.fifo_depth = fifo_depth
+
+    def fifo(self, m, name, width, w_domain, r_domain):
+        # The FIFO, its level in the write domain, and the entries that can
+        # be counted on. The w_level of an AsyncFIFO only counts a write a
+        # clock after it, so one entry is kept spare, as in Framebuffer.
+        if w_domain == r_domain == "sync":
+            fifo = SyncFIFO(width=width, depth=self.fifo_depth)
+            level = fifo.level
+            room = fifo.depth
+        else:
+            fifo = AsyncFIFO(width=width, depth=self.fifo_depth, w_domain=w_domain, r_domain=r_domain)
+            level = fifo.w_level
+            room = fifo.depth - 1
+        m.submodules[name] = fifo
+        return fifo, level, room
+
+    def elaborate(self, platform):
+        m = Module()
+
+        n = len(self.ports)
+        long_burst = self.burst_length in (8, "page")
+
+        # Number of dout_bursts of a burst
+        groups = 64 if self.burst_length == "page" else 1
+
+        R_lane    = Signal(range(self.lane_period))
+        lane_slot = Signal()
+
+        m.d.comb += lane_slot.eq(R_lane < self.lane_slots)
+        m.d.sync += R_lane.eq(Mux(R_lane == self.lane_period - 1, 0, R_lane + 1))
+
+        # Reads sent, with their port and size, until their data is back
+        dest      = Signal(range(n))
+        dest_size = Signal(range(groups + 1))
+        m.submodules.order = order = SyncFIFO(width=len(dest) + len(dest_size), depth=8)
+
+        # Ports that have a request the controller can take
+        can_send = Signal(n)
+        req_fifos = []
+        rd_fifos = []
+        in_flight = []
+
+        for i, port in enumerate(self.ports):
+            req, _, _ = self.fifo(m, "req{}".format(i), 24 + 16 + 4, port.domain, "sync")
+            rd, rd_level, rd_room = self.fifo(m, "rd{}".format(i), 16 * self.burst_words, "sync", port.domain)
+            req_fifos.append(req)
+            rd_fifos.append(rd)
+
+            m.d.comb += [
+                req.w_data.eq(Cat(port.i_addr, port.i_data, port.i_we, port.i_burst, port.i_ds)),
+                req.w_en.eq(port.i_valid),
+                port.o_ready.eq(req.w_rdy),
+                port.o_rd_valid.eq(rd.r_rdy),
+                port.o_rd_data.eq(rd.r_data),
+                rd.r_en.eq(port.i_rd_ready),
+            ]
+
+            # Read data on the way to the FIFO, which must have room for
+            # a whole burst
+            flight = Signal(range(rd.depth + groups + 1), name="in_flight{}".format(i))
+            in_flight.append(flight)
+
+            we    = req.r_data[40]
+            burst = req.r_data[41]
+            size  = Mux(burst, groups, 1) if long_burst else 1
+            m.d.comb += can_send[i].eq(req.r_rdy & (we | (order.w_rdy & (rd_level + flight + size <= rd_room))))
+
+        # Choose a port
+        grant = Signal(range(n))
+        send  = Signal()
+        R_last = Signal(range(n)) # Last port, for round robin
+
+        def choose(order):
+            with m.If(can_send[order[0]]):
+                m.d.comb += [
+                    grant.eq(order[0]),
+                    send.eq(1),
+                ]
+            if len(order) > 1:
+                with m.Else():
+                    choose(order[1:])
+
+        def arbitrate(order):
+            if self.lane is not None:
+                lane_order = [self.lane] + [i for i in order if i != self.lane]
+                with m.If(lane_slot):
+                    choose(lane_order)
+                with m.Else():
+                    choose(order)
+            else:
+                choose(order)
+
+        if self.arbitration == "round_robin":
+            with m.Switch(R_last):
+                for last in range(n):
+                    with m.Case(last):
+                        arbitrate([(last + 1 + k) % n for k in range(n)])
+        else:
+            arbitrate(list(range(n)))
+
+        # Request to the controller, taken with i_req_ready
+        taken = Signal()
+        size  = Signal(range(groups + 1))
+
+        m.d.comb += taken.eq(send & self.i_req_ready)
+
+        with m.Switch(grant):
+            for i, req in enumerate(req_fifos):
+                with m.Case(i):
+                    m.d.comb += [
+                        self.o_addr.eq(req.r_data[:24]),
+                        self.o_data.eq(req.r_data[24:40]),
+                        self.o_req_write.eq(send & req.r_data[40]),
+                        self.o_req_read.eq(send & ~req.r_data[40]),
+                        self.o_burst.eq(req.r_data[41]),
+                        self.o_ds.eq(req.r_data[42:44]),
+                        req.r_en.eq(taken),
+                    ]
+
+        m.d.comb += [
+            size.eq(Mux(self.o_burst, groups, 1) if long_burst else 1),
+            order.w_data.eq(Cat(grant, size)),
+            order.w_en.eq(taken & self.o_req_read),
+        ]
+
+        with m.If(taken):
+            m.d.sync += R_last.eq(grant)
+
+        # Data of a read goes to the port at the head of the order FIFO
+        R_groups = Signal(range(groups))
+
+        m.d.comb += Cat(dest, dest_size).eq(order.r_data)
+
+        with m.If(self.i_data_burst_valid):
+            with m.If(R_groups == dest_size - 1):
+                m.d.comb += order.r_en.eq(1)
+                m.d.sync += R_groups.eq(0)
+            with m.Else():
+                m.d.sync += R_groups.eq(R_groups + 1)
+
+        for i, rd in enumerate(rd_fifos):
+            write = self.i_data_burst_valid & (dest == i)
+            m.d.comb += [
+                rd.w_data.eq(self.i_data_burst),
+                rd.w_en.eq(write & rd.w_rdy),
+            ]
+
+            # Count the groups on the way to each port
+            sent = taken & (grant == i) & self.o_req_read
+            m.d.sync += in_flight[i].eq(in_flight[i] + Mux(sent, size, 0) - write)
+
+        return m
@@ -0,0 +1,138 @@
+import argparse
+
+import numpy as np
+
+from sdram_sim import SdramTest, simulate, SDRAM_PERIOD
+
+# Bandwidth and latency of the Sdram controller in simulation, against the
+# SDRAM model, which also checks the timing of every command and the
+# refresh deadlines.
+#
+# Requests are made every clock the controller takes them, with sequential,
+# strided and random addresses, all reads, all writes or a random mix. The
+# sustained bandwidth is the words read and written over the clocks from
+# the first request to the last read data. The latency of a read is the
+# clocks from the request being taken to its data in dout_burst, of a write
+# the clocks from valid to the request being taken.
+#
+#   python sdram_bench.py
+#   python sdram_bench.py --burst-length 4 --interleave --requests 4096
+
+PATTERNS = ["sequential", "strided", "random"]
+MIXES    = ["read", "write", "mixed"]
+
+
+def addresses(pattern, n, step, stride, rng):
+    if pattern == "sequential":
+        return [i * step for i in range(n)]
+    elif pattern == "strided":
+        return [(i * stride) % (1 << 24) for i in range(n)]
+    else:
+        return [int(a) * step for a in rng.integers(0, (1 << 24) // step, size=n)]
+
+
+def bench(ctrl, reqs, result):
+    """Makes the requests (addr, we), fills result with the clocks taken and
+    the latencies"""
+    taken = [] # Clock each read was taken
+    reads = []
+    writes = []
+    clock = 0
+    start = None
+    i = 0
+    while i < len(reqs) or taken:
+        if i < len(reqs):
+            addr, we = reqs[i]
+            yield ctrl.addr.eq(addr)
+            yield ctrl.we.eq(we)
+            yield ctrl.din.eq(addr & 0xffff)
+            yield ctrl.valid.eq(1)
+            if start is None:
+                start = clock
+        else:
+            yield ctrl.valid.eq(0)
+        yield
+        clock += 1
+        if i < len(reqs) and (yield ctrl.ready):
+            if reqs[i][1]:
+                writes.append(clock - start)
+            else:
+                taken.append(clock)
+            start = None
+            i += 1
+        if (yield ctrl.dout_burst_valid):
+            reads.append(clock - taken.pop(0))
+    yield ctrl.valid.eq(0)
+    result["clocks"] = clock
+    result["reads"] = reads
+    result["writes"] = writes
+
+
+def histogram(values, bins=8, width=40):
+    """Lines of a text histogram of the latencies"""
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    size = max(1, -(-(hi - lo + 1) // bins))
+    counts = {}
+    for v in values:
+        counts[(v - lo) // size] = counts.get((v - lo) // size, 0) + 1
+    top = max(counts.values())
+    lines = []
+    for b in range(max(counts) + 1):
+        first = lo + b * size
+        label = str(first) if size == 1 else "{}-{}".format(first, first + size - 1)
+        count = counts.get(b, 0)
+        lines.append("    {:>9} {:6} {}".format(label, count, "#" * round(width * count / top)))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst-length", choices=["1", "2", "4"], default="1")
+    parser.add_argument("--interleave", action="store_true")
+    parser.add_argument("--requests", type=int, default=2048)
+    parser.add_argument("--stride", type=int, default=512, help="words, strided pattern")
+    parser.add_argument("--pattern", choices=PATTERNS, default=None, help="default all")
+    parser.add_argument("--mix", choices=MIXES, default=None, help="default all")
+    parser.add_argument("--histograms", action="store_true", help="print the latency histograms")
+    args = parser.parse_args()
+
+    burst_length = int(args.burst_length)
+    failed = False
+
+    print("Burst length {}, interleave {}, {} requests".format(burst_length, args.interleave, args.requests))
+    print("{:<11} {:<6} {:>8} {:>10} {:>10} {:>9} {:>9}".format(
+        "pattern", "mix", "MB/s", "read avg", "read max", "write avg", "write max"))
+
+    for pattern in [args.pattern] if args.pattern else PATTERNS:
+        for mix in [args.mix] if args.mix else MIXES:
+            rng = np.random.default_rng(1)
+            addrs = addresses(pattern, args.requests, burst_length, args.stride, rng)
+            if mix == "mixed":
+                we = [int(w) for w in rng.integers(0, 2, size=args.requests)]
+            else:
+                we = [int(mix == "write")] * args.requests
+            reqs = list(zip(addrs, we))
+
+            result = {}
+            model = simulate(SdramTest(burst_length, args.interleave),
+                             lambda ctrl: bench(ctrl, reqs, result))
+
+            words = burst_length * len(result["reads"]) + len(result["writes"])
+            reads, writes = result["reads"], result["writes"]
+            print("{:<11} {:<6} {:8.1f} {:>10} {:>10} {:>9} {:>9}{}".format(
+                pattern, mix, 2e-6 * words / (result["clocks"] * SDRAM_PERIOD),
+                "{:.1f}".format(np.mean(reads)) if reads else "-", max(reads) if reads else "-",
+                "{:.1f}".format(np.mean(writes)) if writes else "-", max(writes) if writes else "-",
+                "" if not model.errors else "  FAILED"))
+            if args.histograms:
+                for name, values in (("read", reads), ("write", writes)):
+                    if values:
+                        print("  {} latency, clocks:".format(name))
+                        print("\n".join(histogram(values)))
+            for error in model.errors[:10]:
+                print(error)
+            failed |= bool(model.errors)
+
+    print("FAILED" if failed else "PASSED")
@@ -0,0 +1,338 @@
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFO
+from amaranth.utils import log2_int
+
+# Built-in self test of the SDRAM, at the speed of the controller.
+#
+# A test is a list of march elements, each a pass through all the words:
+# writes, burst reads checked against the data written, or a read of each
+# word followed by a write of its complement, as in March C-. Requests go
+# to the controller every sdram clock it takes them, as RamTest.
+#
+# Page bursts need the interleaved address mapping, for the 512 words of a
+# page to be at consecutive addresses, without it the words are read one at
+# a time. Read then write elements read a burst, to 4 words, then write the
+# complement of each of its words.
+#
+#   walking_ones   1 << (address % 16)
+#   walking_zeros  the complement
+#   lfsr           a 16-bit maximal length LFSR, from the same seed
+#   march_c        March C-: w0, up r0 w1, up r1 w0, down r0 w1, down r1 w0, r0
+#   address        the address, with its high bits folded in, then the
+#                  complement
+#
+# The tests run one after another, and the passes over all of them without
+# end. A word read that is not the one expected is counted in o_errors, and
+# its (address, expected, got) goes in the error FIFO while it has room.
+# At the end of a pass, o_pass_done is set for a clock, with the clocks the
+# pass took in o_clocks, for the throughput of the words of a pass, words.
+# BistReport sends them as text to a UART.
+
+# Patterns
+WALK, LFSR, ADDR, CONST = range(4)
+# Element operations, write, read, read then write the complement
+W, R, RW = range(3)
+# Element directions
+UP, DOWN = range(2)
+
+# Tests, elements of (operation, direction, pattern, complement)
+TESTS = {
+    "walking_ones":  [(W, UP, WALK, 0), (R, UP, WALK, 0)],
+    "walking_zeros": [(W, UP, WALK, 1), (R, UP, WALK, 1)],
+    "lfsr":          [(W, UP, LFSR, 0), (R, UP, LFSR, 0)],
+    "march_c":       [(W, UP, CONST, 0), (RW, UP, CONST, 0), (RW, UP, CONST, 1),
+                      (RW, DOWN, CONST, 0), (RW, DOWN, CONST, 1), (R, UP, CONST, 0)],
+    "address":       [(W, UP, ADDR, 0), (R, UP, ADDR, 0), (W, UP, ADDR, 1), (R, UP, ADDR, 1)],
+}
+
+# x^16 + x^14 + x^13 + x^11 + 1, Galois form
+LFSR_SEED = 0xACE1
+LFSR_TAPS = 0xB400
+
+def lfsr_next(lfsr):
+    return Mux(lfsr[0], (lfsr >> 1) ^ LFSR_TAPS, lfsr >> 1)
+
+class SdramBist(Elaboratable):
+    def __init__(self, mem, bits=24, tests=None, fifo_depth=16):
+        tests = list(TESTS) if tests is None else list(tests)
+        for test in tests:
+            if test not in TESTS:
+                raise ValueError("Test must be one of {}, not {!r}".format(", ".join(TESTS), test))
+
+        if mem.burst_length == "page" and bits < 9:
+            raise ValueError("Page bursts need 9 or more address bits, not {}".format(bits))
+
+        self.mem = mem
+        self.bits = bits
+        self.tests = tests
+        self.fifo_depth = fifo_depth
+        # Elements of all the tests, with the test of each
+        self.elements = [(i, element) for i, test in enumerate(tests) for element in TESTS[test]]
+        # Words read and written in a pass
+        self.words = sum((2 if op == RW else 1) << bits for _, (op, _, _, _) in self.elements)
+
+        # Status
+        self.o_test      = Signal(range(len(tests))) # Test running
+        self.o_pass      = Signal(16) # Passes done
+        self.o_errors    = Signal(32) # Errors since the start
+        self.o_pass_done = Signal()   # End of a pass
+        self.o_clocks    = Signal(32) # Clocks of the last pass
+
+        # Error FIFO
+        self.o_err_valid    = Signal()
+        self.i_err_ready    = Signal()
+        self.o_err_addr     = Signal(24)
+        self.o_err_expected = Signal(16)
+        self.o_err_got      = Signal(16)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        mem = self.mem
+        size = 1 << self.bits
+        # Words of a read of an R element, and of a read then write element
+        burst = mem.burst_length != "page" or mem.interleave
+        step = 1 if not burst else 512 if mem.burst_length == "page" else mem.burst_length
+        rd_words = mem.burst_length if mem.burst_length in (1, 2, 4) else 1
+        rd_bits = log2_int(rd_words)
+
+        fifo = SyncFIFO(width=24 + 16 + 16, depth=self.fifo_depth)
+        m.submodules.errors = DomainRenamer("sdram")(fifo)
+
+        m.d.comb += [
+            self.o_err_valid.eq(fifo.r_rdy),
+            Cat(self.o_err_addr, self.o_err_expected, self.o_err_got).eq(fifo.r_data),
+            fifo.r_en.eq(self.i_err_ready),
+        ]
+
+        # The element running
+        elem    = Signal(range(len(self.elements)))
+        op      = Signal(2)
+        down    = Signal()
+        pattern = Signal(2)
+        invert  = Signal()
+
+        with m.Switch(elem):
+            for i, (test, (o, d, p, c)) in enumerate(self.elements):
+                with m.Case(i):
+                    m.d.comb += [
+                        op.eq(o),
+                        down.eq(d),
+                        pattern.eq(p),
+                        invert.eq(c),
+                        self.o_test.eq(test),
+                    ]
+
+        n_req    = Signal(self.bits + 1) # Words requested
+        n_chk    = Signal(self.bits + 1) # Words checked
+        phase    = Signal()              # Writes of a read then write
+        req_lfsr = Signal(16, reset=LFSR_SEED)
+        chk_lfsr = Signal(16, reset=LFSR_SEED)
+        clocks   = Signal(32)
+
+        def address(n):
+            return Mux(down, size - 1 - n, n)[:self.bits]
+
+        def data(addr, lfsr, name):
+            value = Signal(16, name=name)
+            with m.Switch(pattern):
+                with m.Case(WALK):
+                    m.d.comb += value.eq(C(1, 16) << addr[:4])
+                with m.Case(LFSR):
+                    m.d.comb += value.eq(lfsr)
+                with m.Case(ADDR):
+                    high = Cat(addr[16:], addr[16:]) if self.bits > 16 else 0
+                    m.d.comb += value.eq(addr[:16] ^ high)
+            return value ^ Mux(invert, 0xffff, 0)
+
+        req_addr = Signal(self.bits)
+        chk_addr = Signal(self.bits)
+        m.d.comb += [
+            req_addr.eq(address(n_req)),
+            # The words of a burst come from the bottom up, also down
+            chk_addr.eq(Cat(n_chk[:rd_bits], address(n_chk)[rd_bits:])),
+        ]
+        req_data = data(req_addr, req_lfsr, "req_data")
+        expected = data(chk_addr, chk_lfsr, "expected")
+
+        req_done = Signal()
+        chk_done = Signal()
+        taken    = Signal()
+
+        m.d.comb += [
+            req_done.eq(n_req == size),
+            chk_done.eq((op == W) | (n_chk == size)),
+            taken.eq(mem.req_ready & (mem.req_read | mem.req_write)),
+            mem.address.eq(Mux((op == RW) & ~phase,
+                               Cat(C(0, rd_bits), req_addr[rd_bits:]), req_addr)),
+            mem.burst.eq((op == R) & burst),
+        ]
+
+        # Requests
+        with m.If(~req_done):
+            with m.Switch(op):
+                with m.Case(W):
+                    m.d.comb += [
+                        mem.req_write.eq(1),
+                        mem.data_in.eq(req_data),
+                    ]
+                with m.Case(R):
+                    m.d.comb += mem.req_read.eq(1)
+                with m.Case(RW):
+                    m.d.comb += [
+                        mem.req_read.eq(~phase),
+                        mem.req_write.eq(phase),
+                        mem.data_in.eq(~req_data),
+                    ]
+
+        with m.If(taken):
+            with m.Switch(op):
+                with m.Case(W):
+                    m.d.sdram += [
+                        n_req.eq(n_req + 1),
+                        req_lfsr.eq(lfsr_next(req_lfsr)),
+                    ]
+                with m.Case(R):
+                    m.d.sdram += n_req.eq(n_req + step)
+                with m.Case(RW):
+                    with m.If(~phase):
+                        m.d.sdram += phase.eq(1)
+                    with m.Else():
+                        m.d.sdram += n_req.eq(n_req + 1)
+                        with m.If(n_req[:rd_bits] == rd_words - 1):
+                            m.d.sdram += phase.eq(0)
+
+        # Check each word read, reads come back in order
+        with m.If(mem.data_valid):
+            m.d.sdram += [
+                n_chk.eq(n_chk + 1),
+                chk_lfsr.eq(lfsr_next(chk_lfsr)),
+            ]
+            with m.If(mem.data_out != expected):
+                m.d.sdram += self.o_errors.eq(self.o_errors + 1)
+                m.d.comb += [
+                    fifo.w_data.eq(Cat(chk_addr, C(0, 24 - self.bits), expected, mem.data_out)),
+                    fifo.w_en.eq(1),
+                ]
+
+        # Next element, and the end of a pass
+        m.d.sdram += clocks.eq(clocks + 1)
+
+        with m.If(req_done & chk_done):
+            m.d.sdram += [
+                n_req.eq(0),
+                n_chk.eq(0),
+                phase.eq(0),
+                req_lfsr.eq(LFSR_SEED),
+                chk_lfsr.eq(LFSR_SEED),
+                elem.eq(elem + 1),
+            ]
+            with m.If(elem == len(self.elements) - 1):
+                m.d.comb += self.o_pass_done.eq(1)
+                m.d.sdram += [
+                    elem.eq(0),
+                    self.o_pass.eq(self.o_pass + 1),
+                    self.o_clocks.eq(clocks + 1),
+                    clocks.eq(0),
+                ]
+
+        return m
+
+# Text report of a SdramBist, a byte at a time for a UART, o_data is taken
+# when o_valid and i_ready are set. Numbers are in hex, a line for each
+# error from the FIFO and for each pass:
+#
+#   E <address> <expected> <got>
+#   P <pass> <errors> <clocks> <words>
+#
+# The throughput of a pass is 2 * words * clock frequency / clocks bytes a
+# second.
+class BistReport(Elaboratable):
+    def __init__(self, bist):
+        self.bist = bist
+
+        self.o_data  = Signal(8)
+        self.o_valid = Signal()
+        self.i_ready = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bist = self.bist
+
+        # Fields of the line being sent, as nibbles of msg
+        def hex_field(offset, digits):
+            return [offset // 4 + digits - 1 - i for i in range(digits)]
+
+        lines = [
+            # Error, msg is Cat(got, expected, address)
+            ["E", " "] + hex_field(32, 6) + [" "] + hex_field(16, 4) + [" "] + hex_field(0, 4) + ["\r", "\n"],
+            # Pass, msg is Cat(words, clocks, errors, pass)
+            ["P", " "] + hex_field(96, 4) + [" "] + hex_field(64, 8) + [" "] + hex_field(32, 8) +
+                [" "] + hex_field(0, 8) + ["\r", "\n"],
+        ]
+
+        msg  = Signal(112)
+        kind = Signal()
+        idx  = Signal(range(max(len(line) for line in lines)))
+        busy = Signal()
+        last = Signal()
+
+        p_pending = Signal()
+        p_pass    = Signal(16)
+        p_errors  = Signal(32)
+        p_clocks  = Signal(32)
+
+        # The character of the line
+        with m.Switch(kind):
+            for k, line in enumerate(lines):
+                with m.Case(k):
+                    with m.Switch(idx):
+                        for i, c in enumerate(line):
+                            with m.Case(i):
+                                if isinstance(c, str):
+                                    m.d.comb += self.o_data.eq(ord(c))
+                                else:
+                                    nibble = msg[4 * c:4 * c + 4]
+                                    m.d.comb += self.o_data.eq(Mux(nibble < 10, ord("0") + nibble, ord("a") - 10 + nibble))
+                                m.d.comb += last.eq(i == len(line) - 1)
+
+        m.d.comb += self.o_valid.eq(busy)
+
+        # The counts of a pass are there the clock after its end
+        r_done = Signal()
+        m.d.sdram += r_done.eq(bist.o_pass_done)
+
+        with m.If(r_done):
+            m.d.sdram += [
+                p_pending.eq(1),
+                p_pass.eq(bist.o_pass),
+                p_errors.eq(bist.o_errors),
+                p_clocks.eq(bist.o_clocks),
+            ]
+
+        # Pass lines first, they are rare
+        with m.If(busy):
+            with m.If(self.i_ready):
+                m.d.sdram += idx.eq(idx + 1)
+                with m.If(last):
+                    m.d.sdram += [
+                        busy.eq(0),
+                        idx.eq(0),
+                    ]
+        with m.Elif(p_pending & ~r_done):
+            m.d.sdram += [
+                msg.eq(Cat(C(bist.words, 32), p_clocks, p_errors, p_pass)),
+                kind.eq(1),
+                busy.eq(1),
+                p_pending.eq(0),
+            ]
+        with m.Elif(bist.o_err_valid):
+            m.d.comb += bist.i_err_ready.eq(1)
+            m.d.sdram += [
+                msg.eq(Cat(bist.o_err_got, bist.o_err_expected, bist.o_err_addr)),
+                kind.eq(0),
+                busy.eq(1),
+            ]
+
+        return m
@@ -0,0 +1,151 @@
+import argparse
+
+from amaranth import *
+
+from sdram_sim import ControllerSim, simulate, SDRAM_PERIOD
+from sdram_bist import SdramBist, BistReport, TESTS, W, R, RW, DOWN, WALK, LFSR, ADDR, LFSR_SEED, LFSR_TAPS
+
+# Simulation of the SDRAM built-in self test against the SDRAM model, on
+# the first words of the memory, with the report taken a character every
+# clock from the start of the test.
+#
+# A pass of all the tests is run for each burst length without faults, and
+# page bursts with the interleaved address mapping, then with stuck bits in
+# the model. The errors in the report must be those of a
+# model of the tests in python, and the throughput of each pass is printed.
+#
+#   python sdram_bist_sim.py
+#   python sdram_bist_sim.py --bits 12 --tests march_c lfsr
+#   python sdram_bist_sim.py --burst-length page --interleave
+
+# Stuck bits, word address: (mask, value)
+FAULTS = {
+    0x123: (0x0008, 0x0008),
+    0x2f0: (0x8001, 0x0001),
+}
+
+
+class BistSim(ControllerSim):
+    def __init__(self, burst_length, bits, tests, interleave=False):
+        super().__init__(SdramBist, burst_length, interleave, bits=bits, tests=tests)
+        self.report = BistReport(self.test)
+        self.i_ready = Signal()
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+
+        m.submodules.report = self.report
+        m.d.comb += self.report.i_ready.eq(self.i_ready)
+
+        return m
+
+
+def key(addr):
+    """Bank, row and column of a word, without interleave"""
+    return ((addr >> 21) & 3, (addr >> 8) & 0x1fff, (addr & 0xff) | ((addr >> 23) & 1) << 8)
+
+
+def reference(tests, bits, faults, burst_length):
+    """Errors of the tests in python, (address, expected, got)"""
+    size = 1 << bits
+    # Words of the reads of a read then write element
+    rd_words = burst_length if burst_length in (1, 2, 4) else 1
+    mem = [0] * size
+    errors = []
+
+    def data(pattern, addr, lfsr, invert):
+        if pattern == WALK:
+            value = 1 << (addr % 16)
+        elif pattern == LFSR:
+            value = lfsr
+        elif pattern == ADDR:
+            high = addr >> 16
+            value = (addr ^ (high | high << (bits - 16)) if bits > 16 else addr) & 0xffff
+        else:
+            value = 0
+        return value ^ (0xffff if invert else 0)
+
+    def read(addr):
+        mask, value = faults.get(addr, (0, 0))
+        return (mem[addr] & ~mask) | (value & mask)
+
+    for test in tests:
+        for op, direction, pattern, invert in TESTS[test]:
+            lfsr = LFSR_SEED
+            addrs = list(reversed(range(size)) if direction == DOWN else range(size))
+            if op == RW:
+                # A burst is read from the bottom up, then its words written
+                for i in range(0, size, rd_words):
+                    group = addrs[i:i + rd_words]
+                    for addr in sorted(group):
+                        got = read(addr)
+                        if got != data(pattern, addr, lfsr, invert):
+                            errors.append((addr, data(pattern, addr, lfsr, invert), got))
+                    for addr in group:
+                        mem[addr] = data(pattern, addr, lfsr, invert) ^ 0xffff
+                continue
+            for addr in addrs:
+                expected = data(pattern, addr, lfsr, invert)
+                if op == R:
+                    got = read(addr)
+                    if got != expected:
+                        errors.append((addr, expected, got))
+                else:
+                    mem[addr] = expected
+                lfsr = (lfsr >> 1) ^ (LFSR_TAPS if lfsr & 1 else 0)
+
+    return errors
+
+
+def report(dut, lines):
+    """Takes the report until the line of the first pass"""
+    line = ""
+    yield dut.i_ready.eq(1)
+    while not lines or lines[-1][0] != "P":
+        yield
+        if (yield dut.report.o_valid):
+            line += chr((yield dut.report.o_data))
+            if line.endswith("\r\n"):
+                lines.append(line[:-2])
+                line = ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst-length", choices=["1", "2", "4", "8", "page"], default=None, help="default all")
+    parser.add_argument("--interleave", action="store_true", help="with --burst-length")
+    parser.add_argument("--bits", type=int, default=10, help="address bits of the test")
+    parser.add_argument("--tests", nargs="+", choices=list(TESTS), default=list(TESTS))
+    args = parser.parse_args()
+
+    failed = False
+    if args.burst_length:
+        runs = [(args.burst_length, args.interleave, {})]
+    else:
+        runs = [(length, False, {}) for length in ["1", "2", "4", "8", "page"]] + [("page", True, {})]
+    runs.append(("4", False, FAULTS))
+
+    for length, interleave, faults in runs:
+        burst_length = length if length == "page" else int(length)
+        dut = BistSim(burst_length, args.bits, args.tests, interleave)
+        lines = []
+        model = simulate(dut, lambda ctrl: report(dut, lines), {key(a): f for a, f in faults.items()})
+
+        errors = [tuple(int(field, 16) for field in line.split()[1:]) for line in lines if line[0] == "E"]
+        pass_no, count, clocks, words = (int(field, 16) for field in lines[-1].split()[1:])
+        expected = reference(args.tests, args.bits, faults, burst_length)
+        ok = not model.errors and pass_no == 1 and count == len(expected) and errors == expected[:len(errors)] \
+            and words == dut.test.words
+        failed |= not ok
+
+        print("Burst length {}{}, {} faults: {} errors, {} words in {} clocks, {:.1f} MB/s: {}".format(
+            burst_length, " interleaved" if interleave else "", len(faults), count, words, clocks, 2e-6 * words / (clocks * SDRAM_PERIOD),
+            "PASSED" if ok else "FAILED"))
+        for addr, want, got in errors[:4]:
+            print("  {:06x}: expected {:04x}, got {:04x}".format(addr, want, got))
+        if len(errors) != len(expected):
+            print("  {} of {} errors reported".format(len(errors), len(expected)))
+        for error in model.errors[:10]:
+            print(error)
+
+    print("FAILED" if failed else "PASSED")
@@ -4,17 +4,27 @@ from amaranth.build import Pins, Attrs
 from sdram16 import Sdram
 
 class sdram_controller(Elaboratable):
-    def __init__(self):
+    def __init__(self, burst_length=4, interleave=False, clk_freq=100e6):
+        # Configuration, see Sdram
+        self.burst_length = burst_length
+        self.interleave = interleave
+        self.clk_freq = clk_freq
+
         # inputs
         self.address   = Signal(24) # word address
         self.req_read  = Signal()
         self.req_write = Signal()
+        self.burst     = Signal() # With req_read, a burst into data_out_burst
         self.data_in   = Signal(16)
+        self.ds        = Signal(2, reset=0b11) # Bytes of data_in written
         self.init      = Signal()
-        self.sync      = Signal()
 
         # outputs
+        self.req_ready = Signal() # The request is taken
         self.data_out  = Signal(16)
+        self.data_valid = Signal()
+        self.data_out_burst = Signal(16 * (8 if burst_length == "page" else burst_length))
+        self.data_burst_valid = Signal()
     
     def elaborate(self, platform):
         m = Module()
@@ -37,7 +47,7 @@ class sdram_controller(Elaboratable):
         sdram = platform.request("sdram", dir=dir_dict)
 
         # Create the controller
-        m.submodules.ctrl = ctrl = Sdram()
+        m.submodules.ctrl = ctrl = Sdram(self.burst_length, self.interleave, self.clk_freq)
 
         m.d.comb += [
             # Set the chip output pins
@@ -56,13 +66,17 @@ class sdram_controller(Elaboratable):
             ctrl.init.eq(self.init),
             ctrl.din.eq(self.data_in),
             ctrl.addr.eq(self.address),
+            ctrl.valid.eq(self.req_read | self.req_write),
             ctrl.we.eq(self.req_write),
-            ctrl.oe.eq(self.req_read),
-            ctrl.sync.eq(self.sync),
-            ctrl.ds.eq(C(0b11,2)),
+            ctrl.burst.eq(self.burst),
+            ctrl.ds.eq(self.ds),
             ctrl.sd_data_in.eq(sdram.dq.i),
             # Set output pins
-            self.data_out.eq(ctrl.dout)
+            self.req_ready.eq(ctrl.ready),
+            self.data_out.eq(ctrl.dout),
+            self.data_valid.eq(ctrl.dout_valid),
+            self.data_out_burst.eq(ctrl.dout_burst),
+            self.data_burst_valid.eq(ctrl.dout_burst_valid)
         ]
 
         return m
@@ -0,0 +1,257 @@
+# Simulation model of a 16-bit SDR SDRAM chip, such as the IS42S16160 on
+# the ULX4M, for the Amaranth python simulator.
+#
+# It decodes the commands on the chip pins of the Sdram controller every
+# sdram clock, keeps the written words in a dictionary, and returns read
+# data on sd_data_in CAS latency clocks after the READ command, where the
+# controller samples it. The burst length and the CAS latency are those set
+# in the mode register. Read bursts wrap in a block of the burst length, a
+# full page burst runs until a BURST TERMINATE, and a READ, WRITE or a
+# PRECHARGE of its bank stops the burst before it.
+#
+# Every command is checked against the state of the banks and the timing of
+# the chip, and the refreshes against their deadline: after the mode is set,
+# a refresh is owed every refresh interval and at most 8 can be owed. The
+# violations are in errors.
+#
+# The words read and written are counted for the bandwidth, see bandwidth().
+# Bits of words can be stuck, for memory tests, in faults with the (bank,
+# row, column) of the word and (mask, value) of the bits.
+#
+#   model = SdramModel(ctrl)
+#   sim.add_sync_process(model.process, domain="sdram")
+
+from math import ceil
+
+from amaranth.sim import Passive, Settle
+
+# Commands as Cat(we, cas, ras, cs)
+CMD_NOP             = 0b0111
+CMD_ACTIVE          = 0b0011
+CMD_READ            = 0b0101
+CMD_WRITE           = 0b0100
+CMD_BURST_TERMINATE = 0b0110
+CMD_PRECHARGE       = 0b0010
+CMD_AUTO_REFRESH    = 0b0001
+CMD_LOAD_MODE       = 0b0000
+
+NAMES = {
+    CMD_ACTIVE:          "ACTIVE",
+    CMD_READ:            "READ",
+    CMD_WRITE:           "WRITE",
+    CMD_BURST_TERMINATE: "BURST TERMINATE",
+    CMD_PRECHARGE:       "PRECHARGE",
+    CMD_AUTO_REFRESH:    "AUTO REFRESH",
+    CMD_LOAD_MODE:       "LOAD MODE",
+}
+
+BANKS   = 4
+COLUMNS = 512
+
+# Timing of the IS42S16160 in ns
+T_RCD = 20 # Activate to read or write
+T_RP  = 20 # Precharge to activate or refresh
+T_RAS = 42 # Activate to precharge
+T_RC  = 63 # Activate to activate in the same bank
+T_RFC = 63 # Refresh to activate or refresh
+T_RRD = 14 # Activate to activate in another bank
+T_CK2 = 10 # Shortest clock period with CAS latency 2, in all speed grades
+
+# In clocks
+T_WR  = 2  # Write to precharge
+T_MRD = 2  # Load mode to a command
+
+ROWS     = 8192
+REFRESH  = 64e-3 # All rows
+POSTPONE = 8     # Refreshes that can be owed
+
+
+class SdramModel:
+    def __init__(self, ctrl, period=10e-9):
+        self.ctrl = ctrl
+        self.period = period
+        self.mem = {}
+        self.faults = {}
+        self.rows = [None] * BANKS # Open row of each bank
+        self.mode = None
+        self.mode_cycle = None     # When the mode was first set
+        self.errors = []
+        self.commands = {}
+        self.refreshes = [] # Cycles of the refreshes
+        self.cycle = 0
+        self.words_read = 0
+        self.words_written = 0
+
+        # Timing in clocks
+        def clocks(ns):
+            return ceil(round(ns * 1e-9 / period, 6))
+        self.t_rcd  = clocks(T_RCD)
+        self.t_rp   = clocks(T_RP)
+        self.t_ras  = clocks(T_RAS)
+        self.t_rc   = clocks(T_RC)
+        self.t_rfc  = clocks(T_RFC)
+        self.t_rrd  = clocks(T_RRD)
+        self.t_refi = int(REFRESH / ROWS / period)
+
+    def error(self, cycle, message):
+        self.errors.append("Cycle {}: {}".format(cycle, message))
+
+    def burst_length(self):
+        length = (self.mode or 0) & 0b111
+        return COLUMNS if length == 0b111 else 1 << length
+
+    @property
+    def cas_latency(self):
+        return ((self.mode or 0) >> 4) & 0b111
+
+    def owed(self, cycle):
+        """Refreshes owed at cycle, from when the mode was set"""
+        if self.mode_cycle is None:
+            return 0
+        return (cycle - self.mode_cycle) // self.t_refi - len(self.refreshes)
+
+    def bandwidth(self, period=10e-9):
+        """Bytes per second read and written since the start"""
+        return 2 * (self.words_read + self.words_written) / (self.cycle * period)
+
+    def check(self, cycle, cmd, bank):
+        """Checks a command against the state of the banks and the timing,
+        bank is None for all banks"""
+        name = NAMES[cmd]
+        last = self.last
+
+        def since(event, clocks, what):
+            if event is not None and cycle - event < clocks:
+                self.error(cycle, "{} {} clocks after {}, not {}".format(name, cycle - event, what, clocks))
+
+        if self.mode is None and cmd not in (CMD_PRECHARGE, CMD_AUTO_REFRESH, CMD_LOAD_MODE):
+            self.error(cycle, "{} before the mode is set".format(name))
+        since(last["mode"], T_MRD, "LOAD MODE")
+
+        if cmd == CMD_ACTIVE:
+            if self.rows[bank] is not None:
+                self.error(cycle, "ACTIVE on open bank {}".format(bank))
+            since(last["pre"][bank], self.t_rp, "PRECHARGE")
+            since(last["act"][bank], self.t_rc, "ACTIVE")
+            since(last["ref"], self.t_rfc, "AUTO REFRESH")
+            for other in range(BANKS):
+                if other != bank:
+                    since(last["act"][other], self.t_rrd, "ACTIVE in bank {}".format(other))
+        elif cmd in (CMD_READ, CMD_WRITE):
+            if self.rows[bank] is None:
+                self.error(cycle, "{} on closed bank {}".format(name, bank))
+            since(last["act"][bank], self.t_rcd, "ACTIVE")
+        elif cmd == CMD_PRECHARGE:
+            for b in range(BANKS) if bank is None else [bank]:
+                if self.rows[b] is not None:
+                    since(last["act"][b], self.t_ras, "ACTIVE in bank {}".format(b))
+                    since(last["write"][b], T_WR, "WRITE in bank {}".format(b))
+        elif cmd in (CMD_AUTO_REFRESH, CMD_LOAD_MODE):
+            if any(row is not None for row in self.rows):
+                self.error(cycle, "{} with open banks".format(name))
+            for b in range(BANKS):
+                since(last["pre"][b], self.t_rp, "PRECHARGE")
+            since(last["ref"], self.t_rfc, "AUTO REFRESH")
+
+    def process(self):
+        ctrl = self.ctrl
+        pending = {} # Cycle: data to drive
+        read_bank = None # Bank of the last READ
+        self.last = {
+            "act":   [None] * BANKS,
+            "pre":   [None] * BANKS,
+            "write": [None] * BANKS,
+            "ref":   None,
+            "mode":  None,
+        }
+        overdue = False
+        yield Passive()
+        while True:
+            yield
+            yield Settle()
+            self.cycle += 1
+            cycle = self.cycle
+            if cycle in pending:
+                yield ctrl.sd_data_in.eq(pending.pop(cycle))
+                self.words_read += 1
+
+            # Refresh deadline
+            if self.owed(cycle) > POSTPONE:
+                if not overdue:
+                    self.error(cycle, "{} refreshes owed".format(self.owed(cycle)))
+                overdue = True
+            else:
+                overdue = False
+
+            cmd = ((yield ctrl.sd_cs) << 3) | ((yield ctrl.sd_ras) << 2) | \
+                  ((yield ctrl.sd_cas) << 1) | (yield ctrl.sd_we)
+            if cmd & 0b1000 or cmd == CMD_NOP:
+                continue
+            self.commands[cmd] = self.commands.get(cmd, 0) + 1
+
+            addr = yield ctrl.sd_addr
+            bank = yield ctrl.sd_ba
+            all_banks = cmd == CMD_PRECHARGE and addr & (1 << 10)
+            self.check(cycle, cmd, None if all_banks else bank)
+
+            # Stop a read burst, the data before the command still comes out
+            if cmd in (CMD_READ, CMD_BURST_TERMINATE) or \
+                    (cmd == CMD_PRECHARGE and (all_banks or bank == read_bank)):
+                for c in [c for c in pending if c >= cycle + self.cas_latency]:
+                    del pending[c]
+            elif cmd == CMD_WRITE:
+                if pending:
+                    self.error(cycle, "WRITE with read data on the bus")
+                pending.clear()
+
+            if cmd == CMD_LOAD_MODE:
+                self.mode = addr
+                self.last["mode"] = cycle
+                if self.mode_cycle is None:
+                    self.mode_cycle = cycle
+                if self.cas_latency not in (2, 3):
+                    self.error(cycle, "CAS latency {}".format(self.cas_latency))
+                elif self.cas_latency == 2 and round(self.period * 1e9, 6) < T_CK2:
+                    self.error(cycle, "CAS latency 2 with a {:.1f}ns clock".format(self.period * 1e9))
+                if addr & (1 << 3):
+                    self.error(cycle, "Interleaved bursts are not modelled")
+            elif cmd == CMD_ACTIVE:
+                self.rows[bank] = addr
+                self.last["act"][bank] = cycle
+            elif cmd == CMD_PRECHARGE:
+                for b in range(BANKS) if all_banks else [bank]:
+                    self.rows[b] = None
+                    self.last["pre"][b] = cycle
+            elif cmd == CMD_AUTO_REFRESH:
+                self.refreshes.append(cycle)
+                self.last["ref"] = cycle
+            elif cmd in (CMD_READ, CMD_WRITE):
+                row = self.rows[bank]
+                if row is None:
+                    continue
+                col = addr & (COLUMNS - 1)
+                if cmd == CMD_READ:
+                    read_bank = bank
+                    # Sequential bursts wrap in a block of the burst length
+                    length = self.burst_length()
+                    base = col & ~(length - 1)
+                    for i in range(length):
+                        key = (bank, row, base + (col + i) % length)
+                        value = self.mem.get(key, 0)
+                        if key in self.faults:
+                            mask, bits = self.faults[key]
+                            value = (value & ~mask) | (bits & mask)
+                        pending[cycle + self.cas_latency + i] = value
+                else:
+                    dqm = yield ctrl.sd_dqm
+                    data = yield ctrl.sd_data_out
+                    key = (bank, row, col)
+                    old = self.mem.get(key, 0)
+                    mask = (0 if dqm & 1 else 0x00ff) | (0 if dqm & 2 else 0xff00)
+                    self.mem[key] = (old & ~mask) | (data & mask)
+                    self.words_written += 1
+                    self.last["write"][bank] = cycle
+                # Auto precharge
+                if addr & (1 << 10):
+                    self.rows[bank] = None
+                    self.last["pre"][bank] = cycle
@@ -0,0 +1,294 @@
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from sdram16 import Sdram
+from sdram_model import SdramModel, CMD_ACTIVE, CMD_PRECHARGE
+from test_sdram16 import RamTest
+
+# Simulation of the Sdram controller against the SDRAM model, with requests
+# made every sdram clock, 100MHz or that of --freq.
+#
+# For each burst length, a block is written and read back with bursts, and
+# the read bandwidth is measured, and single words are read. Then a stream of
+# reads and a stream of writes to another part of the memory are interleaved,
+# as a framebuffer does, and the activates and precharges are counted with
+# and without bank interleaving. The refreshes are checked with the port
+# busy, when they are put off, and then idle. Last, the RAM test of
+# test_sdram16 is run on the first words of the memory with each burst
+# length, and page bursts with and without interleave.
+#
+#   python sdram_sim.py
+#   python sdram_sim.py --burst-length 8 --words 2048
+#   python sdram_sim.py --freq 133
+
+SDRAM_PERIOD = 10e-9
+
+# Sdram clocks a word took in the RAM test with a request every sync clock,
+# 1/8 of the sdram clock: 2 sync clocks to write it and 32 to read it
+OLD_TEST_CLOCKS = 8 * (2 + 32)
+
+
+class SdramTest(Elaboratable):
+    def __init__(self, burst_length, interleave, clk_freq=100e6):
+        self.i_init = Signal()
+        self.ctrl = Sdram(burst_length, interleave, clk_freq)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.ctrl = ctrl = self.ctrl
+
+        m.d.comb += [
+            ctrl.init.eq(self.i_init),
+            ctrl.ds.eq(0b11),
+        ]
+
+        return m
+
+
+def simulate(dut, client, faults={}, period=SDRAM_PERIOD):
+    model = SdramModel(dut.ctrl, period)
+    model.faults.update(faults)
+
+    sim = Simulator(dut)
+    sim.add_clock(period, domain="sdram")
+    sim.add_sync_process(model.process, domain="sdram")
+
+    def process():
+        yield dut.i_init.eq(1)
+        yield
+        yield dut.i_init.eq(0)
+        # Wait for the SDRAM initialization
+        for _ in range(300):
+            yield
+        yield from client(dut.ctrl)
+    sim.add_sync_process(process, domain="sdram")
+    sim.run()
+
+    return model
+
+
+def requests(ctrl, reqs, on_data=None):
+    """Makes the requests (addr, we, value, burst) a clock apart when taken,
+    calls on_data with each dout_burst, returns the clocks taken"""
+    reqs = list(reqs)
+    clock = 0
+    while reqs:
+        addr, we, value, burst = reqs[0]
+        yield ctrl.addr.eq(addr)
+        yield ctrl.we.eq(we)
+        yield ctrl.din.eq(value)
+        yield ctrl.burst.eq(burst)
+        yield ctrl.valid.eq(1)
+        yield
+        clock += 1
+        if (yield ctrl.ready):
+            reqs.pop(0)
+        if on_data and (yield ctrl.dout_burst_valid):
+            on_data((yield ctrl.dout_burst))
+    yield ctrl.valid.eq(0)
+    return clock
+
+
+def collect(ctrl, groups, data):
+    """Waits for the rest of the read data, returns the clocks taken"""
+    clock = 0
+    while len(data) < groups:
+        yield
+        clock += 1
+        if (yield ctrl.dout_burst_valid):
+            data.append((yield ctrl.dout_burst))
+    return clock
+
+
+def write(ctrl, base, data):
+    return (yield from requests(ctrl, [(base + i, 1, int(value), 0) for i, value in enumerate(data)]))
+
+
+def read_bursts(ctrl, base, words):
+    """Reads words from base with bursts, returns the data and clocks"""
+    length = ctrl.burst_length
+    step = 512 if length == "page" else length
+    groups = step // ctrl.burst_words
+    reads = range(base, base + words, step)
+
+    bursts = []
+    clock = yield from requests(ctrl, [(addr, 0, 0, 1) for addr in reads], bursts.append)
+    clock += yield from collect(ctrl, len(reads) * groups, bursts)
+
+    data = [(value >> (16 * i)) & 0xffff for value in bursts for i in range(ctrl.burst_words)]
+    return data[:words], clock
+
+
+def read_single(ctrl, addrs):
+    """Reads single words, returns the data"""
+    bursts = []
+    yield from requests(ctrl, [(addr, 0, 0, 0) for addr in addrs], bursts.append)
+    yield from collect(ctrl, len(addrs), bursts)
+    return [value & 0xffff for value in bursts]
+
+
+def streams(ctrl, read_base, write_base, words):
+    """Reads and writes sequential words in turn, as a framebuffer does"""
+    reqs = []
+    for i in range(words):
+        reqs += [(read_base + i, 0, 0, 0), (write_base + i, 1, i, 0)]
+    bursts = []
+    yield from requests(ctrl, reqs, bursts.append)
+    yield from collect(ctrl, words, bursts)
+
+
+def busy_then_idle(ctrl, clocks):
+    """Reads all the time for clocks, then waits as long"""
+    bursts = []
+    step = ctrl.burst_words
+    reads = [(i * step % 4096, 0, 0, 1) for i in range(clocks // step)]
+    yield from requests(ctrl, reads, bursts.append)
+    for _ in range(clocks):
+        yield
+
+
+class ControllerSim(Elaboratable):
+    """A test of sdram_controller, such as RamTest, on its signals without
+    the pins"""
+    def __init__(self, test, burst_length=4, interleave=False, clk_freq=100e6, **kwargs):
+        self.i_init = Signal()
+        self.ctrl = Sdram(burst_length, interleave, clk_freq)
+        self.burst_length = burst_length
+        self.interleave = interleave
+        self.address   = Signal(24)
+        self.req_read  = Signal()
+        self.req_write = Signal()
+        self.burst     = Signal()
+        self.data_in   = Signal(16)
+        self.req_ready = Signal()
+        self.data_out  = Signal(16)
+        self.data_valid = Signal()
+        self.data_out_burst = Signal(16 * self.ctrl.burst_words)
+        self.data_burst_valid = Signal()
+        self.test = test(self, **kwargs)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.ctrl = ctrl = self.ctrl
+        m.submodules.test = self.test
+
+        m.d.comb += [
+            ctrl.init.eq(self.i_init),
+            ctrl.ds.eq(0b11),
+            ctrl.addr.eq(self.address),
+            ctrl.valid.eq(self.req_read | self.req_write),
+            ctrl.we.eq(self.req_write),
+            ctrl.burst.eq(self.burst),
+            ctrl.din.eq(self.data_in),
+            self.req_ready.eq(ctrl.ready),
+            self.data_out.eq(ctrl.dout),
+            self.data_valid.eq(ctrl.dout_valid),
+            self.data_out_burst.eq(ctrl.dout_burst),
+            self.data_burst_valid.eq(ctrl.dout_burst_valid),
+        ]
+
+        return m
+
+
+def ram_test(dut):
+    """Waits for the end of the RAM test, returns the clocks it took"""
+    clock = 0
+    while not ((yield dut.test.passed) or (yield dut.test.err)):
+        yield
+        clock += 1
+    return clock
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst-length", choices=["1", "2", "4", "8", "page"], default=None, help="default all")
+    parser.add_argument("--words", type=int, default=1024)
+    parser.add_argument("--refresh-time", type=int, default=20000, help="sdram clocks busy, then idle")
+    parser.add_argument("--test-bits", type=int, default=12, help="address bits of the RAM test")
+    parser.add_argument("--freq", type=float, default=100, help="sdram clock in MHz")
+    args = parser.parse_args()
+
+    clk_freq = args.freq * 1e6
+    period = 1 / clk_freq
+
+    lengths = [args.burst_length] if args.burst_length else ["1", "2", "4", "8", "page"]
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 1 << 16, size=args.words)
+    addrs = [int(a) for a in rng.integers(0, args.words, size=16)]
+
+    failed = False
+    for length in [int(l) if l != "page" else l for l in lengths]:
+        result = {}
+
+        def client(ctrl):
+            yield from write(ctrl, 0, data)
+            result["data"], result["clocks"] = yield from read_bursts(ctrl, 0, args.words)
+            result["single"] = yield from read_single(ctrl, addrs)
+
+        model = simulate(SdramTest(length, True, clk_freq), client, period=period)
+        ok = (not model.errors and result.get("data") == [int(d) for d in data] and
+              result.get("single") == [int(data[a]) for a in addrs])
+        failed |= not ok
+        print("Burst length {:>4}: reads {:6.1f} MB/s, {:.0f}% of the {:g}MHz x 16-bit bus: {}".format(
+            length, 2e-6 * args.words / (result["clocks"] * period),
+            100 * args.words / result["clocks"], args.freq, "PASSED" if ok else "FAILED"))
+        for error in model.errors[:10]:
+            print(error)
+
+    for interleave in [False, True]:
+        def client(ctrl):
+            yield from streams(ctrl, 0, (1 << 16) + 1024, args.words)
+
+        model = simulate(SdramTest(4, interleave, clk_freq), client, period=period)
+        failed |= bool(model.errors)
+        print("Read and write streams, interleave {}: {} activates, {} precharges for {} accesses{}".format(
+            interleave, model.commands.get(CMD_ACTIVE, 0), model.commands.get(CMD_PRECHARGE, 0),
+            2 * args.words, "" if not model.errors else ": FAILED"))
+        for error in model.errors[:10]:
+            print(error)
+
+    def client(ctrl):
+        yield from busy_then_idle(ctrl, args.refresh_time)
+
+    dut = SdramTest(4, True, clk_freq)
+    model = simulate(dut, client, period=period)
+    interval = int(64e-3 / 8192 / period)
+    gaps = np.diff([0] + model.refreshes)
+    busy = [r for r in model.refreshes if r < args.refresh_time]
+    # Refreshes owed at the end, at most 8 can be put off
+    owed = model.cycle // interval - len(model.refreshes)
+    ok = not model.errors and gaps.max() <= 9 * interval and owed <= 8
+    failed |= not ok
+    print("Refresh: {} while busy, {} after, longest gap {:.1f}us, {} owed at the end: {}".format(
+        len(busy), len(model.refreshes) - len(busy), 1e6 * gaps.max() * period, owed,
+        "PASSED" if ok else "FAILED"))
+    for error in model.errors[:10]:
+        print(error)
+
+    for length, interleave in [(int(l) if l != "page" else l, il) for l in lengths
+                               for il in ([False, True] if l == "page" else [False])]:
+        result = {}
+        dut = ControllerSim(RamTest, burst_length=length, interleave=interleave, clk_freq=clk_freq,
+                            bits=args.test_bits)
+
+        def client(ctrl):
+            result["clocks"] = yield from ram_test(dut)
+            result["passed"] = yield dut.test.passed
+
+        model = simulate(dut, client, period=period)
+        ok = result["passed"] and not model.errors
+        failed |= not ok
+        clocks = result["clocks"] / (1 << args.test_bits)
+        print("RAM test of {} words, burst length {}{}: {:.1f} clocks a word, {:.0f} times faster than a request "
+              "every sync clock: {}".format(1 << args.test_bits, length, ", interleave" if interleave else "",
+                                            clocks, OLD_TEST_CLOCKS / clocks, "PASSED" if ok else "FAILED"))
+        for error in model.errors[:10]:
+            print(error)
+
+    print("FAILED" if failed else "PASSED")
@@ -0,0 +1,250 @@
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFO
+
+from spimem import SpiMem
+
+# CRC-32 as binascii.crc32 and zlib, reflected
+CRC_POLY = 0xEDB88320
+
+def crc32_byte(crc, byte):
+    """The CRC after a byte, without the final inversion"""
+    # Each bit is the xor of bits of Cat(crc, byte), found by running the
+    # CRC on masks of those bits
+    terms = [1 << i for i in range(32)]
+    for i in range(8):
+        lsb = terms[0] ^ (1 << (32 + i))
+        terms = terms[1:] + [0]
+        terms = [t ^ lsb if (CRC_POLY >> j) & 1 else t for j, t in enumerate(terms)]
+    inputs = Cat(crc, byte)
+    return Cat(*[(inputs & t).xor() for t in terms])
+
+# DMA from the ESP32 SPI link into SDRAM, through an SdramArbiter port.
+#
+# The SPI protocol is that of SpiMem: a command byte, 0 to write or 1 to
+# read, a 32-bit byte address and the data. Bytes written below 32MB go to
+# the SDRAM, packed into 16-bit words, the first byte at an even address in
+# the low 8 bits. A word is written with only one of its bytes at the start
+# or the end of an odd transfer. Words wait in a FIFO for the port. The SPI
+# master cannot be stalled, so a word that finds the FIFO full is lost, and
+# sets the overflow bit of the status until the next clear.
+#
+# A CRC-32 of the bytes written is kept, the same as binascii.crc32 of all
+# the data since the last clear, so the ESP32 can check a load of any size.
+# The verify command reads a block of the SDRAM back in bursts and computes
+# its CRC-32, checking what is in the memory without sending it over SPI.
+# The arbiter burst length is that of the verify reads, and not "page".
+#
+# Registers are at the addresses with addr_regs in the top byte, 32-bit
+# values little endian:
+#
+#   read  0:  CRC of the bytes written
+#         4:  CRC of the last verify
+#         8:  bytes written
+#         12: status, bit 0 verify busy, bit 1 writes pending, bit 2 overflow
+#   write 0:  verify start, byte address
+#         4:  verify length, bytes
+#         12: command, bit 0 clear the CRC, the count of bytes written and
+#             the overflow, bit 1 start a verify
+#
+# Other addresses are passed on with addr, dout, rd, wr and din as SpiMem.
+class SpiSdramDma(Elaboratable):
+    def __init__(self, port, addr_regs=0xf2, fifo_depth=16):
+        # SPI, csn active low
+        self.copi    = Signal()
+        self.csn     = Signal()
+        self.sclk    = Signal()
+        self.cipo    = Signal()
+
+        # Other addresses
+        self.din     = Signal(8)
+        self.addr    = Signal(32)
+        self.dout    = Signal(8)
+        self.rd      = Signal()
+        self.wr      = Signal()
+
+        # Status
+        self.o_busy  = Signal()
+
+        # SDRAM port, sync domain
+        self.port = port
+        # Configuration
+        self.addr_regs = addr_regs
+        self.fifo_depth = fifo_depth
+
+    def elaborate(self, platform):
+        m = Module()
+
+        port = self.port
+        burst_words = len(port.o_rd_data) // 16
+        burst_bytes = 2 * burst_words
+        offset_bits = burst_bytes.bit_length() - 1
+
+        m.submodules.spimem = spimem = SpiMem(addr_bits=32)
+
+        regs   = Signal()
+        sdram  = Signal()
+        wr     = Signal() # A byte written
+        end    = Signal() # End of a transfer
+        r_wr   = Signal()
+        r_csn  = Signal()
+        status = Signal(8)
+
+        w_crc    = Signal(32, reset=0xffffffff)
+        w_count  = Signal(32)
+        v_crc    = Signal(32, reset=0xffffffff)
+        v_start  = Signal(32)
+        v_length = Signal(32)
+
+        m.d.comb += [
+            spimem.csn.eq(self.csn),
+            spimem.sclk.eq(self.sclk),
+            spimem.copi.eq(self.copi),
+            self.cipo.eq(spimem.cipo),
+            self.addr.eq(spimem.addr),
+            self.dout.eq(spimem.dout),
+            regs.eq(spimem.addr[24:] == self.addr_regs),
+            sdram.eq(spimem.addr[25:] == 0),
+            self.rd.eq(spimem.rd & ~regs),
+            self.wr.eq(spimem.wr & ~regs),
+            wr.eq(spimem.wr & ~r_wr),
+            end.eq(self.csn & ~r_csn),
+        ]
+
+        m.d.sync += [
+            r_wr.eq(spimem.wr),
+            r_csn.eq(self.csn),
+        ]
+
+        # Register reads
+        with m.If(regs):
+            with m.Switch(spimem.addr[2:4]):
+                with m.Case(0):
+                    m.d.comb += spimem.din.eq((~w_crc).word_select(spimem.addr[:2], 8))
+                with m.Case(1):
+                    m.d.comb += spimem.din.eq((~v_crc).word_select(spimem.addr[:2], 8))
+                with m.Case(2):
+                    m.d.comb += spimem.din.eq(w_count.word_select(spimem.addr[:2], 8))
+                with m.Case(3):
+                    m.d.comb += spimem.din.eq(Mux(spimem.addr[:2] == 0, status, 0))
+        with m.Else():
+            m.d.comb += spimem.din.eq(self.din)
+
+        # Words to write, with their address and byte selects
+        m.submodules.fifo = fifo = SyncFIFO(width=24 + 16 + 2, depth=self.fifo_depth)
+
+        low      = Signal(8)
+        low_addr = Signal(24)
+        pending  = Signal() # The low byte of a word is waiting for the high one
+        overflow = Signal() # A word was lost to a full FIFO
+
+        with m.If(fifo.w_en & ~fifo.w_rdy):
+            m.d.sync += overflow.eq(1)
+
+        with m.If(wr & sdram & ~regs):
+            m.d.sync += [
+                w_crc.eq(crc32_byte(w_crc, spimem.dout)),
+                w_count.eq(w_count + 1),
+            ]
+            with m.If(spimem.addr[0] == 0):
+                m.d.sync += [
+                    low.eq(spimem.dout),
+                    low_addr.eq(spimem.addr[1:25]),
+                    pending.eq(1),
+                ]
+            with m.Else():
+                m.d.comb += [
+                    fifo.w_data.eq(Cat(spimem.addr[1:25], low, spimem.dout, pending, 1)),
+                    fifo.w_en.eq(1),
+                ]
+                m.d.sync += pending.eq(0)
+        with m.Elif(end & pending):
+            m.d.comb += [
+                fifo.w_data.eq(Cat(low_addr, low, C(0, 8), C(0b01, 2))),
+                fifo.w_en.eq(1),
+            ]
+            m.d.sync += pending.eq(0)
+
+        # Verify, bursts are read from the aligned address before the start,
+        # and the bytes before the start and after the end are skipped
+        v_busy   = Signal()
+        v_addr   = Signal(24)
+        v_left   = Signal(32 - offset_bits + 1) # Bursts to request
+        v_pos    = Signal(33)                   # Position of the next byte
+        v_skip   = Signal(offset_bits)
+        v_total  = Signal(33)
+        shifter  = Signal(16 * burst_words)
+        v_cnt    = Signal(range(burst_bytes + 1))
+
+        m.d.comb += [
+            status.eq(Cat(v_busy, pending | fifo.r_rdy, overflow)),
+            self.o_busy.eq(status[:2] != 0),
+        ]
+
+        # Register writes
+        with m.If(wr & regs):
+            with m.Switch(spimem.addr[2:4]):
+                with m.Case(0):
+                    m.d.sync += v_start.word_select(spimem.addr[:2], 8).eq(spimem.dout)
+                with m.Case(1):
+                    m.d.sync += v_length.word_select(spimem.addr[:2], 8).eq(spimem.dout)
+                with m.Case(3):
+                    with m.If(spimem.dout[0]):
+                        m.d.sync += [
+                            w_crc.eq(w_crc.reset),
+                            w_count.eq(0),
+                            overflow.eq(0),
+                        ]
+                    with m.If(spimem.dout[1]):
+                        m.d.sync += [
+                            v_busy.eq(v_length != 0),
+                            v_addr.eq(Cat(C(0, offset_bits - 1), v_start[offset_bits:25])),
+                            v_left.eq((v_start[:offset_bits] + v_length + burst_bytes - 1) >> offset_bits),
+                            v_pos.eq(0),
+                            v_skip.eq(v_start[:offset_bits]),
+                            v_total.eq(v_start[:offset_bits] + v_length),
+                            v_cnt.eq(0),
+                            v_crc.eq(v_crc.reset),
+                        ]
+
+        # Requests to the port, writes first
+        with m.If(fifo.r_rdy):
+            m.d.comb += [
+                port.i_valid.eq(1),
+                port.i_we.eq(1),
+                port.i_addr.eq(fifo.r_data[:24]),
+                port.i_data.eq(fifo.r_data[24:40]),
+                port.i_ds.eq(fifo.r_data[40:]),
+                fifo.r_en.eq(port.o_ready),
+            ]
+        with m.Elif(v_busy & (v_left != 0)):
+            m.d.comb += [
+                port.i_valid.eq(1),
+                port.i_addr.eq(v_addr),
+                port.i_burst.eq(1),
+            ]
+            with m.If(port.o_ready):
+                m.d.sync += [
+                    v_addr.eq(v_addr + burst_words),
+                    v_left.eq(v_left - 1),
+                ]
+
+        # Read data, a byte every clock into the CRC
+        m.d.comb += port.i_rd_ready.eq(v_cnt == 0)
+
+        with m.If(port.o_rd_valid & (v_cnt == 0)):
+            m.d.sync += [
+                shifter.eq(port.o_rd_data),
+                v_cnt.eq(burst_bytes),
+            ]
+        with m.Elif(v_cnt != 0):
+            m.d.sync += [
+                shifter.eq(shifter >> 8),
+                v_cnt.eq(v_cnt - 1),
+                v_pos.eq(v_pos + 1),
+            ]
+            with m.If((v_pos >= v_skip) & (v_pos < v_total)):
+                m.d.sync += v_crc.eq(crc32_byte(v_crc, shifter[:8]))
+            with m.If(v_pos == v_total - 1):
+                m.d.sync += v_busy.eq(0)
+
+        return m
@@ -0,0 +1,210 @@
+import argparse
+import binascii
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
+from sdram16 import Sdram
+from sdram_model import SdramModel
+from sdram_arbiter import SdramArbiter
+from spi_dma import SpiSdramDma
+
+# Simulation of the SPI to SDRAM DMA, with the SPI master of the ESP32
+# bit-banged at 4MHz, against the SDRAM model.
+#
+# A block is filled with a pattern, then data is loaded over it from an odd
+# address to an even one, so the words at both ends are only partly
+# written. The CRC of the load is checked against binascii.crc32, and a
+# verify of the data, and of the whole block with the pattern around it,
+# against the CRC of what should be in the SDRAM.
+#
+# Then the port is stalled during a load longer than the write FIFOs, which
+# must set the overflow bit, until it is cleared.
+#
+#   python spi_dma_sim.py
+#   python spi_dma_sim.py --burst-length 1 --length 4000 --start 1001
+
+SPI_PERIOD = 40e-9 # Clock of the DMA
+SPI_HALF   = 3     # DMA clocks in half an SPI clock
+
+ADDR_REGS = 0xf2
+
+
+class SpiDmaTest(Elaboratable):
+    def __init__(self, burst_length):
+        self.i_init = Signal()
+        self.i_stall = Signal() # Holds the requests of the arbiter
+        self.ctrl = Sdram(burst_length, interleave=True)
+        self.arbiter = SdramArbiter(["spi"], burst_length=burst_length)
+        self.dma = SpiSdramDma(self.arbiter.ports[0], addr_regs=ADDR_REGS)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.ctrl = ctrl = self.ctrl
+        m.submodules.arbiter = DomainRenamer({"sync": "sdram"})(self.arbiter)
+        m.submodules.dma = DomainRenamer({"sync": "spi"})(self.dma)
+        arbiter = self.arbiter
+
+        m.d.comb += [
+            ctrl.init.eq(self.i_init),
+            ctrl.ds.eq(arbiter.o_ds),
+            ctrl.addr.eq(arbiter.o_addr),
+            ctrl.valid.eq((arbiter.o_req_read | arbiter.o_req_write) & ~self.i_stall),
+            ctrl.we.eq(arbiter.o_req_write),
+            ctrl.burst.eq(arbiter.o_burst),
+            ctrl.din.eq(arbiter.o_data),
+            arbiter.i_req_ready.eq(ctrl.ready & ~self.i_stall),
+            arbiter.i_data_burst.eq(ctrl.dout_burst),
+            arbiter.i_data_burst_valid.eq(ctrl.dout_burst_valid),
+        ]
+
+        return m
+
+
+def transfer(dma, data):
+    """An SPI transfer, mode 0, returns the bytes read"""
+    result = []
+    yield dma.csn.eq(0)
+    for byte in data:
+        value = 0
+        for i in range(8):
+            yield dma.copi.eq((byte >> (7 - i)) & 1)
+            for _ in range(SPI_HALF):
+                yield
+            value = (value << 1) | (yield dma.cipo)
+            yield dma.sclk.eq(1)
+            for _ in range(SPI_HALF):
+                yield
+            yield dma.sclk.eq(0)
+        result.append(value)
+    for _ in range(SPI_HALF):
+        yield
+    yield dma.csn.eq(1)
+    for _ in range(2 * SPI_HALF):
+        yield
+    return result
+
+
+def load(dma, addr, data):
+    yield from transfer(dma, [0] + list(addr.to_bytes(4, "big")) + list(data))
+
+
+def read(dma, addr, n):
+    result = yield from transfer(dma, [1] + list(addr.to_bytes(4, "big")) + [0] * (n + 1))
+    return bytes(result[6:])
+
+
+def reg_read(dma, offset):
+    value = yield from read(dma, (ADDR_REGS << 24) | offset, 4)
+    return int.from_bytes(value, "little")
+
+
+def reg_write(dma, offset, data):
+    yield from load(dma, (ADDR_REGS << 24) | offset, data)
+
+
+def wait_status(dma, mask, polls=100):
+    """Polls the status until its mask bits clear, False if they do not"""
+    for _ in range(polls):
+        if not (yield from reg_read(dma, 12)) & mask:
+            return True
+    return False
+
+
+def verify(dma, start, length):
+    """CRC of a block of the SDRAM, read back by the DMA, None if the verify
+    does not finish"""
+    yield from reg_write(dma, 0, start.to_bytes(4, "little") + length.to_bytes(4, "little"))
+    yield from reg_write(dma, 12, [2])
+    if not (yield from wait_status(dma, 1)):
+        return None
+    return (yield from reg_read(dma, 4))
+
+
+def simulate(dut, block, start, length):
+    dma = dut.dma
+    model = SdramModel(dut.ctrl)
+    rng = np.random.default_rng(1)
+    data = bytes(int(d) for d in rng.integers(0, 256, size=length))
+    pattern = bytes((0x5a + i) & 0xff for i in range(block))
+    expected = bytearray(pattern)
+    expected[start:start + length] = data
+    results = {}
+
+    sim = Simulator(dut)
+    sim.add_clock(10e-9, domain="sdram")
+    sim.add_clock(SPI_PERIOD, domain="spi")
+    sim.add_sync_process(model.process, domain="sdram")
+
+    def process():
+        yield dma.csn.eq(1)
+        yield dut.i_init.eq(1)
+        yield
+        yield dut.i_init.eq(0)
+        # Wait for the SDRAM initialization
+        for _ in range(100):
+            yield
+
+        yield from load(dma, 0, pattern)
+        yield from reg_write(dma, 12, [1])
+        yield from load(dma, start, data)
+        results["crc"] = yield from reg_read(dma, 0)
+        results["count"] = yield from reg_read(dma, 8)
+        results["verify"] = yield from verify(dma, start, length)
+        results["verify_block"] = yield from verify(dma, 0, block)
+        results["status"] = yield from reg_read(dma, 12)
+
+        # A slow port
+        yield dut.i_stall.eq(1)
+        # Twice the words the FIFOs of the DMA and the arbiter hold
+        yield from load(dma, block, bytes(4 * (dma.fifo_depth + dut.arbiter.fifo_depth)))
+        results["stalled"] = yield from reg_read(dma, 12)
+        yield dut.i_stall.eq(0)
+        results["drained"] = yield from wait_status(dma, 3)
+        yield from reg_write(dma, 12, [1])
+        results["cleared"] = yield from reg_read(dma, 12)
+    sim.add_sync_process(process, domain="spi")
+    sim.run()
+
+    errors = list(model.errors)
+    for name in ("verify", "verify_block"):
+        if results[name] is None:
+            errors.append("{} did not finish".format(name.capitalize().replace("_", " ")))
+            results[name] = 0
+    if not results["drained"]:
+        errors.append("Writes still pending after the stall")
+    for name, value, want in (
+            ("Load CRC", results["crc"], binascii.crc32(data)),
+            ("Bytes loaded", results["count"], length),
+            ("Verify CRC", results["verify"], binascii.crc32(data)),
+            ("Block CRC", results["verify_block"], binascii.crc32(expected)),
+            ("Status", results["status"], 0),
+            ("Stalled status", results["stalled"] & 4, 4),
+            ("Cleared status", results["cleared"], 0)):
+        if value != want:
+            errors.append("{} {:08x}, not {:08x}".format(name, value, want))
+
+    return errors, model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst-length", choices=["1", "2", "4", "8"], default=None, help="default all")
+    parser.add_argument("--block", type=int, default=256, help="bytes")
+    parser.add_argument("--start", type=int, default=3)
+    parser.add_argument("--length", type=int, default=200)
+    args = parser.parse_args()
+
+    failed = False
+    for burst_length in [int(args.burst_length)] if args.burst_length else [1, 2, 4, 8]:
+        errors, model = simulate(SpiDmaTest(burst_length), args.block, args.start, args.length)
+        failed |= bool(errors)
+        print("Burst length {}: {} bytes at {}, {}".format(
+            burst_length, args.length, args.start, "FAILED" if errors else "PASSED"))
+        for error in errors[:10]:
+            print(error)
+
+    print("FAILED" if failed else "PASSED")
@@ -0,0 +1,176 @@
+import argparse
+
+from amaranth import *
+from amaranth.build import *
+from ulx4m import *
+
+from ecp5pll import ECP5PLL
+from sdram_controller16 import sdram_controller
+from framebuffer import Framebuffer
+from vga import VGA
+from vga2dvid import VGA2DVID
+
+# Test of the SDRAM framebuffer: 640x480 on the GPDI connector.
+# A moving pattern is drawn into the back buffer, which is shown with a flip
+# when it is complete.
+class Top(Elaboratable):
+    def elaborate(self, platform):
+        m = Module()
+
+        # Get pins
+        led = [platform.request("led",count) for count in range(4)]
+        leds = Cat([i.o for i in led])
+        clk_in = platform.request(platform.default_clk, dir='-')[0]
+
+        # The dir='-' is required because else nmigen will instantiate
+        # differential pair buffers for us. Since we instantiate ODDRX1F
+        # by hand, we do not want this, and dir='-' gives us access to the
+        # _p signal.
+        gpdi = [platform.request("gpdi", i, dir='-') for i in range(4)]
+
+        # Clock generation
+        # PLL - 100MHz for sdram, 25MHz pixel clock and 125MHz DDR shift clock
+        sdram_freq = 100000000
+        pixel_freq = 25000000
+        m.domains.sdram = cd_sdram = ClockDomain("sdram")
+        m.domains.sdram_clk = cd_sdram_clk = ClockDomain("sdram_clk")
+        m.domains.pixel = cd_pixel = ClockDomain("pixel")
+        m.domains.shift = cd_shift = ClockDomain("shift")
+
+        m.submodules.ecp5pll = pll = ECP5PLL()
+        pll.register_clkin(clk_in,  platform.default_clk_frequency)
+        pll.create_clkout(cd_sdram, sdram_freq)
+        pll.create_clkout(cd_sdram_clk, sdram_freq, phase=180)
+
+        # A second PLL for the video clocks
+        m.submodules.ecp5pll_video = pll_video = ECP5PLL()
+        pll_video.register_clkin(clk_in,  platform.default_clk_frequency)
+        pll_video.create_clkout(cd_pixel, pixel_freq)
+        pll_video.create_clkout(cd_shift, pixel_freq * 5)
+
+        platform.add_clock_constraint(cd_sdram.clk, sdram_freq)
+        platform.add_clock_constraint(cd_pixel.clk, pixel_freq)
+        platform.add_clock_constraint(cd_shift.clk, pixel_freq * 5)
+
+        # Power-on reset, used to setup SDRAM as using pll.locked does not work
+        reset_cnt = Signal(5, reset=0)
+        with m.If(~reset_cnt.all()):
+            m.d.sdram += reset_cnt.eq(reset_cnt+1)
+
+        # Add the SDRAM controller and the framebuffer, in the sdram domain
+        m.submodules.mem = mem = sdram_controller(interleave=True)
+        fb = Framebuffer(640, 480)
+        m.submodules.fb = DomainRenamer({"sync": "sdram"})(fb)
+
+        m.d.comb += [
+            mem.init.eq(reset_cnt == 0), # Initialize SDRAM
+            mem.address.eq(fb.o_addr),
+            mem.req_read.eq(fb.o_req_read & reset_cnt.all()),
+            mem.req_write.eq(fb.o_req_write & reset_cnt.all()),
+            mem.burst.eq(fb.o_burst),
+            mem.data_in.eq(fb.o_data),
+            fb.i_req_ready.eq(mem.req_ready & reset_cnt.all()),
+            fb.i_data_burst.eq(mem.data_out_burst),
+            fb.i_data_burst_valid.eq(mem.data_burst_valid)
+        ]
+
+        # Draw a pattern that moves one pixel each frame, then flip
+        x     = Signal(10)
+        y     = Signal(9)
+        frame = Signal(8)
+        wait  = Signal() # Set while the flip is pending
+
+        m.d.comb += [
+            fb.i_wr_addr.eq(y * 640 + x),
+            fb.i_wr_data.eq(Cat((x + frame)[3:8], (x ^ y)[2:8], (y + frame)[3:8])),
+            fb.i_wr_en.eq(reset_cnt.all() & ~wait)
+        ]
+
+        m.d.sdram += fb.i_flip.eq(0)
+        with m.If(wait):
+            with m.If(~fb.o_flip_pending & ~fb.i_flip):
+                m.d.sdram += wait.eq(0)
+        with m.Elif(fb.i_wr_en & fb.o_wr_ready):
+            m.d.sdram += x.eq(x + 1)
+            with m.If(x == 639):
+                m.d.sdram += [
+                    x.eq(0),
+                    y.eq(y + 1)
+                ]
+                with m.If(y == 479):
+                    m.d.sdram += [
+                        y.eq(0),
+                        frame.eq(frame + 1),
+                        fb.i_flip.eq(1),
+                        wait.eq(1)
+                    ]
+
+        # VGA signal generator, 640x480 at 60Hz
+        m.submodules.vga = vga = VGA(
+            resolution_x      = 640,
+            hsync_front_porch = 16,
+            hsync_pulse       = 96,
+            hsync_back_porch  = 48,
+            resolution_y      = 480,
+            vsync_front_porch = 10,
+            vsync_pulse       = 2,
+            vsync_back_porch  = 33,
+            bits_x            = 10,
+            bits_y            = 10
+        )
+
+        m.d.comb += [
+            fb.i_fetch_next.eq(vga.o_fetch_next),
+            fb.i_vsync.eq(vga.o_vga_vsync),
+            vga.i_clk_en.eq(1),
+            vga.i_test_picture.eq(0),
+            vga.i_r.eq(fb.o_r),
+            vga.i_g.eq(fb.o_g),
+            vga.i_b.eq(fb.o_b)
+        ]
+
+        # VGA to digital video converter
+        tmds = [Signal(2) for i in range(4)]
+        m.submodules.vga2dvid = vga2dvid = VGA2DVID(ddr=True, shift_clock_synchronizer=False)
+        m.d.comb += [
+            vga2dvid.i_red.eq(vga.o_vga_r),
+            vga2dvid.i_green.eq(vga.o_vga_g),
+            vga2dvid.i_blue.eq(vga.o_vga_b),
+            vga2dvid.i_hsync.eq(vga.o_vga_hsync),
+            vga2dvid.i_vsync.eq(vga.o_vga_vsync),
+            vga2dvid.i_blank.eq(vga.o_vga_blank),
+            tmds[3].eq(vga2dvid.o_clk),
+            tmds[2].eq(vga2dvid.o_red),
+            tmds[1].eq(vga2dvid.o_green),
+            tmds[0].eq(vga2dvid.o_blue)
+        ]
+
+        # Convert SDR 2-bit input to DDR clocked 1-bit output
+        for i in range(4):
+            m.submodules["ddr_{}".format(i)] = Instance("ODDRX1F",
+                i_SCLK = ClockSignal("shift"),
+                i_RST  = 0b0,
+                i_D0   = tmds[i][0],
+                i_D1   = tmds[i][1],
+                o_Q    = gpdi[i].p)
+
+        # Show the frame count on the leds
+        m.d.comb += leds.eq(frame[:4])
+
+        return m
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+
+    platform.build(Top(), do_program=True, nextpnr_opts="--timing-allow-fail")
@@ -0,0 +1,94 @@
+import argparse
+
+from amaranth import *
+from amaranth.build import *
+from amaranth_stdio.serial import AsyncSerial
+from ulx4m import *
+
+from ecp5pll import ECP5PLL
+from sdram_controller16 import sdram_controller
+from sdram_bist import SdramBist, BistReport
+from phase_cal import PhaseCalibration
+
+# Calibration of the SDRAM clock phase at power on, with the dynamic phase
+# steps of the PLL, then the SDRAM built-in self test at the phase found,
+# reported on the UART at 115200 baud, see BistReport.
+#
+# The green led is on when a window of good phases was found, the blue led
+# while the calibration runs, and red for errors in the self test.
+#
+#   python test_phase_cal.py 85F --freq 133
+class Top(Elaboratable):
+    def __init__(self, sdram_freq=100e6):
+        self.sdram_freq = sdram_freq
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Get pins
+        led = [platform.request("led",count) for count in range(4)]
+        leds = Cat([i.o for i in led])
+        clk_in = platform.request(platform.default_clk, dir='-')[0]
+        uart = platform.request("uart")
+
+        # Clock generation
+        # PLL - sdram clock, and the SDRAM chip clock with a dynamic phase
+        sdram_freq = self.sdram_freq
+        m.domains.sdram = cd_sdram = ClockDomain("sdram")
+        m.domains.sdram_clk = cd_sdram_clk = ClockDomain("sdram_clk")
+
+        m.submodules.ecp5pll = pll = ECP5PLL(dynamic_phase=True)
+        pll.register_clkin(clk_in,  platform.default_clk_frequency)
+        pll.create_clkout(cd_sdram, sdram_freq)
+        pll.create_clkout(cd_sdram_clk, sdram_freq, phase=180)
+
+        platform.add_clock_constraint(cd_sdram.clk, sdram_freq)
+
+        # Power-on reset, used to setup SDRAM as using pll.locked does not work
+        reset_cnt = Signal(5, reset=0)
+        with m.If(~reset_cnt.all()):
+            m.d.sdram += reset_cnt.eq(reset_cnt+1)
+
+        # Add the SDRAM controller
+        m.submodules.mem = mem = sdram_controller(clk_freq=sdram_freq)
+        m.d.comb += mem.init.eq(reset_cnt == 0) # Initialize SDRAM
+
+        # Phase calibration of the sdram_clk output, then the self test
+        m.submodules.cal = cal = PhaseCalibration(mem, pll.phase_steps(1))
+        m.submodules.bist = bist = SdramBist(cal)
+        m.submodules.report = report = BistReport(bist)
+
+        m.d.comb += [
+            pll.phase_sel.eq(pll.phase_sel_of(1)),
+            pll.phase_step.eq(cal.o_phase_step),
+        ]
+
+        divisor = int(sdram_freq // 115200)
+        m.submodules.serial = serial = DomainRenamer("sdram")(AsyncSerial(divisor=divisor, pins=uart))
+
+        m.d.comb += [
+            serial.tx.data.eq(report.o_data),
+            serial.tx.ack.eq(report.o_valid),
+            report.i_ready.eq(serial.tx.rdy),
+        ]
+
+        m.d.comb += leds.eq(Cat([bist.o_errors != 0, C(0,1), cal.o_window != 0, ~cal.o_done]))
+
+        return m
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    parser.add_argument("--freq", type=float, default=100, help="sdram clock, MHz")
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+
+    platform.build(Top(args.freq * 1e6), do_program=True, nextpnr_opts="--timing-allow-fail")
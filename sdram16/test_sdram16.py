@@ -7,6 +7,67 @@ from ulx4m import *
 from ecp5pll import ECP5PLL
 from sdram_controller16 import sdram_controller
 
+# RAM test, writes the low 16 bits of the address to every word, then reads
+# them all back with bursts, of a whole page with burst_length "page".
+# Without interleave a page is 256 words at the address and 256 at the
+# address + 8M, so pages are read a word at a time. Requests go to the
+# controller every sdram clock it takes them.
+class RamTest(Elaboratable):
+    def __init__(self, mem, bits=24):
+        self.mem = mem
+        self.bits = bits
+
+        self.read   = Signal() # Set for read back phase
+        self.err    = Signal() # Set when error is detected
+        self.passed = Signal() # Set if test passed
+
+    def elaborate(self, platform):
+        m = Module()
+
+        mem = self.mem
+        if mem.burst_length == "page":
+            burst = mem.interleave
+            step = 512 if burst else 1
+        else:
+            burst = True
+            step = mem.burst_length
+
+        addr  = Signal(self.bits) # word address of the request
+        check = Signal(self.bits) # word address of the read data
+        done  = Signal()          # All reads requested
+
+        m.d.comb += [
+            mem.address.eq(addr),
+            mem.req_write.eq(~self.read),
+            mem.req_read.eq(self.read & ~done),
+            mem.burst.eq(self.read & burst), # Each read returns step words
+            mem.data_in.eq(addr[:16]) # Write least significant 16 bits of address
+        ]
+
+        # Next address when the request is taken
+        with m.If(mem.req_ready & (mem.req_write | mem.req_read)):
+            m.d.sdram += addr.eq(addr + Mux(self.read, step, 1))
+
+            with m.If(~self.read & addr.all()):
+                # Switch to read when all data is written
+                m.d.sdram += self.read.eq(1)
+
+            with m.If(self.read & (addr >= (1 << self.bits) - step)):
+                m.d.sdram += done.eq(1)
+
+        # Check each word read, set the passed flag when all data has been
+        # read without an error
+        with m.If(mem.data_valid):
+            m.d.sdram += check.eq(check + 1)
+
+            with m.If(mem.data_out != check[:16]):
+                m.d.sdram += self.err.eq(1)
+
+            with m.If(check.all() & ~self.err & (mem.data_out == check[:16])):
+                m.d.sdram += self.passed.eq(1)
+
+        return m
+
 # Test of 16-bit SDRAM controller
 class Top(Elaboratable):
     def elaborate(self, platform):
@@ -28,70 +89,21 @@ class Top(Elaboratable):
         pll.create_clkout(cd_sdram, sdram_freq)
         pll.create_clkout(cd_sdram_clk, sdram_freq, phase=180)
 
-        # Divide clock by 8
-        div = Signal(3)
-        m.d.sdram += div.eq(div+1)
-
-        # Make sync domain 8MHz
-        m.domains.sync = cd_sync = ClockDomain("sync")
-        m.d.comb += ClockSignal().eq(div[2])
-
         # Power-on reset, used to setup SDRAM as using pll.locked does not work
         reset_cnt = Signal(5, reset=0)
         with m.If(~reset_cnt.all()):
-            m.d.sync += reset_cnt.eq(reset_cnt+1)
+            m.d.sdram += reset_cnt.eq(reset_cnt+1)
 
         # Add the SDRAM controller
         m.submodules.mem = mem = sdram_controller()
+        m.d.comb += mem.init.eq(reset_cnt == 0) # Initialize SDRAM
 
-        # RAM test
-        addr   = Signal(24, reset=0) # word address
-        count  = Signal(5,  reset=0) # width control speed of read back
-        we     = Signal(1,  reset=0) # request write
-        oe     = Signal(1,  reset=0) # request read
-        read   = Signal(1,  reset=0) # Set for read back phase
-        err    = Signal(1,  reset=0) # Set when error is detected
-        passed = Signal(1,  reset=0) # Set if test passed
-
-        m.d.comb += [
-            mem.init.eq(reset_cnt == 0), # Initialize SDRAM
-            mem.sync.eq(div[2]),         # Sync with sync domain clock
-            mem.address.eq(addr),
-            mem.req_read.eq(oe),
-            mem.req_write.eq(we),
-            mem.data_in.eq(addr[:16])    # Write least significant 16 bits of address
-        ]
-
-        # Set the error flag if read gives the wrong value
-        with m.If((count > 0) & read & (mem.data_out != addr[:16])):
-            m.d.sync += err.eq(1)
-
-        # Increment count and do transfer when count is 0
-        m.d.sync += [
-            count.eq(count+1),
-            we.eq((count == 0) & ~read),
-            oe.eq((count == 0) & read)
-        ]
-
-        # Increment address every other cycle for write or when
-        # count is exhausted for reads
-        with m.If(reset_cnt.all() & ((~read & (count == 1)) | count.all())):
-            with m.If(~read & (count == 1)):
-                m.d.sync += count.eq(0)
-
-            m.d.sync += addr.eq(addr+1)
-
-            with m.If(addr.all()):
-                # Switch to read when all data is written
-                m.d.sync += read.eq(1)
-
-                # Set passed flag when all data has been read without an error
-                with m.If(read & ~err):
-                    m.d.sync += passed.eq(1)
+        # RAM test of all 16M words
+        m.submodules.test = test = RamTest(mem)
 
         # Show flags on the leds
         # Blue led on during write phase, green led means passed, red means error
-        m.d.comb += leds.eq(Cat([err, C(0,1), passed, ~read]))
+        m.d.comb += leds.eq(Cat([test.err, C(0,1), test.passed, ~test.read]))
 
         return m
 
@@ -0,0 +1,83 @@
+import argparse
+
+from amaranth import *
+from amaranth.build import *
+from amaranth_stdio.serial import AsyncSerial
+from ulx4m import *
+
+from ecp5pll import ECP5PLL
+from sdram_controller16 import sdram_controller
+from sdram_bist import SdramBist, BistReport, TESTS
+
+# SDRAM built-in self test of all 16M words, reported on the UART at
+# 115200 baud, a line for each error and each pass, see BistReport.
+# The leds show the test running, and red for errors.
+class Top(Elaboratable):
+    def __init__(self, tests=None):
+        self.tests = tests
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Get pins
+        led = [platform.request("led",count) for count in range(4)]
+        leds = Cat([i.o for i in led])
+        clk_in = platform.request(platform.default_clk, dir='-')[0]
+        uart = platform.request("uart")
+
+        # Clock generation
+        # PLL - 100MHz for sdram
+        sdram_freq = 100000000
+        m.domains.sdram = cd_sdram = ClockDomain("sdram")
+        m.domains.sdram_clk = cd_sdram_clk = ClockDomain("sdram_clk")
+
+        m.submodules.ecp5pll = pll = ECP5PLL()
+        pll.register_clkin(clk_in,  platform.default_clk_frequency)
+        pll.create_clkout(cd_sdram, sdram_freq)
+        pll.create_clkout(cd_sdram_clk, sdram_freq, phase=180)
+
+        platform.add_clock_constraint(cd_sdram.clk, sdram_freq)
+
+        # Power-on reset, used to setup SDRAM as using pll.locked does not work
+        reset_cnt = Signal(5, reset=0)
+        with m.If(~reset_cnt.all()):
+            m.d.sdram += reset_cnt.eq(reset_cnt+1)
+
+        # Add the SDRAM controller
+        m.submodules.mem = mem = sdram_controller()
+        m.d.comb += mem.init.eq(reset_cnt == 0) # Initialize SDRAM
+
+        # Self test, and its report on the uart
+        m.submodules.bist = bist = SdramBist(mem, tests=self.tests)
+        m.submodules.report = report = BistReport(bist)
+
+        divisor = int(sdram_freq // 115200)
+        m.submodules.serial = serial = DomainRenamer("sdram")(AsyncSerial(divisor=divisor, pins=uart))
+
+        m.d.comb += [
+            serial.tx.data.eq(report.o_data),
+            serial.tx.ack.eq(report.o_valid),
+            report.i_ready.eq(serial.tx.rdy),
+        ]
+
+        # Show the test on the blue and green leds, red for errors
+        m.d.comb += leds.eq(Cat([bist.o_errors != 0, C(0,1), bist.o_test[:2]]))
+
+        return m
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    parser.add_argument("--tests", nargs="+", choices=list(TESTS), default=None, help="default all")
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+
+    platform.build(Top(args.tests), do_program=True)
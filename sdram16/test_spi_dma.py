@@ -0,0 +1,100 @@
+import argparse
+
+from amaranth import *
+from amaranth.build import *
+from ulx4m import *
+
+from ecp5pll import ECP5PLL
+from sdram_controller16 import sdram_controller
+from sdram_arbiter import SdramArbiter
+from spi_dma import SpiSdramDma
+
+# Spi pins from ESP32 re-use two of the sd card pins
+esp32_spi = [
+    Resource("esp32_spi", 0,
+        Subsignal("irq", Pins("L2", dir="o")),
+        Subsignal("csn", Pins("N4", dir="i")),
+        Subsignal("copi", Pins("H1", dir="i")),
+        Subsignal("cipo", Pins("K1", dir="o")),
+        Subsignal("sclk", Pins("L1", dir="i")),
+        Attrs(PULLMODE="NONE", DRIVE="4", IO_TYPE="LVCMOS33"))
+]
+
+# Test of the SPI to SDRAM DMA: load files into the SDRAM from the ESP32
+# with esp32/ld_sdram.py, and check them with its CRC and verify commands.
+# The DMA, the arbiter and the controller all run at the sdram clock.
+class Top(Elaboratable):
+    def elaborate(self, platform):
+        m = Module()
+
+        # Get pins
+        led = [platform.request("led",count) for count in range(4)]
+        leds = Cat([i.o for i in led])
+        clk_in = platform.request(platform.default_clk, dir='-')[0]
+        esp32 = platform.request("esp32_spi")
+
+        # Clock generation
+        # PLL - 100MHz for sdram
+        sdram_freq = 100000000
+        m.domains.sdram = cd_sdram = ClockDomain("sdram")
+        m.domains.sdram_clk = cd_sdram_clk = ClockDomain("sdram_clk")
+
+        m.submodules.ecp5pll = pll = ECP5PLL()
+        pll.register_clkin(clk_in,  platform.default_clk_frequency)
+        pll.create_clkout(cd_sdram, sdram_freq)
+        pll.create_clkout(cd_sdram_clk, sdram_freq, phase=180)
+
+        platform.add_clock_constraint(cd_sdram.clk, sdram_freq)
+
+        # Power-on reset, used to setup SDRAM as using pll.locked does not work
+        reset_cnt = Signal(5, reset=0)
+        with m.If(~reset_cnt.all()):
+            m.d.sdram += reset_cnt.eq(reset_cnt+1)
+
+        # Add the SDRAM controller, and the arbiter and DMA in the sdram domain
+        m.submodules.mem = mem = sdram_controller()
+        arbiter = SdramArbiter(["sync"])
+        m.submodules.arbiter = DomainRenamer({"sync": "sdram"})(arbiter)
+        dma = SpiSdramDma(arbiter.ports[0])
+        m.submodules.dma = DomainRenamer({"sync": "sdram"})(dma)
+
+        m.d.comb += [
+            mem.init.eq(reset_cnt == 0), # Initialize SDRAM
+            mem.address.eq(arbiter.o_addr),
+            mem.req_read.eq(arbiter.o_req_read & reset_cnt.all()),
+            mem.req_write.eq(arbiter.o_req_write & reset_cnt.all()),
+            mem.burst.eq(arbiter.o_burst),
+            mem.data_in.eq(arbiter.o_data),
+            mem.ds.eq(arbiter.o_ds),
+            arbiter.i_req_ready.eq(mem.req_ready & reset_cnt.all()),
+            arbiter.i_data_burst.eq(mem.data_out_burst),
+            arbiter.i_data_burst_valid.eq(mem.data_burst_valid),
+            # SPI from the ESP32
+            dma.csn.eq(~esp32.csn),
+            dma.sclk.eq(esp32.sclk),
+            dma.copi.eq(esp32.copi),
+            esp32.cipo.eq(dma.cipo),
+            esp32.irq.eq(0),
+        ]
+
+        # Show the DMA busy and the SPI activity on the leds
+        m.d.comb += leds.eq(Cat([dma.o_busy, esp32.csn, C(0,2)]))
+
+        return m
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+    platform.add_resources(esp32_spi)
+
+    platform.build(Top(), do_program=True)
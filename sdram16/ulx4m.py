@@ -65,7 +65,13 @@ class _ULX4MPlatform(LatticeECP5Platform):
             ba="L18 M20", a="L19 L20 M19 H17 F20 F18 E19 F19 E20 C20 N19 D20 E18",
             dq="U20 T20 U19 T19 T18 T17 R20 P19 H20 J19 K18 J18 H18 J16 K19 J17",
             attrs=Attrs(PULLMODE="NONE", DRIVE="4", SLEWRATE="FAST", IO_TYPE="LVCMOS33")
-        )
+        ),
+
+        # GPDI
+        Resource("gpdi",     0, DiffPairs("F17", "G18"), Attrs(IO_TYPE="LVCMOS33D", DRIVE="4")),
+        Resource("gpdi",     1, DiffPairs("D18", "E17"), Attrs(IO_TYPE="LVCMOS33D", DRIVE="4")),
+        Resource("gpdi",     2, DiffPairs("C18", "D17"), Attrs(IO_TYPE="LVCMOS33D", DRIVE="4")),
+        Resource("gpdi",     3, DiffPairs("J20", "K20"), Attrs(IO_TYPE="LVCMOS33D", DRIVE="4")),
     ]
 
     connectors = [
@@ -0,0 +1,54 @@
+from amaranth import *
+
+# Tracker of the rectangle of a framebuffer written since the last update,
+# on the write port of the framebuffer.
+#
+# Every write with i_wr at (i_x, i_y) grows the rectangle from (o_x0, o_y0)
+# to (o_x1, o_y1), and sets o_valid. The rectangle is taken with i_ready,
+# as by the window mode of ST7789, and starts again empty, or with a write
+# made as it is taken, so no write is missed. Writes to pixels already sent
+# are in the next rectangle.
+class DirtyRect(Elaboratable):
+    def __init__(self, x_bits, y_bits):
+        # Write port of the framebuffer
+        self.i_x     = Signal(x_bits)
+        self.i_y     = Signal(y_bits)
+        self.i_wr    = Signal()
+        # Rectangle to update
+        self.o_valid = Signal()
+        self.i_ready = Signal()
+        self.o_x0    = Signal(x_bits)
+        self.o_y0    = Signal(y_bits)
+        self.o_x1    = Signal(x_bits)
+        self.o_y1    = Signal(y_bits)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        start = Signal() # The first write of a rectangle
+
+        m.d.comb += start.eq(~self.o_valid | self.i_ready)
+
+        with m.If(self.i_ready):
+            m.d.sync += self.o_valid.eq(self.i_wr)
+
+        with m.If(self.i_wr):
+            m.d.sync += self.o_valid.eq(1)
+            with m.If(start):
+                m.d.sync += [
+                    self.o_x0.eq(self.i_x),
+                    self.o_y0.eq(self.i_y),
+                    self.o_x1.eq(self.i_x),
+                    self.o_y1.eq(self.i_y)
+                ]
+            with m.Else():
+                with m.If(self.i_x < self.o_x0):
+                    m.d.sync += self.o_x0.eq(self.i_x)
+                with m.If(self.i_x > self.o_x1):
+                    m.d.sync += self.o_x1.eq(self.i_x)
+                with m.If(self.i_y < self.o_y0):
+                    m.d.sync += self.o_y0.eq(self.i_y)
+                with m.If(self.i_y > self.o_y1):
+                    m.d.sync += self.o_y1.eq(self.i_y)
+
+        return m
@@ -1,7 +1,24 @@
 from amaranth import *
 
-from readhex import *
+from init_seq import InitSequence
+from st7789_init import *
 
+# ST7789 240x240 LCD driver. After the init sequence, init_seq, compiled by
+# InitSequence, by default st7789_init_seq(), pixels
+# are sent one after another for the whole panel, the colour of each one
+# asked for with x and y, next_pixel set when they change.
+#
+# The SPI clock is the sync clock divided by clk_div, 2 or more, and the
+# bytes are sent back to back. The colour is RGB565, or RGB444, three bytes
+# for two pixels, if the init sequence sets 12-bit colour with COLMOD, as
+# st7789_init_seq(0x53) does. So at 125MHz with clk_div 2, 62.5MHz SPI, there
+# are 67 frames a second in RGB565 and 90 in RGB444.
+#
+# With window set, only rectangles, such as those of DirtyRect, are sent:
+# when i_rect_valid is set, the rectangle from (i_x0, i_y0) to (i_x1, i_y1)
+# is taken with o_rect_ready, CASET and RASET set the window of the panel,
+# and after RAMWR its pixels are asked for with x and y as before. The rows
+# of the panel memory shown start at y_offset.
 class ST7789(Elaboratable):
     COLOR_BITS   = 16
     X_SIZE       = 240
@@ -11,9 +28,10 @@ class ST7789(Elaboratable):
     CLK_PHASE    = 0
     CLK_POLARITY = 1
     NOP          = 0
-    INIT_FILE    = "st7789_linit.mem"
 
-    def __init__(self, reset_delay):
+    def __init__(self, reset_delay, window=False, y_offset=80, clk_div=2,
+                 clk_freq=None, init_seq=None):
+        assert clk_div >= 2
         self.color          = Signal(self.COLOR_BITS)
         self.x              = Signal(self.X_BITS)
         self.y              = Signal(self.Y_BITS)
@@ -24,6 +42,20 @@ class ST7789(Elaboratable):
         self.spi_dc         = Signal()
         self.spi_resn       = Signal()
         self.reset_delay    = reset_delay
+        self.clk_div        = clk_div
+        self.clk_freq       = clk_freq
+        self.init_seq       = init_seq or st7789_init_seq()
+        self.rgb444         = any(cmd in (ST7789_INIT.COLMOD, ST7789_INIT.COLMOD.value) and
+                                  args[0] & 0x07 == 0b011 for cmd, args, _ in self.init_seq)
+        # Window mode
+        self.window         = window
+        self.y_offset       = y_offset
+        self.i_rect_valid   = Signal()
+        self.o_rect_ready   = Signal()
+        self.i_x0           = Signal(self.X_BITS)
+        self.i_y0           = Signal(self.Y_BITS)
+        self.i_x1           = Signal(self.X_BITS)
+        self.i_y1           = Signal(self.Y_BITS)
 
     # Used for simulation
     def ports(self):
@@ -33,109 +65,209 @@ class ST7789(Elaboratable):
     def elaborate(self, platform):
         m = Module()
 
-        clk_mhz = int(platform.default_clk_frequency / 1000000)
+        clk_freq = self.clk_freq or platform.default_clk_frequency
+        clk_mhz = int(clk_freq / 1000000)
 
-        index        = Signal(11, reset = 0)
+        seq = InitSequence(self.init_seq, st7789_init_args, clk_freq)
+        oled_init = Memory(width=10, depth=len(seq.rom), init = seq.rom)
+        delays = Array(C(d) for d in seq.delays or [0])
+        delay_bits = max(self.reset_delay * clk_mhz, seq.max_delay()).bit_length() + 1
+
+        div_cnt      = Signal(range(self.clk_div))
+        bit          = Signal(3)
+        rom_addr     = Signal(range(len(seq.rom) + 1))
+        delay_index  = Signal(range(len(seq.delays) + 1))
         data         = Signal(8,  reset = self.NOP)
         dc           = Signal(1,  reset = 1)
-        byte_toggle  = Signal(1,  reset = 0)
         init         = Signal(1,  reset = 1)
-        num_args     = Signal(5,  reset = 0)
-        delay_cnt    = Signal(28, reset = self.reset_delay * clk_mhz)
-        arg          = Signal(6,  reset = 1)
+        delay_cnt    = Signal(delay_bits, reset = self.reset_delay * clk_mhz)
         delay_set    = Signal(1,  reset = 0)
-        last_cmd     = Signal(8,  reset = 0)
         resn         = Signal(1,  reset = 0)
         clken        = Signal(1,  reset = 0)
-        next_byte    = Signal(8)
+        next_word    = Signal(10)
+        byte_start   = Signal()
+        clk_low      = Signal()
+
+        # Pixels, in two bytes, or two pixels in three bytes with RGB444
+        slot         = Signal(2)
+        blue         = Signal(4)
+        pad          = Signal()
+        last_pixel   = Signal()
+        r4           = self.color[12:16]
+        g4           = self.color[7:11]
+        b4           = self.color[1:5]
+
+        # Window of a rectangle, and the commands that set it
+        x0           = Signal(self.X_BITS)
+        y0           = Signal(self.Y_BITS)
+        x1           = Signal(self.X_BITS)
+        y1           = Signal(self.Y_BITS)
+        row0         = Signal(16)
+        row1         = Signal(16)
+        header       = Signal(4)
+
+        m.d.comb += [
+            row0.eq(y0 + self.y_offset),
+            row1.eq(y1 + self.y_offset),
+            last_pixel.eq((self.x == x1) & (self.y == y1))
+        ]
+
+        header_bytes = Array([C(0x2A, 8), C(0, 8), x0, C(0, 8), x1,
+                              C(0x2B, 8), row0[8:], row0[:8], row1[8:], row1[:8],
+                              C(0x2C, 8)])
+        header_cmd   = Array([C(c, 1) for c in (1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1)])
 
-        init_data = readhex(self.INIT_FILE)
-        oled_init = Memory(width=8, depth=len(init_data), init = init_data)
-        
         m.d.comb += [
              self.spi_resn.eq(resn),
              self.spi_csn.eq(~clken),
              self.spi_dc.eq(dc),
-             self.spi_clk.eq(((index[0] ^ ~self.CLK_PHASE) | ~clken) ^ ~self.CLK_POLARITY),
+             self.spi_clk.eq(((clk_low ^ ~self.CLK_PHASE) | ~clken) ^ ~self.CLK_POLARITY),
              self.spi_mosi.eq(data[7]),
-             next_byte.eq(oled_init[index[4:]])
+             next_word.eq(oled_init[rom_addr]),
+             byte_start.eq((div_cnt == 0) & (bit == 0)),
+             # Data changes as the clock goes low, and is read as it goes high
+             clk_low.eq((div_cnt != 0) & (div_cnt <= self.clk_div // 2))
         ]
 
+        # Next pixel, back to the start of the rectangle after the last one
+        def advance():
+            m.d.sync += self.next_pixel.eq(1)
+            with m.If(self.x == x1):
+                m.d.sync += self.x.eq(x0)
+                with m.If(self.y == y1):
+                    m.d.sync += self.y.eq(y0)
+                with m.Else():
+                    m.d.sync += self.y.eq(self.y + 1)
+            with m.Else():
+                m.d.sync += self.x.eq(self.x + 1)
+
+        # The end of the rectangle, or of the frame, which starts again
+        def end():
+            if self.window:
+                m.next = "IDLE"
+
         with m.If(delay_cnt[-1] == 0): # Delay
             m.d.sync += [
                 delay_cnt.eq(delay_cnt - 1),
                 resn.eq(1)
             ]
-        with m.Elif(index[4:] != len(init_data)):
-            m.d.sync += index.eq(index+1)
-            with m.If(index[0:4] == 0): # Start of byte
-                with m.If(init): # Still initialization
+        with m.Else():
+            m.d.sync += [
+                div_cnt.eq(div_cnt + 1),
+                self.next_pixel.eq(0)
+            ]
+            with m.If(div_cnt == self.clk_div - 1):
+                m.d.sync += [
+                    div_cnt.eq(0),
+                    bit.eq(bit + 1)
+                ]
+            with m.If(byte_start): # Start of byte
+                with m.If(init & delay_set): # Delay after the last byte
                     m.d.sync += [
-                        dc.eq(0),
-                        arg.eq(arg + 1)
+                        delay_cnt.eq(delays[delay_index]),
+                        delay_index.eq(delay_index + 1),
+                        delay_set.eq(0),
+                        data.eq(self.NOP),
+                        clken.eq(0)
                     ]
-                    with m.If(arg == 0):
-                        m.d.sync += [
-                            data.eq(self.NOP),
-                            clken.eq(0),
-                            last_cmd.eq(next_byte)
-                        ]
-                    with m.Elif(arg == 1):
-                        m.d.sync += [
-                            num_args.eq(next_byte[0:5]),
-                            delay_set.eq(next_byte[7]),
-                            data.eq(last_cmd),
-                            clken.eq(1)
-                        ]
-                        with m.If(next_byte == 0):
-                            m.d.sync += arg.eq(0)
-                    with m.Elif(arg <= num_args + 1):
-                        m.d.sync += [
-                            data.eq(next_byte),
-                            clken.eq(1),
-                            dc.eq(1)
-                        ]
-                        with m.If((arg == num_args + 1) & ~delay_set):
-                            m.d.sync += arg.eq(0)
-                    with m.Elif(delay_set):
-                        m.d.sync += [
-                            delay_cnt.eq(clk_mhz << next_byte[0:5]), # 2^n us delay
-                            data.eq(self.NOP),
-                            clken.eq(0),
-                            delay_set.eq(0),
-                            arg.eq(0)
-                        ]
-                with m.Else(): # Send pixels and set x, y and next_pixel
+                with m.Elif(init & (rom_addr == len(seq.rom))): # Initialization done
                     m.d.sync += [
-                        dc.eq(1),
-                        byte_toggle.eq(~byte_toggle),
-                        clken.eq(1),
-                        index[4:].eq(0)
+                        init.eq(0),
+                        data.eq(self.NOP),
+                        clken.eq(0)
                     ]
-                    with m.If(byte_toggle):
-                        m.d.sync += [
-                            data.eq(self.color[0:8]),
-                            self.next_pixel.eq(1)
-                        ]
-                        with m.If(self.x == self.X_SIZE - 1):
-                            m.d.sync += self.x.eq(0)
-                            with m.If(self.y == self.Y_SIZE -1):
-                                m.d.sync += self.y.eq(0)
-                            with m.Else():
-                               m.d.sync += self.y.eq(self.y + 1)
-                        with m.Else():
-                            m.d.sync += self.x.eq(self.x + 1)
-                    with m.Else():
-                        m.d.sync += data.eq(self.color[8:])
-            with m.Else(): # Shift out byte
-                m.d.sync += self.next_pixel.eq(0)
-                with m.If(index[0] == 0):
-                    m.d.sync += data.eq(Cat(0b0,data[0:7]))
-        with m.Else(): # Initialization done, start sending pixels
-            m.d.sync += [
-                init.eq(0),
-                index[4:].eq(0)
-            ]        
-        
-        return m
+                with m.Elif(init): # Still initialization
+                    m.d.sync += [
+                        rom_addr.eq(rom_addr + 1),
+                        data.eq(next_word[0:8]),
+                        dc.eq(next_word[8]),
+                        delay_set.eq(next_word[9]),
+                        clken.eq(1)
+                    ]
+                with m.Else(): # Send pixels and set x, y and next_pixel
+                    with m.FSM():
+                        with m.State("IDLE"):
+                            m.d.sync += [
+                                data.eq(self.NOP),
+                                clken.eq(0),
+                                slot.eq(0),
+                                pad.eq(0)
+                            ]
+                            if self.window:
+                                with m.If(self.i_rect_valid):
+                                    m.d.comb += self.o_rect_ready.eq(1)
+                                    m.d.sync += [
+                                        x0.eq(self.i_x0),
+                                        y0.eq(self.i_y0),
+                                        x1.eq(self.i_x1),
+                                        y1.eq(self.i_y1),
+                                        header.eq(0)
+                                    ]
+                                    m.next = "HEADER"
+                            else: # The whole panel, as set by the init sequence
+                                m.d.sync += [
+                                    x0.eq(0),
+                                    y0.eq(0),
+                                    x1.eq(self.X_SIZE - 1),
+                                    y1.eq(self.Y_SIZE - 1),
+                                    self.x.eq(0),
+                                    self.y.eq(0)
+                                ]
+                                m.next = "PIXELS"
+                        with m.State("HEADER"): # CASET, RASET and RAMWR
+                            m.d.sync += [
+                                data.eq(header_bytes[header]),
+                                dc.eq(~header_cmd[header]),
+                                clken.eq(1),
+                                header.eq(header + 1),
+                                self.x.eq(x0),
+                                self.y.eq(y0)
+                            ]
+                            with m.If(header == len(header_bytes) - 1):
+                                m.next = "PIXELS"
+                        with m.State("PIXELS"):
+                            m.d.sync += [
+                                dc.eq(1),
+                                clken.eq(1),
+                                slot.eq(slot + 1)
+                            ]
+                            if self.rgb444:
+                                with m.Switch(slot):
+                                    with m.Case(0): # R and G of the first pixel
+                                        m.d.sync += [
+                                            data.eq(Cat(g4, r4)),
+                                            blue.eq(b4),
+                                            pad.eq(last_pixel)
+                                        ]
+                                        advance()
+                                    with m.Case(1): # B of the first, R of the second
+                                        m.d.sync += data.eq(Cat(Mux(pad, 0, r4), blue))
+                                        with m.If(pad): # No second pixel
+                                            m.d.sync += [
+                                                slot.eq(0),
+                                                pad.eq(0)
+                                            ]
+                                            end()
+                                    with m.Default(): # G and B of the second
+                                        m.d.sync += [
+                                            data.eq(Cat(b4, g4)),
+                                            slot.eq(0)
+                                        ]
+                                        advance()
+                                        with m.If(last_pixel):
+                                            end()
+                            else:
+                                with m.If(slot == 0):
+                                    m.d.sync += data.eq(self.color[8:])
+                                with m.Else():
+                                    m.d.sync += [
+                                        data.eq(self.color[0:8]),
+                                        slot.eq(0)
+                                    ]
+                                    advance()
+                                    with m.If(last_pixel):
+                                        end()
+            with m.Elif(div_cnt == 0): # Shift out byte
+                m.d.sync += data.eq(Cat(0b0,data[0:7]))
 
+        return m
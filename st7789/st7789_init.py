@@ -0,0 +1,53 @@
+from enum import Enum
+
+
+class ST7789_INIT(Enum):
+    NOP = 0x00
+    SWRESET = 0x01
+    SLPOUT = 0x11
+    NORON = 0x13
+    INVON = 0x21
+    DISPON = 0x29
+    CASET = 0x2A
+    RASET = 0x2B
+    RAMWR = 0x2C
+    MADCTL = 0x36
+    COLMOD = 0x3A
+
+
+# Arguments of each command
+st7789_init_args = {
+    ST7789_INIT.NOP: 0,
+    ST7789_INIT.SWRESET: 0,
+    ST7789_INIT.SLPOUT: 0,
+    ST7789_INIT.NORON: 0,
+    ST7789_INIT.INVON: 0,
+    ST7789_INIT.DISPON: 0,
+    ST7789_INIT.CASET: 4,
+    ST7789_INIT.RASET: 4,
+    ST7789_INIT.RAMWR: 0,
+    ST7789_INIT.MADCTL: 1,
+    ST7789_INIT.COLMOD: 1,
+}
+
+
+# Init lcd_video (display mounted pins down), image normal (no flip), with
+# the colour format of COLMOD, 0x55 for 16-bit and 0x53 for 12-bit colour.
+# The window is width by height, from row y_offset of the panel memory.
+def st7789_init_seq(colmod=0x55, width=240, height=240, y_offset=80):
+    x1 = width - 1
+    y0 = y_offset
+    y1 = y_offset + height - 1
+    return [
+        (ST7789_INIT.NOP, [], 8192),   # After reset
+        (ST7789_INIT.SWRESET, [], 131072),
+        (ST7789_INIT.SLPOUT, [], 16384),
+        (ST7789_INIT.COLMOD, [colmod], 16384),
+        (ST7789_INIT.MADCTL, [0xC0], 0),
+        (ST7789_INIT.CASET, [0x00, 0x00, x1 >> 8, x1 & 0xFF], 0), # X start, end MSB,LSB
+        (ST7789_INIT.RASET, [y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF], 0), # Y start, end MSB,LSB
+        (ST7789_INIT.INVON, [], 16384),
+        (ST7789_INIT.NORON, [], 16384),
+        (ST7789_INIT.DISPON, [], 16384),
+        (ST7789_INIT.RAMWR, [], 0),
+    ]
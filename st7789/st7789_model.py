@@ -0,0 +1,209 @@
+# Simulation model of an ST7789 LCD panel, for the Amaranth python
+# simulator.
+#
+# It decodes the SPI stream of the ST7789 driver every clock: the bits are
+# taken on the rising edge of spi_clk with spi_csn low, and each byte is a
+# command with spi_dc low, or an argument or pixel data with it high. The
+# panel memory, of 240 columns and 320 rows, is an RGB888 NumPy array.
+# RAMWR writes the pixels in the window of CASET and RASET, in the colour
+# format of COLMOD: 16-bit RGB565, 12-bit RGB444, two pixels in three
+# bytes, or 18-bit, a byte for each colour. A command ends the pixel data,
+# and the bits of an unfinished pixel are lost. MADCTL and INVON are kept
+# but not applied, so the memory holds the colours the driver sent.
+#
+# Each time the last pixel of the window is written, the clock and the
+# bytes sent so far are kept in frames, for the frame rate, see
+# clocks_per_frame() and bytes_per_pixel(), and the frame can be saved as
+# a PNG with write_png(). Protocol errors are in errors.
+#
+#   model = ST7789Model(st7789)
+#   sim.add_sync_process(model.process)
+
+import struct
+import zlib
+
+import numpy as np
+
+from amaranth.sim import Passive
+
+from st7789_init import ST7789_INIT, st7789_init_args
+
+ARG_COUNTS = {cmd.value: n for cmd, n in st7789_init_args.items()}
+
+COLUMNS = 240
+ROWS    = 320
+
+# Bits of each pixel of COLMOD
+PIXEL_BITS = {0b011: 12, 0b101: 16, 0b110: 18}
+
+
+def write_png(filename, image):
+    """Saves an RGB888 array of rows, columns and colours as a PNG"""
+    height, width, _ = image.shape
+    raw = b"".join(b"\x00" + image[y].astype(np.uint8).tobytes() for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + \
+               struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw)))
+        f.write(chunk(b"IEND", b""))
+
+
+class ST7789Model:
+    def __init__(self, st7789):
+        self.st7789 = st7789
+        self.ram = np.zeros((ROWS, COLUMNS, 3), dtype=np.uint8)
+        self.errors = []
+        self.commands = []  # (cycle, command, args)
+        self.frames = []    # (cycle, bytes) at the end of each window written
+        self.cycle = 0
+        self.bytes = 0      # Sent since the start
+        self.pixels = 0     # Written since the start
+        self.cmd = None
+        self.args = []
+        self.pos = None     # Column and row of the next pixel after RAMWR
+        self.bits = []      # Of the pixel being sent
+        self.reset()
+
+    # The registers after a reset
+    def reset(self):
+        self.colmod = 0x66  # After reset
+        self.madctl = 0
+        self.inverted = False
+        self.sleeping = True
+        self.display_on = False
+        self.caset = (0, COLUMNS - 1)
+        self.raset = (0, ROWS - 1)
+
+    def error(self, message):
+        self.errors.append("Cycle {}: {}".format(self.cycle, message))
+
+    @property
+    def pixel_bits(self):
+        return PIXEL_BITS.get(self.colmod & 0b111, 18)
+
+    def frame(self, y_offset=80, width=240, height=240):
+        """The part of the panel memory shown, as RGB888"""
+        return self.ram[y_offset:y_offset + height, :width]
+
+    def clocks_per_frame(self):
+        """Clocks between the ends of the last two frames"""
+        return self.frames[-1][0] - self.frames[-2][0]
+
+    def bytes_per_pixel(self):
+        """Bytes sent for each pixel of the last frame, with the commands"""
+        pixels = (self.caset[1] - self.caset[0] + 1) * (self.raset[1] - self.raset[0] + 1)
+        return (self.frames[-1][1] - self.frames[-2][1]) / pixels
+
+    # The end of the arguments of the last command
+    def end_command(self):
+        cmd, args = self.cmd, self.args
+        if cmd is None:
+            return
+        self.commands.append((self.cycle, cmd, args))
+        want = ARG_COUNTS.get(cmd)
+        if want is not None and len(args) != want:
+            self.error("Command {:#04x} with {} arguments, not {}".format(cmd, len(args), want))
+            return
+        if cmd == ST7789_INIT.SWRESET.value:
+            self.reset()
+        elif cmd == ST7789_INIT.SLPOUT.value:
+            self.sleeping = False
+        elif cmd == ST7789_INIT.DISPON.value:
+            self.display_on = True
+        elif cmd == ST7789_INIT.INVON.value:
+            self.inverted = True
+        elif cmd == ST7789_INIT.MADCTL.value:
+            self.madctl = args[0]
+        elif cmd == ST7789_INIT.COLMOD.value:
+            self.colmod = args[0]
+        elif cmd in (ST7789_INIT.CASET.value, ST7789_INIT.RASET.value):
+            start, end = (args[0] << 8) | args[1], (args[2] << 8) | args[3]
+            size = COLUMNS if cmd == ST7789_INIT.CASET.value else ROWS
+            if start > end or end >= size:
+                self.error("Window {} to {} of command {:#04x}".format(start, end, cmd))
+            elif cmd == ST7789_INIT.CASET.value:
+                self.caset = (start, end)
+            else:
+                self.raset = (start, end)
+
+    def command(self, cmd):
+        self.end_command()
+        self.cmd, self.args, self.bits, self.pos = cmd, [], [], None
+        if cmd == ST7789_INIT.RAMWR.value:
+            if self.sleeping:
+                self.error("RAMWR while sleeping")
+            self.pos = [self.caset[0], self.raset[0]]
+        elif cmd not in [c.value for c in ST7789_INIT]:
+            self.error("Unknown command {:#04x}".format(cmd))
+
+    def data(self, byte):
+        if self.cmd is None:
+            self.error("Data {:#04x} before a command".format(byte))
+        elif self.pos is None:
+            self.args.append(byte)
+        else:
+            self.pixel_data(byte)
+
+    def pixel_data(self, byte):
+        bits = self.pixel_bits
+        if bits == 12:
+            self.bits += [byte >> 4, byte & 0xf]
+            if len(self.bits) < 3:
+                return
+            r, g, b = (n * 0x11 for n in self.bits[:3])
+        elif bits == 16:
+            self.bits.append(byte)
+            if len(self.bits) < 2:
+                return
+            v = (self.bits[0] << 8) | self.bits[1]
+            r, g, b = v >> 11, (v >> 5) & 0x3f, v & 0x1f
+            r, g, b = (r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)
+        else:
+            self.bits.append(byte)
+            if len(self.bits) < 3:
+                return
+            r, g, b = ((n & 0xfc) | (n >> 6) for n in self.bits)
+        self.bits = self.bits[3:] if bits == 12 else []
+
+        x, y = self.pos
+        self.ram[y, x] = (r, g, b)
+        self.pixels += 1
+        x += 1
+        if x > self.caset[1]:
+            x = self.caset[0]
+            y += 1
+            if y > self.raset[1]:
+                y = self.raset[0]
+                self.frames.append((self.cycle, self.bytes))
+        self.pos = [x, y]
+
+    def process(self):
+        st7789 = self.st7789
+        last_clk = 1
+        byte = 0
+        count = 0
+        yield Passive()
+        while True:
+            yield
+            self.cycle += 1
+            clk = yield st7789.spi_clk
+            if (yield st7789.spi_csn):
+                byte = 0
+                count = 0
+            elif clk and not last_clk:
+                byte = (byte << 1) | (yield st7789.spi_mosi)
+                count += 1
+                if count == 8:
+                    self.bytes += 1
+                    if (yield st7789.spi_dc):
+                        self.data(byte)
+                    else:
+                        self.command(byte)
+                    byte = 0
+                    count = 0
+            last_clk = clk
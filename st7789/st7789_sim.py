@@ -1,18 +1,118 @@
-from nmigen import *
-from nmigen.sim import Simulator, Delay, Settle, Passive
+import argparse
+
+import numpy as np
+
+from amaranth import *
+from amaranth.sim import Simulator
+
 from st7789 import *
+from st7789_model import ST7789Model, write_png
+
+# Simulation of the ST7789 driver against the panel model, for each of its
+# configurations: the colour format set with COLMOD, the SPI clock divider
+# and the window mode, with a rectangle always ready.
+#
+# The frames decoded by the model must be the test pattern, and the clocks
+# of each frame those of its bytes, back to back. The frame rate on the
+# 240x240 panel, at freq, and the bytes per pixel, are reported. The panel
+# is size by size, for a short simulation, and the frame rate is scaled up.
+# The frames can be saved as PNGs.
+#
+#   python st7789_sim.py
+#   python st7789_sim.py --size 240 --png frame
+
+# Configurations: name, COLMOD, clk_div, window
+CONFIGS = [
+    ("rgb565_div2",   0x55, 2, None),
+    ("rgb444_div2",   0x53, 2, None),
+    ("rgb565_div4",   0x55, 4, None),
+    ("rgb444_window", 0x53, 2, (8, 4, 23, 19)),
+]
+
+
+# The pattern, blue from x, green from y and red from both
+def pattern(x, y):
+    return Cat(x[0:5], y[0:6], (x + y)[0:5])
+
+
+# The pattern as decoded by the model, in RGB888
+def expected(width, height, colmod):
+    x, y = np.meshgrid(np.arange(width), np.arange(height))
+    r, g, b = (x + y) & 0x1f, y & 0x3f, x & 0x1f
+    if colmod & 0b111 == 0b011:
+        return np.stack([(r >> 1) * 0x11, (g >> 2) * 0x11, (b >> 1) * 0x11], axis=-1)
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1)
+
+
+def simulate(size, freq, colmod, clk_div, window):
+    class Panel(ST7789): # The panel, size by size
+        X_SIZE = size
+        Y_SIZE = size
+
+    # No delays, the panel model needs none
+    seq = [(cmd, args, 0) for cmd, args, _ in st7789_init_seq(colmod, size, size)]
+    st7789 = Panel(1, window=window is not None, clk_div=clk_div, clk_freq=freq, init_seq=seq)
 
-if __name__ == "__main__":
     m = Module()
-    m.submodules.st7789 = st7789 = ST7789(1)
+    m.submodules.st7789 = st7789
+    m.d.comb += st7789.color.eq(pattern(st7789.x, st7789.y))
+    if window:
+        m.d.comb += [
+            st7789.i_rect_valid.eq(1),
+            st7789.i_x0.eq(window[0]),
+            st7789.i_y0.eq(window[1]),
+            st7789.i_x1.eq(window[2]),
+            st7789.i_y1.eq(window[3]),
+        ]
+
+    model = ST7789Model(st7789)
 
     sim = Simulator(m)
-    sim.add_clock(4e-8)
+    sim.add_clock(1 / freq)
+    sim.add_sync_process(model.process)
 
     def process():
-        yield st7789.color.eq(0xf800)
-        yield Passive()
+        while len(model.frames) < 3:
+            yield
+    sim.add_sync_process(process)
+    sim.run()
+
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=48, help="of the panel simulated")
+    parser.add_argument("--freq", type=float, default=125, help="sync clock, MHz")
+    parser.add_argument("--png", default=None, help="prefix of the PNGs of the frames")
+    args = parser.parse_args()
+
+    freq = args.freq * 1e6
+    size = args.size
+    failed = False
+    for name, colmod, clk_div, window in CONFIGS:
+        model = simulate(size, freq, colmod, clk_div, window)
+        frame = model.frame(width=size, height=size)
+        want = expected(size, size, colmod)
+        clocks = model.clocks_per_frame()
+        bpp = model.bytes_per_pixel()
+
+        if window:
+            x0, y0, x1, y1 = window
+            ok = (frame[y0:y1 + 1, x0:x1 + 1] == want[y0:y1 + 1, x0:x1 + 1]).all()
+            rate = "{:.0f} windows/s".format(freq / clocks)
+        else:
+            # Back to back bytes, and the frame rate of the whole panel
+            ok = (frame == want).all() and clocks == size * size * bpp * 8 * clk_div
+            rate = "{:.1f} fps".format(freq / (clocks * 240 * 240 / (size * size)))
+        ok = ok and not model.errors
+        failed |= not ok
+
+        print("{:14} {:8} clocks/frame {:.2f} bytes/pixel {:>16}: {}".format(
+            name, clocks, bpp, rate, "PASSED" if ok else "FAILED"))
+        for error in model.errors[:10]:
+            print(error)
+        if args.png:
+            write_png("{}_{}.png".format(args.png, name), frame)
 
-    sim.add_process(process)
-    with sim.write_vcd("test.vcd", "test.gtkw", traces=st7789.ports()):
-        sim.run_until(30e-6, run_passive=True)
+    print("FAILED" if failed else "PASSED")
@@ -5,6 +5,7 @@ from amaranth.build import *
 from ulx4m import *
 
 from  st7789 import *
+from ecp5pll import ECP5PLL
 
 # The OLED pins are not defined in the ULX3S platform in nmigen_boards.
 oled_resource = [
@@ -17,7 +18,15 @@ oled_resource = [
         Attrs(IO_TYPE="LVCMOS33", DRIVE="4", PULLMODE="UP"))
 ]
 
+# The sync clock is made by the PLL at freq, for a fast SPI clock, such as
+# 125MHz for 62.5MHz SPI, and the colour is RGB444 with rgb444.
+#
+#   python st7789_test.py 85F --freq 125 --rgb444
 class ST7789Test(Elaboratable):
+    def __init__(self, freq=25e6, rgb444=False):
+        self.freq = freq
+        self.rgb444 = rgb444
+
     def elaborate(self, platform):
         led = [platform.request("led", i) for i in range(4)]
 
@@ -29,8 +38,22 @@ class ST7789Test(Elaboratable):
         oled_resn = oled.oled_resn
         oled_csn  = oled.oled_csn
 
-        st7789 = ST7789(150000)
         m = Module()
+
+        # Clock generation
+        if self.freq != platform.default_clk_frequency:
+            clk_in = platform.request(platform.default_clk, dir='-')[0]
+
+            m.domains.sync = cd_sync = ClockDomain("sync")
+
+            m.submodules.ecp5pll = pll = ECP5PLL()
+            pll.register_clkin(clk_in,  platform.default_clk_frequency)
+            pll.create_clkout(cd_sync, self.freq)
+
+            platform.add_clock_constraint(cd_sync.clk, self.freq)
+
+        st7789 = ST7789(150000, clk_freq=self.freq,
+                        init_seq=st7789_init_seq(0x53 if self.rgb444 else 0x55))
         m.submodules.st7789 = st7789
        
         x = Signal(8)
@@ -70,6 +93,8 @@ if __name__ == "__main__":
     # Figure out which FPGA variant we want to target...
     parser = argparse.ArgumentParser()
     parser.add_argument('variant', choices=variants.keys())
+    parser.add_argument("--freq", type=float, default=25, help="sync clock, MHz")
+    parser.add_argument("--rgb444", action="store_true", help="12-bit colour")
     args = parser.parse_args()
 
     platform = variants[args.variant]()
@@ -78,4 +103,4 @@ if __name__ == "__main__":
     # can reference it below.
     platform.add_resources(oled_resource)
 
-    platform.build(ST7789Test(), do_program=True)
+    platform.build(ST7789Test(args.freq * 1e6, args.rgb444), do_program=True)
@@ -0,0 +1,157 @@
+import argparse
+
+from amaranth import *
+from amaranth.build import *
+from ulx4m import *
+
+from st7789 import *
+from dirty_rect import DirtyRect
+from rgb import rgb332_to_rgb565
+
+# The OLED pins are not defined in the ULX3S platform in nmigen_boards.
+oled_resource = [
+    Resource("st7789", 0,
+        Subsignal("oled_clk",  Pins("17", dir="o", conn=("gpio",0))),
+        Subsignal("oled_mosi", Pins("15", dir="o", conn=("gpio",0))),
+        Subsignal("oled_dc",   Pins("13", dir="o", conn=("gpio",0))),
+        Subsignal("oled_resn", Pins("14", dir="o", conn=("gpio",0))),
+        Subsignal("oled_csn",  Pins("12", dir="o", conn=("gpio",0))),
+        Attrs(IO_TYPE="LVCMOS33", DRIVE="4", PULLMODE="UP"))
+]
+
+# Window mode of the ST7789 driver: a square bounces round a framebuffer in
+# BRAM, RGB332, and only the rectangles written are sent to the panel, with
+# DirtyRect on the write port. The whole panel is sent once at the start.
+class ST7789WindowTest(Elaboratable):
+    SIZE = 16 # Of the square
+
+    def elaborate(self, platform):
+        led = [platform.request("led", i) for i in range(4)]
+
+        # OLED
+        oled      = platform.request("st7789")
+        oled_clk  = oled.oled_clk
+        oled_mosi = oled.oled_mosi
+        oled_dc   = oled.oled_dc
+        oled_resn = oled.oled_resn
+        oled_csn  = oled.oled_csn
+
+        st7789 = ST7789(150000, window=True)
+        m = Module()
+        m.submodules.st7789 = st7789
+        m.submodules.dirty = dirty = DirtyRect(st7789.X_BITS, st7789.Y_BITS)
+
+        m.d.comb += [
+            oled_clk .eq(st7789.spi_clk),
+            oled_mosi.eq(st7789.spi_mosi),
+            oled_dc  .eq(st7789.spi_dc),
+            oled_resn.eq(st7789.spi_resn),
+            oled_csn .eq(1),
+        ]
+
+        # Framebuffer
+        fb = Memory(width=8, depth=st7789.X_SIZE * st7789.Y_SIZE)
+        m.submodules.fb_r = fb_r = fb.read_port()
+        m.submodules.fb_w = fb_w = fb.write_port()
+
+        m.d.comb += [
+            fb_r.addr.eq(st7789.y * st7789.X_SIZE + st7789.x),
+            st7789.color.eq(rgb332_to_rgb565(fb_r.data)),
+            st7789.i_rect_valid.eq(dirty.o_valid),
+            st7789.i_x0.eq(dirty.o_x0),
+            st7789.i_y0.eq(dirty.o_y0),
+            st7789.i_x1.eq(dirty.o_x1),
+            st7789.i_y1.eq(dirty.o_y1),
+            dirty.i_ready.eq(st7789.o_rect_ready),
+        ]
+
+        # Square position and direction, moved every 10ms
+        sq_x   = Signal(8, reset=20)
+        sq_y   = Signal(8, reset=60)
+        dx     = Signal()
+        dy     = Signal()
+        timer  = Signal(range(int(platform.default_clk_frequency // 100)))
+
+        # Draw the box round the old and new squares, pixel by pixel
+        clear  = Signal(reset=1) # Clear the framebuffer first
+        draw   = Signal()
+        bx     = Signal(8)
+        by     = Signal(8)
+        box_x  = Signal(8)
+        box_y  = Signal(8)
+        inside = Signal()
+
+        m.d.comb += [
+            inside.eq((bx >= sq_x) & (bx < sq_x + self.SIZE) & (by >= sq_y) & (by < sq_y + self.SIZE)),
+            fb_w.addr.eq(by * st7789.X_SIZE + bx),
+            fb_w.data.eq(Mux(inside & ~clear, 0b11111100, 0b00000011)),
+            fb_w.en.eq(draw | clear),
+            dirty.i_x.eq(bx),
+            dirty.i_y.eq(by),
+            dirty.i_wr.eq(draw | clear),
+        ]
+
+        with m.If(clear):
+            m.d.sync += bx.eq(bx + 1)
+            with m.If(bx == st7789.X_SIZE - 1):
+                m.d.sync += [
+                    bx.eq(0),
+                    by.eq(by + 1)
+                ]
+                with m.If(by == st7789.Y_SIZE - 1):
+                    m.d.sync += [
+                        by.eq(0),
+                        clear.eq(0)
+                    ]
+        with m.Elif(draw):
+            m.d.sync += bx.eq(bx + 1)
+            with m.If(bx == box_x + self.SIZE + 1):
+                m.d.sync += [
+                    bx.eq(box_x),
+                    by.eq(by + 1)
+                ]
+                with m.If(by == box_y + self.SIZE + 1):
+                    m.d.sync += draw.eq(0)
+        with m.Else():
+            m.d.sync += timer.eq(timer + 1)
+            with m.If(timer == int(platform.default_clk_frequency // 100) - 1):
+                m.d.sync += [
+                    timer.eq(0),
+                    sq_x.eq(Mux(dx, sq_x - 1, sq_x + 1)),
+                    sq_y.eq(Mux(dy, sq_y - 1, sq_y + 1)),
+                    box_x.eq(sq_x - 1),
+                    box_y.eq(sq_y - 1),
+                    bx.eq(sq_x - 1),
+                    by.eq(sq_y - 1),
+                    draw.eq(1)
+                ]
+                with m.If(Mux(dx, sq_x == 1, sq_x == st7789.X_SIZE - self.SIZE - 1)):
+                    m.d.sync += dx.eq(~dx)
+                with m.If(Mux(dy, sq_y == 1, sq_y == st7789.Y_SIZE - self.SIZE - 1)):
+                    m.d.sync += dy.eq(~dy)
+
+        m.d.comb += [
+            Cat([i.o for i in led]).eq(Cat(dx, dy, dirty.o_valid, draw))
+        ]
+
+        return m
+
+if __name__ == "__main__":
+    variants = {
+        '12F': ULX4M_12F_Platform,
+        '45F': ULX4M_45F_Platform,
+        '85F': ULX4M_85F_Platform
+    }
+
+    # Figure out which FPGA variant we want to target...
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variant', choices=variants.keys())
+    args = parser.parse_args()
+
+    platform = variants[args.variant]()
+
+    # Add the OLED resource defined above to the platform so we
+    # can reference it below.
+    platform.add_resources(oled_resource)
+
+    platform.build(ST7789WindowTest(), do_program=True)